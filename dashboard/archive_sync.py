@@ -0,0 +1,128 @@
+"""Keeps a local copy of the S3 long term archive in step with the bucket,
+downloading only new or changed objects and compacting csv files to parquet"""
+import os
+import json
+from concurrent.futures import ThreadPoolExecutor
+import pandas as pd
+from boto3 import client
+
+ARCHIVE_FOLDER = "archive"
+CACHE_FOLDER = "archive/cache"
+MANIFEST = "archive/manifest.json"
+DOWNLOAD_WORKERS = 8
+CSV_SUFFIXES = (".csv", ".csv.gz")
+ARCHIVE_SUFFIXES = CSV_SUFFIXES + (".parquet",)
+ARCHIVE_COLUMNS = ['plant_id', 'general_name', 'scientific_name', 'cycle', 'botanist_id',
+                   'recorded', 'temperature', 'soil_moisture', 'watered', 'sunlight',
+                   'botanist_name']
+ARCHIVE_DTYPES = {'plant_id': 'Int16', 'botanist_id': 'Int16', 'temperature': 'float32',
+                  'soil_moisture': 'float32', 'general_name': 'object',
+                  'scientific_name': 'object', 'cycle': 'object', 'sunlight': 'object',
+                  'botanist_name': 'object', 'recorded': 'object', 'watered': 'object'}
+CATEGORY_COLUMNS = ['general_name', 'scientific_name', 'cycle', 'sunlight', 'botanist_name']
+
+
+def list_archive_objects(s3: client, bucket_name: str) -> dict:
+    """Returns key -> {etag, size} for every archive object, following
+    list pagination past the 1000 key page limit"""
+    objects = {}
+    paginator = s3.get_paginator("list_objects_v2")
+    for page in paginator.paginate(Bucket=bucket_name):
+        for obj in page.get("Contents", []):
+            if obj["Key"].endswith(ARCHIVE_SUFFIXES):
+                objects[obj["Key"]] = {"etag": obj["ETag"], "size": obj["Size"]}
+    return objects
+
+
+def load_manifest(path: str = MANIFEST) -> dict:
+    """Reads the manifest of objects already synced"""
+    if not os.path.exists(path):
+        return {}
+    with open(path) as file:
+        return json.load(file)
+
+
+def save_manifest(manifest: dict, path: str = MANIFEST):
+    """Writes the manifest, replacing the old one only once fully written"""
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(f"{path}.tmp", "w") as file:
+        json.dump(manifest, file, indent=2, sort_keys=True)
+    os.replace(f"{path}.tmp", path)
+
+
+def changed_keys(remote: dict, manifest: dict) -> list:
+    """Returns the keys that are new or whose ETag or size has changed"""
+    return sorted(key for key, details in remote.items() if manifest.get(key) != details)
+
+
+def local_path(key: str) -> str:
+    """Returns where a synced key is kept locally: compacted parquet for csv
+    objects, the object itself for parquet objects"""
+    if key.endswith(CSV_SUFFIXES):
+        name = key.removesuffix(".gz").removesuffix(".csv").replace("/", "_")
+        return f"{CACHE_FOLDER}/{name}.parquet"
+    return f"{ARCHIVE_FOLDER}/{key}"
+
+
+def read_archive_csv(path: str) -> pd.DataFrame:
+    """Reads an archived csv file into the typed archive columns"""
+    dataframe = pd.read_csv(path, usecols=lambda column: column in ARCHIVE_COLUMNS,
+                            dtype=ARCHIVE_DTYPES).reindex(columns=ARCHIVE_COLUMNS)
+    dataframe["recorded"] = pd.to_datetime(dataframe["recorded"], utc=True, format="ISO8601")
+    dataframe["watered"] = pd.to_datetime(dataframe["watered"], utc=True, format="ISO8601")
+    for column in CATEGORY_COLUMNS:
+        dataframe[column] = dataframe[column].astype("category")
+    return dataframe
+
+
+def sync_object(s3: client, bucket_name: str, key: str):
+    """Downloads one object, compacting csv files to parquet in the cache folder"""
+    path = local_path(key)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+
+    if not key.endswith(CSV_SUFFIXES):
+        s3.download_file(bucket_name, key, path)
+        return
+
+    suffix = ".csv.gz" if key.endswith(".gz") else ".csv"
+    download_path = f"{path}.download{suffix}"
+    s3.download_file(bucket_name, key, download_path)
+    try:
+        read_archive_csv(download_path).to_parquet(path, index=False)
+    finally:
+        os.remove(download_path)
+
+
+def sync_archive(s3: client, bucket_name: str, manifest_path: str = MANIFEST,
+                 workers: int = DOWNLOAD_WORKERS) -> list:
+    """Brings the local archive in step with the bucket and returns the keys
+    downloaded. Objects removed from the bucket are removed locally too."""
+    remote = list_archive_objects(s3, bucket_name)
+    manifest = load_manifest(manifest_path)
+    keys = changed_keys(remote, manifest)
+
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        futures = {key: executor.submit(sync_object, s3, bucket_name, key) for key in keys}
+
+    synced = []
+    for key, future in futures.items():
+        if future.exception() is not None:
+            print(f"could not sync {key}: {future.exception()}")
+            continue
+        manifest[key] = remote[key]
+        synced.append(key)
+
+    for key in set(manifest) - set(remote):
+        if os.path.exists(local_path(key)):
+            os.remove(local_path(key))
+        del manifest[key]
+
+    save_manifest(manifest, manifest_path)
+    return synced
+
+
+def list_cached_archive_files(folder: str = CACHE_FOLDER) -> list:
+    """Lists the compacted archive files in the cache folder"""
+    if not os.path.exists(folder):
+        return []
+    return [file for file in os.listdir(folder) if file.endswith(".parquet")]
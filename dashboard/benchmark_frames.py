@@ -0,0 +1,68 @@
+"""Measures the memory held by the live data frame built from plain cursor rows
+against the compact typed frame. Run with `python3 benchmark_frames.py [ROWS ...]`"""
+import sys
+import random
+from datetime import datetime, timedelta, timezone
+import pandas as pd
+from dashboard import typed_frame, LIVE_COLUMNS, LIVE_COLUMN_TYPES
+
+DEFAULT_SIZES = [10_000, 100_000, 1_000_000]
+PLANTS = 50
+SUNLIGHT_VALUES = ['full_sun', 'partial_sun', 'full_shade', 'Null']
+
+
+class RowCursor:
+    """Hands out pre-built rows the way a database cursor does"""
+
+    def __init__(self, rows: list):
+        self.rows = rows
+        self.position = 0
+
+    def fetchall(self) -> list:
+        rows = self.rows[self.position:]
+        self.position = len(self.rows)
+        return rows
+
+    def fetchmany(self, size: int) -> list:
+        rows = self.rows[self.position:self.position + size]
+        self.position += len(rows)
+        return rows
+
+
+def make_rows(count: int) -> list:
+    """Builds rows shaped like the dashboard's joined query, one per minute per plant"""
+    start = datetime(2023, 8, 1, tzinfo=timezone.utc)
+    rows = []
+    for index in range(count):
+        plant = index % PLANTS
+        recorded = start + timedelta(minutes=index // PLANTS)
+        rows.append((plant, f"Plant {plant}", f"Plantus {plant}", "Perennial", plant % 5,
+                     recorded, random.uniform(10, 15), random.uniform(0, 50),
+                     recorded - timedelta(hours=1), random.choice(SUNLIGHT_VALUES),
+                     f"Botanist {plant % 5}"))
+    return rows
+
+
+def object_frame(cur) -> pd.DataFrame:
+    """The previous loader, kept for comparison"""
+    return pd.DataFrame(cur.fetchall(), columns=LIVE_COLUMNS)
+
+
+def compact_frame(cur) -> pd.DataFrame:
+    """The current typed loader"""
+    return typed_frame(cur, LIVE_COLUMNS, LIVE_COLUMN_TYPES)
+
+
+def measure(loader, rows: list) -> float:
+    """Returns the deep memory usage in MB of the frame a loader builds"""
+    return loader(RowCursor(rows)).memory_usage(deep=True).sum() / 1e6
+
+
+if __name__ == "__main__":
+    sizes = [int(size) for size in sys.argv[1:]] or DEFAULT_SIZES
+
+    print(f"{'rows':>10} {'object MB':>10} {'typed MB':>9}")
+    for size in sizes:
+        rows = make_rows(size)
+        print(f"{size:>10} {measure(object_frame, rows):>10.1f} "
+              f"{measure(compact_frame, rows):>9.1f}")
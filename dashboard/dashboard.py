@@ -1,19 +1,57 @@
 """This module creates the dashboard for the plants"""
 import os
 from os import environ
+from contextlib import contextmanager
+from concurrent.futures import ThreadPoolExecutor
 import pandas as pd
+import pyarrow as pa
+import pyarrow.dataset as ds
 import streamlit as st
 import altair as alt
 import psycopg2
 from dotenv import load_dotenv
-import requests
 from boto3 import client
 from psycopg2.extensions import connection
-
-
-def join_all_sql_tables(conn: connection) -> pd.DataFrame:
-    """Joins all tables from SQL and returns it as a dataframe"""
-    query = """SELECT
+from psycopg2.pool import ThreadedConnectionPool
+from archive_sync import (sync_archive, list_cached_archive_files, CACHE_FOLDER,
+                          ARCHIVE_COLUMNS, CATEGORY_COLUMNS)
+from series import query_live_series, downsample, series_summary, VALUE_COLUMNS
+from plant_images import PlantImageCache, TREFLE_API_URL
+
+PARQUET_FOLDER = "archive/parquet"
+ARCHIVE_READ_WORKERS = 8
+BUCKET_NAME = "plants-vs-trainees-long-term-storage"
+LIVE_DATA_TTL = 60
+ARCHIVE_SYNC_TTL = 15 * 60
+LIVE_HOURS = 24
+SUMMARY_HOURS = 30 * 24
+TIMEFRAME_HOURS = {"Last 24h": LIVE_HOURS, "Last 30 days": SUMMARY_HOURS}
+DIMENSION_TTL = 15 * 60
+ARCHIVE_TABLE_ROWS = 1_000
+MIN_CONNECTIONS = 1
+MAX_CONNECTIONS = 8
+FETCH_BATCH_SIZE = 10_000
+LIVE_COLUMNS = ['plant_id', 'general_name', 'scientific_name', 'cycle', 'botanist_id',
+                'recorded', 'temperature', 'soil_moisture', 'watered', 'sunlight',
+                'botanist_name']
+LIVE_COLUMN_TYPES = {
+    'plant_id': pa.int16(),
+    'botanist_id': pa.int16(),
+    'recorded': pa.timestamp('us', tz='UTC'),
+    'temperature': pa.float32(),
+    'soil_moisture': pa.float32(),
+    'watered': pa.timestamp('us', tz='UTC'),
+}
+PANDAS_TYPES = {pa.int16(): pd.Int16Dtype()}
+DIMENSION_COLUMNS = ['plant_id', 'general_name', 'scientific_name', 'cycle', 'botanist_id',
+                     'botanist_name']
+HOURLY_TABLE_COLUMNS = ['plant_id', 'hour', 'readings', 'temperature_min', 'temperature_avg',
+                        'temperature_max', 'soil_moisture_min', 'soil_moisture_avg',
+                        'soil_moisture_max']
+RECORDING_COLUMNS = ['plant_id', 'recorded', 'temperature', 'soil_moisture', 'watered',
+                     'sunlight']
+
+LIVE_DATA_SQL = """SELECT
     p.id AS plant_id,
     p.general_name,
     p.scientific_name,
@@ -24,23 +62,330 @@ def join_all_sql_tables(conn: connection) -> pd.DataFrame:
     r.soil_moisture,
     r.watered,
     r.sunlight,
-    b.botanist_name 
+    b.botanist_name
     FROM
         plant p
     LEFT JOIN
         recording r ON p.id = r.plant_id
     LEFT JOIN
         botanist b ON p.botanist_id = b.id"""
-    with conn.cursor() as cur:
+
+
+@st.cache_resource
+def get_db_pool() -> ThreadedConnectionPool:
+    """Creates the connection pool shared by every session in this process"""
+    load_dotenv()
+    return ThreadedConnectionPool(
+        MIN_CONNECTIONS, MAX_CONNECTIONS,
+        host=environ["DB_HOST"],
+        dbname=environ["DB_NAME"],
+        user=environ["DB_USERNAME"],
+        password=environ["DB_PASSWORD"]
+    )
+
+
+def is_healthy(conn: connection) -> bool:
+    """Checks a connection is still open and able to run a query"""
+    if conn.closed:
+        return False
+    try:
+        with conn.cursor() as cur:
+            cur.execute("SELECT 1;")
+        conn.rollback()
+    except (psycopg2.OperationalError, psycopg2.InterfaceError):
+        return False
+    return True
+
+
+@contextmanager
+def pooled_connection():
+    """Lends a healthy pooled connection to one loader at a time, so sessions
+    never share a transaction or a named cursor. The connection is rolled
+    back before it is returned, and discarded if it broke while in use"""
+    pool = get_db_pool()
+    conn = pool.getconn()
+    if not is_healthy(conn):
+        pool.putconn(conn, close=True)
+        conn = pool.getconn()
+    try:
+        yield conn
+    except (psycopg2.OperationalError, psycopg2.InterfaceError):
+        pool.putconn(conn, close=True)
+        raise
+    except Exception:
+        if not conn.closed:
+            conn.rollback()
+        pool.putconn(conn)
+        raise
+    else:
+        conn.rollback()
+        pool.putconn(conn)
+
+
+@st.cache_resource
+def get_s3_client() -> client:
+    """Creates the S3 client shared by every session in this process"""
+    load_dotenv()
+    return client("s3", aws_access_key_id=environ["ACCESS_KEY_ID"],
+                  aws_secret_access_key=environ["SECRET_ACCESS_KEY"])
+
+
+@st.cache_resource
+def get_image_cache() -> PlantImageCache:
+    """Creates the plant image cache shared by every session in this process"""
+    load_dotenv()
+    return PlantImageCache(environ["API_TOKEN"],
+                           environ.get("TREFLE_API_URL", TREFLE_API_URL))
+
+
+@st.cache_data(ttl=DIMENSION_TTL)
+def load_dimensions() -> pd.DataFrame:
+    """Returns every plant with its botanist, re-querying at most every 15 minutes"""
+    with pooled_connection() as conn:
+        return fetch_dimensions(conn)
+
+
+@st.cache_data(ttl=LIVE_DATA_TTL)
+def load_live_data() -> pd.DataFrame:
+    """Returns the joined live tables, re-querying at most once a minute.
+    With FETCH_MODE=normalized only the recordings are re-queried, and the
+    cached plants are reloaded once a recording names a plant they lack"""
+    if environ.get("FETCH_MODE") == "normalized":
+        dimensions = load_dimensions()
+        with pooled_connection() as conn:
+            recordings = fetch_recordings(conn)
+        if has_unknown_plants(recordings, dimensions):
+            load_dimensions.clear()
+            dimensions = load_dimensions()
+        return join_recordings(recordings, dimensions)
+
+    with pooled_connection() as conn:
+        return join_all_sql_tables(conn)
+
+
+@st.cache_data(ttl=ARCHIVE_SYNC_TTL)
+def sync_archive_files() -> list:
+    """Syncs the local archive with S3 at most every 15 minutes and
+    returns the compacted archive files"""
+    download_all_files(get_s3_client(), BUCKET_NAME)
+    return list_cached_archive_files()
+
+
+@st.cache_data(ttl=LIVE_DATA_TTL)
+def load_headline_figures() -> dict:
+    """Returns the headline figures, read from the plant and botanist tables"""
+    with pooled_connection() as conn, conn.cursor() as cur:
+        cur.execute("SELECT COUNT(*) FROM plant;")
+        total_plants = cur.fetchone()[0]
+        cur.execute("""SELECT b.botanist_name
+                    FROM plant p
+                    JOIN botanist b ON p.botanist_id = b.id
+                    GROUP BY b.botanist_name
+                    ORDER BY COUNT(*) DESC, b.botanist_name
+                    LIMIT 1;""")
+        top_botanist = cur.fetchone()
+    return {"total_plants": total_plants,
+            "most_plants_botanist": top_botanist[0] if top_botanist else None}
+
+
+@st.cache_data(ttl=LIVE_DATA_TTL)
+def load_latest_readings() -> pd.DataFrame:
+    """Returns each plant's latest reading from the summary table"""
+    query = """SELECT
+    p.id AS plant_id,
+    p.general_name,
+    l.recorded,
+    l.temperature,
+    l.soil_moisture,
+    l.watered,
+    l.sunlight,
+    b.botanist_name
+    FROM
+        plant p
+    LEFT JOIN
+        plant_latest_reading l ON p.id = l.plant_id
+    LEFT JOIN
+        botanist b ON p.botanist_id = b.id
+    ORDER BY p.id"""
+    with pooled_connection() as conn, conn.cursor() as cur:
         cur.execute(query)
-        tuples_list = cur.fetchall()
-    df = pd.DataFrame(tuples_list, columns=['plant_id', 'general_name',
-                                            'scientific_name', 'cycle', 'botanist_id', "recorded",
-                                            'temperature', "soil_moisture", "watered", "sunlight", "botanist_name"])
+        rows = cur.fetchall()
+    return pd.DataFrame(rows, columns=['plant_id', 'general_name', 'recorded', 'temperature',
+                                       'soil_moisture', 'watered', 'sunlight', 'botanist_name'])
+
+
+@st.cache_data(ttl=LIVE_DATA_TTL)
+def load_hourly_readings(plant_ids: tuple, hours: int = SUMMARY_HOURS) -> pd.DataFrame:
+    """Returns the selected plants' hourly summary rows over the last hours,
+    the rows the long timeframe charts are drawn from"""
+    query = """SELECT
+    plant_id,
+    hour,
+    readings,
+    temperature_min,
+    temperature_avg,
+    temperature_max,
+    soil_moisture_min,
+    soil_moisture_avg,
+    soil_moisture_max
+    FROM recording_hourly
+    WHERE plant_id = ANY(%s) AND hour >= %s
+    ORDER BY plant_id, hour"""
+    start = pd.Timestamp.now(tz="UTC") - pd.Timedelta(hours=hours)
+    with pooled_connection() as conn, conn.cursor() as cur:
+        cur.execute(query, ([int(plant_id) for plant_id in plant_ids], start.to_pydatetime()))
+        rows = cur.fetchall()
+    return pd.DataFrame(rows, columns=HOURLY_TABLE_COLUMNS)
+
+
+@st.cache_data(ttl=LIVE_DATA_TTL)
+def load_live_series(value_column: str, plant_ids: tuple,
+                     hours: int = LIVE_HOURS) -> pd.DataFrame:
+    """Returns the bucketed chart series of a reading over the last hours,
+    from the hourly summary once the buckets are an hour or wider"""
+    end = pd.Timestamp.now(tz="UTC")
+    with pooled_connection() as conn:
+        return query_live_series(conn, value_column, plant_ids,
+                                 end - pd.Timedelta(hours=hours), end)
+
+
+@st.cache_data(ttl=ARCHIVE_SYNC_TTL)
+def load_archive_series(value_column: str, plant_ids: tuple,
+                        method: str = "bucket") -> pd.DataFrame:
+    """Returns the downsampled chart series of a reading over the whole archive,
+    reading only the selected plants' partitions and columns"""
+    columns = ['plant_id', 'recorded', value_column]
+    archive_df = load_archive_files(archive_signature(sync_archive_files()))
+    archive_df = archive_df.loc[archive_df['plant_id'].isin(plant_ids), columns]
+    parquet_df = read_parquet_archive(columns=columns, plant_ids=list(plant_ids))
+    parquet_df['plant_id'] = parquet_df['plant_id'].astype("Int64")
+    return downsample(pd.concat([archive_df, parquet_df], ignore_index=True),
+                      value_column, method=method)
+
+
+def load_chart_series(timeframe: list, plant_ids: list) -> dict:
+    """Returns the chart series of every reading for the selected plants"""
+    if not plant_ids:
+        return {}
+    if timeframe == ["All time"]:
+        method = environ.get("CHART_DOWNSAMPLE", "bucket")
+        return {column: load_archive_series(column, tuple(plant_ids), method)
+                for column in VALUE_COLUMNS}
+    hours = TIMEFRAME_HOURS[timeframe[0]]
+    return {column: load_live_series(column, tuple(plant_ids), hours)
+            for column in VALUE_COLUMNS}
+
+
+@st.cache_data(ttl=ARCHIVE_SYNC_TTL)
+def load_long_term_data(plant_ids: tuple, rows: int = ARCHIVE_TABLE_ROWS) -> pd.DataFrame:
+    """Returns the latest archived rows of each selected plant, from csv and
+    parquet exports. Only the selected plants' parquet partitions are read"""
+    archive_df = load_archive_files(archive_signature(sync_archive_files()))
+    archive_df = archive_df[archive_df['plant_id'].isin(plant_ids)]
+    parquet_df = read_parquet_archive(plant_ids=list(plant_ids))
+    parquet_df['plant_id'] = parquet_df['plant_id'].astype("Int64")
+    long_term_df = pd.concat([archive_df, parquet_df], ignore_index=True)
+    return (long_term_df.sort_values('recorded').groupby('plant_id').tail(rows)
+            .reset_index(drop=True))
+
+
+def refresh_data():
+    """Drops every cached frame and listing so the next run reloads them"""
+    load_live_data.clear()
+    load_dimensions.clear()
+    load_headline_figures.clear()
+    load_latest_readings.clear()
+    load_hourly_readings.clear()
+    load_live_series.clear()
+    load_archive_series.clear()
+    load_long_term_data.clear()
+    sync_archive_files.clear()
+    load_archive_files.clear()
+
+
+def column_array(values: tuple, arrow_type: pa.DataType) -> pa.Array:
+    """Builds one typed column, dictionary encoding repeated strings"""
+    if arrow_type is None:
+        return pa.array(values, pa.string()).dictionary_encode()
+    return pa.array(values, arrow_type)
+
+
+def typed_frame(cur, columns: list, column_types: dict,
+                batch_size: int = FETCH_BATCH_SIZE) -> pd.DataFrame:
+    """Builds a compact dataframe from a tuple cursor a batch at a time: strings
+    become categoricals, readings float32 and times datetime64, with no
+    per-row objects kept once a batch is converted"""
+    batches = []
+    while True:
+        rows = cur.fetchmany(batch_size)
+        if not rows:
+            break
+        values = list(zip(*rows))
+        batches.append(pa.record_batch(
+            [column_array(values[index], column_types.get(name))
+             for index, name in enumerate(columns)], names=columns))
+
+    if not batches:
+        batches.append(pa.record_batch(
+            [column_array((), column_types.get(name)) for name in columns], names=columns))
+    return pa.Table.from_batches(batches).to_pandas(types_mapper=PANDAS_TYPES.get)
+
+
+def join_all_sql_tables(conn: connection) -> pd.DataFrame:
+    """Joins all tables from SQL and returns it as a dataframe"""
+    with conn.cursor(name="live_data") as cur:
+        cur.itersize = FETCH_BATCH_SIZE
+        cur.execute(LIVE_DATA_SQL)
+        df = typed_frame(cur, LIVE_COLUMNS, LIVE_COLUMN_TYPES)
 
     return df
 
 
+def fetch_dimensions(conn: connection) -> pd.DataFrame:
+    """Returns the small plant and botanist tables joined into one row per plant"""
+    query = """SELECT
+    p.id AS plant_id,
+    p.general_name,
+    p.scientific_name,
+    p.cycle,
+    p.botanist_id,
+    b.botanist_name
+    FROM
+        plant p
+    LEFT JOIN
+        botanist b ON p.botanist_id = b.id"""
+    with conn.cursor() as cur:
+        cur.execute(query)
+        return typed_frame(cur, DIMENSION_COLUMNS, LIVE_COLUMN_TYPES)
+
+
+def fetch_recordings(conn: connection) -> pd.DataFrame:
+    """Returns only the narrow recording columns, keyed by plant id"""
+    query = """SELECT
+    plant_id,
+    recorded,
+    temperature,
+    soil_moisture,
+    watered,
+    sunlight
+    FROM recording"""
+    with conn.cursor(name="live_recordings") as cur:
+        cur.itersize = FETCH_BATCH_SIZE
+        cur.execute(query)
+        return typed_frame(cur, RECORDING_COLUMNS, LIVE_COLUMN_TYPES)
+
+
+def has_unknown_plants(recordings: pd.DataFrame, dimensions: pd.DataFrame) -> bool:
+    """Returns whether any recording is of a plant missing from the dimensions"""
+    return not recordings['plant_id'].isin(dimensions['plant_id']).all()
+
+
+def join_recordings(recordings: pd.DataFrame, dimensions: pd.DataFrame) -> pd.DataFrame:
+    """Joins recordings to their plant and botanist in memory, keeping plants
+    with no recordings as join_all_sql_tables does"""
+    return dimensions.merge(recordings, on='plant_id', how='left')[LIVE_COLUMNS]
+
+
 def dashboard_header():
     """Creates the header of the dashboard"""
     st.title("LMNH Plant Data Dashboard")
@@ -49,45 +394,36 @@ def dashboard_header():
                 PLEASE NOTE: changing the data in the sidebar affects all graphs.""")
 
 
-def headline_plant_figures(dataframe: pd.DataFrame):
+def headline_plant_figures(figures: dict):
     """Creates a small widget outlining some stats"""
     cols = st.columns(2)
     with cols[0]:
-        st.metric("Total number of plants", dataframe['plant_id'].nunique())
+        st.metric("Total number of plants", figures["total_plants"])
     with cols[1]:
-        botanist_plant_count = dataframe.groupby(
-            'botanist_name')['plant_id'].nunique()
-        most_plants_botanist = botanist_plant_count.idxmax()
-        st.metric("Botanist with the most plants", most_plants_botanist)
+        st.metric("Botanist with the most plants", figures["most_plants_botanist"])
 
 
 def get_image_url_of_plant(plant_name: str) -> str:
-    """Returns the image url of a given plant"""
-
-    load_dotenv()
-    config = environ
-
-    api_token = config["API_TOKEN"]
-
-    # API endpoint URL
-    url = f"https://trefle.io/api/v1/plants/search?token={api_token}&q={plant_name}"
-
-    response = requests.get(url, timeout=10)
-
-    if response.status_code == 200:
-        data = response.json()
-        plants = data.get('data', [])
-
-        if plants != []:
-            image_url = plants[0].get('image_url', None)
-
-            return image_url
-
-    return None
-
-
-def current_plant_data(df: pd.DataFrame, plant_ids: list):
-    """Displays dataframe with info for plant(s)"""
+    """Returns the cached image url of a given plant, or None while it is
+    still being looked up"""
+    return get_image_cache().get(plant_name)
+
+
+def plant_table(plant_df: pd.DataFrame, table: pd.DataFrame = None):
+    """Displays the readings behind the charts: the plants' rows, or the
+    hourly summary rows when the charts are drawn from those"""
+    if table is None:
+        st.dataframe(plant_df[['plant_id', 'recorded',
+                               'temperature', 'soil_moisture', 'watered']])
+        return
+    st.caption("Hourly summary of the selected timeframe")
+    st.dataframe(table)
+
+
+def current_plant_data(df: pd.DataFrame, plant_ids: list, series: dict,
+                       table: pd.DataFrame = None):
+    """Displays dataframe with info for plant(s). A given table is shown in
+    place of the plants' rows in df"""
     if len(plant_ids) != 0:
         plant_df = df[df['plant_id'].isin(plant_ids)]
 
@@ -115,54 +451,46 @@ def current_plant_data(df: pd.DataFrame, plant_ids: list):
                 with cols[2]:
                     st.write(f"### Sunlight type: {sunlight_type} ")
 
-            # Create a dataframe for display purposes
-            display_df = plant_df[['plant_id', 'recorded',
-                                   'temperature', 'soil_moisture', 'watered']]
+            plant_table(plant_df, table)
 
-            # Display the dataframe
-            st.dataframe(display_df)
-
-            plant_temperature_over_time(joined_df, plant_ids)
-            plant_soil_moisture_over_time(joined_df, plant_ids)
+            plant_temperature_over_time(series['temperature'])
+            plant_soil_moisture_over_time(series['soil_moisture'])
 
             plant_image = get_image_url_of_plant(plant_name)
 
             if plant_image is not None:
-                st.image(get_image_url_of_plant(plant_name), caption='')
+                st.image(plant_image, caption='')
 
         if len(plant_ids) > 1:
-            display_df = plant_df[['plant_id', 'recorded',
-                                   'temperature', 'soil_moisture', 'watered']]
-            # Display the dataframe
-            st.dataframe(display_df)
-            plant_temperature_over_time(joined_df, plant_ids)
-            plant_soil_moisture_over_time(joined_df, plant_ids)
+            plant_table(plant_df, table)
+            plant_temperature_over_time(series['temperature'])
+            plant_soil_moisture_over_time(series['soil_moisture'])
 
         else:
             st.dataframe(plant_df)
 
 
-def plant_temperature_over_time(df: pd.DataFrame, plant_ids: list):
-    """Plots the plant temperature over time as line graph"""
-    df = df[df['plant_id'].isin(plant_ids)]
-    print(df)
-    recorded_and_temperature = df[['plant_id', 'recorded', 'temperature']]
-    print("*" * 31)
-    print(recorded_and_temperature)
-
+def series_chart(series: pd.DataFrame, label: str) -> alt.Chart:
+    """Plots the mean of each bucket as a line over a band from its min to max"""
     padding = 0.8
-    min_temperature = recorded_and_temperature['temperature'].min()
-    max_temperature = recorded_and_temperature['temperature'].max()
-    average_temperature = recorded_and_temperature['temperature'].mean()
-    y_range = max_temperature - min_temperature
-    padded_min = min_temperature - padding * y_range
-    padded_max = max_temperature + padding * y_range
-
-    chart = alt.Chart(recorded_and_temperature).mark_line().encode(
-        x='recorded:T',
-        y=alt.Y('temperature:Q', scale=alt.Scale(
-            domain=[padded_min, padded_max])),
-        color='plant_id:N').interactive()
+    min_value, _, max_value = series_summary(series)
+    y_range = max_value - min_value
+    scale = alt.Scale(zero=False)
+    if not series.empty:
+        scale = alt.Scale(domain=[min_value - padding * y_range, max_value + padding * y_range])
+
+    base = alt.Chart(series).encode(x=alt.X('recorded:T', title='recorded'),
+                                    color='plant_id:N')
+    band = base.mark_area(opacity=0.2).encode(
+        y=alt.Y('min:Q', scale=scale, title=label), y2='max:Q')
+    line = base.mark_line().encode(y=alt.Y('mean:Q', scale=scale, title=label))
+    return (band + line).interactive()
+
+
+def plant_temperature_over_time(series: pd.DataFrame):
+    """Plots the plant temperature over time as line graph"""
+    min_temperature, average_temperature, max_temperature = series_summary(series)
+    chart = series_chart(series, 'temperature')
 
     st.markdown("<br>", unsafe_allow_html=True)
 
@@ -180,25 +508,10 @@ def plant_temperature_over_time(df: pd.DataFrame, plant_ids: list):
     st.altair_chart(chart, use_container_width=True)
 
 
-def plant_soil_moisture_over_time(df: pd.DataFrame, plant_ids: list):
+def plant_soil_moisture_over_time(series: pd.DataFrame):
     """Plots the soil moisture over time as line graph"""
-    df = df[df['plant_id'].isin(plant_ids)]
-    recorded_and_moisture = df[['plant_id', 'recorded', 'soil_moisture']]
-    print(recorded_and_moisture)
-
-    padding = 0.8
-    min_moisture = recorded_and_moisture['soil_moisture'].min()
-    max_moisture = recorded_and_moisture['soil_moisture'].max()
-    average_moisture = recorded_and_moisture['soil_moisture'].mean()
-    y_range = max_moisture - min_moisture
-    padded_min = min_moisture - padding * y_range
-    padded_max = max_moisture + padding * y_range
-
-    chart = alt.Chart(recorded_and_moisture).mark_line().encode(
-        x='recorded:T',
-        y=alt.Y('soil_moisture:Q', scale=alt.Scale(
-            domain=[padded_min, padded_max])),
-        color='plant_id:N').interactive()
+    min_moisture, average_moisture, max_moisture = series_summary(series)
+    chart = series_chart(series, 'soil_moisture')
 
     st.markdown("<br>", unsafe_allow_html=True)
 
@@ -216,84 +529,91 @@ def plant_soil_moisture_over_time(df: pd.DataFrame, plant_ids: list):
     st.altair_chart(chart, use_container_width=True)
 
 
-def list_all_csv_files_in_bucket(s3: client, bucket_name: str) -> list:
-    """Lists all the csv files within an S3 bucket"""
-    return [obj["Key"]for obj in s3.list_objects(Bucket=bucket_name)["Contents"]
-            if obj["Key"].endswith(".csv")]
+def download_all_files(s3: client, bucket_name: str):
+    """Downloads all the new or changed files within a bucket"""
+    sync_archive(s3, bucket_name)
 
 
-def download_all_files(s3: client, bucket_name: str):
-    """Downloads all the files within a bucket"""
-    for csv in list_all_csv_files_in_bucket(s3, bucket_name):
-        if not os.path.exists("archive"):
-            os.mkdir("archive")
-        if not os.path.exists(f"archive/{csv}"):
-            s3.download_file(bucket_name, csv, f"archive/{csv}")
+def read_parquet_archive(path: str = PARQUET_FOLDER, columns: list = None,
+                         plant_ids: list = None) -> pd.DataFrame:
+    """Reads the date=/plant_id= partitioned parquet archive. Partitions of
+    other plants are skipped and only the given columns are read"""
+    columns = columns or ARCHIVE_COLUMNS
+    if not os.path.exists(path):
+        return pd.DataFrame(columns=columns)
 
+    dataset = ds.dataset(path, format="parquet", partitioning="hive")
+    if not dataset.files:
+        return pd.DataFrame(columns=columns)
+    condition = ds.field("plant_id").isin(list(plant_ids)) if plant_ids else None
+    return dataset.to_table(columns=columns, filter=condition).to_pandas()
 
-def combine_archive_data(long_term_df: pd.DataFrame, list_of_files: list) -> pd.DataFrame:
-    """Combines all the archival data from the csv files to a dataframe"""
-    if list_of_files:
-        for file in list_of_files:
-            long_term_df = (
-                long_term_df
-                ._append(pd.read_csv(f"archive/{file}"), ignore_index=True)
-                .filter(['plant_id', 'general_name', 'scientific_name', 'cycle', 'botanist_id',
-                        'recorded', 'temperature', 'soil_moisture', 'watered', 'sunlight',
-                         'botanist_name']))
 
-    return long_term_df
+def read_archive_file(file: str) -> pd.DataFrame:
+    """Reads one compacted archive file"""
+    return pd.read_parquet(f"{CACHE_FOLDER}/{file}")
 
 
-if __name__ == "__main__":
-    load_dotenv()
-    config = environ
+def archive_signature(list_of_files: list) -> tuple:
+    """Identifies a set of archive files by name, modification time and size,
+    so the combined frame is rebuilt only when a file changes"""
+    signature = []
+    for file in sorted(list_of_files):
+        stats = os.stat(f"{CACHE_FOLDER}/{file}")
+        signature.append((file, stats.st_mtime, stats.st_size))
+    return tuple(signature)
 
-    conn = psycopg2.connect(
-        host=config["DB_HOST"],
-        dbname=config["DB_NAME"],
-        user=config["DB_USERNAME"],
-        password=config["DB_PASSWORD"]
-    )
 
-    s3 = client("s3", aws_access_key_id=config["ACCESS_KEY_ID"],
-                aws_secret_access_key=config["SECRET_ACCESS_KEY"])
+@st.cache_data(max_entries=1)
+def load_archive_files(signature: tuple) -> pd.DataFrame:
+    """Reads the archive files in parallel and concatenates them once"""
+    files = [file for file, _, _ in signature]
+    with ThreadPoolExecutor(max_workers=ARCHIVE_READ_WORKERS) as executor:
+        frames = list(executor.map(read_archive_file, files))
+    if not frames:
+        return pd.DataFrame(columns=ARCHIVE_COLUMNS)
 
-    long_term_df = pd.DataFrame()
+    archive_df = pd.concat(frames, ignore_index=True).reindex(columns=ARCHIVE_COLUMNS)
+    for column in CATEGORY_COLUMNS:
+        archive_df[column] = archive_df[column].astype("category")
 
-    print(list_all_csv_files_in_bucket(
-        s3, "plants-vs-trainees-long-term-storage"))
+    return archive_df
 
-    download_all_files(s3, "plants-vs-trainees-long-term-storage")
 
-    long_term_df = combine_archive_data(long_term_df, os.listdir("archive"))
+if __name__ == "__main__":
+    if st.sidebar.button("Refresh data"):
+        refresh_data()
 
-    joined_df = join_all_sql_tables(conn)
+    joined_df = load_live_data()
+    get_image_cache().prefetch(joined_df["general_name"].unique())
 
-    selected_plant = st.sidebar.multiselect(
-        "Plant ID", options=set(joined_df["plant_id"]))
+    plant_options = sorted(joined_df["plant_id"].dropna().astype(int).unique().tolist())
+    selected_plant = st.sidebar.multiselect("Plant ID", options=plant_options)
 
     selected_timeframe = st.sidebar.multiselect(
-        "Time Scale", options=["Last 24h", "All time"])
+        "Time Scale", options=[*TIMEFRAME_HOURS, "All time"])
 
     dashboard_header()
 
     if (selected_plant and selected_timeframe) == []:
-        headline_plant_figures(joined_df)
-        st.dataframe(joined_df)
-
-    print(joined_df)
-
-    print(selected_timeframe)
-    if selected_timeframe == ["Last 24h"]:
-        current_plant_data(joined_df, selected_plant)
+        headline_plant_figures(load_headline_figures())
+        st.dataframe(load_latest_readings())
+
+    if len(selected_timeframe) == 1 and selected_timeframe[0] in TIMEFRAME_HOURS:
+        hours = TIMEFRAME_HOURS[selected_timeframe[0]]
+        hourly_table = None
+        if hours > LIVE_HOURS and selected_plant:
+            hourly_table = load_hourly_readings(tuple(selected_plant), hours)
+        current_plant_data(joined_df, selected_plant,
+                           load_chart_series(selected_timeframe, selected_plant),
+                           hourly_table)
 
     if selected_timeframe == ["All time"]:
-        current_plant_data(long_term_df, selected_plant)
-
-    print("-----")
-    print(long_term_df)
-
-    joined_df.to_csv("debug.csv")
-
-    long_term_df.to_csv("longterm.csv")
+        long_term_df = load_long_term_data(tuple(selected_plant))
+        current_plant_data(long_term_df, selected_plant,
+                           load_chart_series(selected_timeframe, selected_plant))
+        if environ.get("DASHBOARD_DEBUG_DUMP"):
+            long_term_df.to_csv("longterm.csv")
+
+    if environ.get("DASHBOARD_DEBUG_DUMP"):
+        joined_df.to_csv("debug.csv")
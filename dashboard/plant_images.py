@@ -0,0 +1,106 @@
+"""Caches the trefle.io image url of each plant on disk, so plant views never
+wait on the API. Lookups are made in the background and plants without an
+image are remembered too, for a shorter time."""
+import os
+import json
+import time
+from threading import Lock
+from concurrent.futures import ThreadPoolExecutor
+import requests
+
+TREFLE_API_URL = "https://trefle.io/api/v1"
+IMAGE_CACHE = "cache/plant_images.json"
+IMAGE_TTL = 7 * 24 * 60 * 60
+MISSING_IMAGE_TTL = 24 * 60 * 60
+PREFETCH_WORKERS = 8
+REQUEST_TIMEOUT = 10
+
+
+def fetch_image_url(session: requests.Session, api_url: str, api_token: str,
+                    plant_name: str) -> str:
+    """Searches the API for a plant and returns its image url, or None if it has
+    none. Raises for responses that say nothing about the plant, e.g. rate limits."""
+    response = session.get(f"{api_url}/plants/search",
+                           params={"token": api_token, "q": plant_name},
+                           timeout=REQUEST_TIMEOUT)
+    if response.status_code == 404:
+        return None
+    response.raise_for_status()
+
+    plants = response.json().get('data', [])
+    if plants != []:
+        return plants[0].get('image_url', None)
+    return None
+
+
+class PlantImageCache:
+    """Plant name -> image url, persisted to a json file and filled in the background"""
+
+    def __init__(self, api_token: str, api_url: str = TREFLE_API_URL,
+                 path: str = IMAGE_CACHE, workers: int = PREFETCH_WORKERS):
+        self.api_token = api_token
+        self.api_url = api_url.rstrip("/")
+        self.path = path
+        self.session = requests.Session()
+        self.executor = ThreadPoolExecutor(max_workers=workers)
+        self.lock = Lock()
+        self.pending = set()
+        self.entries = self.load()
+
+    def load(self) -> dict:
+        """Reads the cache file"""
+        if not os.path.exists(self.path):
+            return {}
+        with open(self.path) as file:
+            return json.load(file)
+
+    def save(self):
+        """Writes the cache file, replacing the old one only once fully written"""
+        if os.path.dirname(self.path):
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        with self.lock:
+            with open(f"{self.path}.tmp", "w") as file:
+                json.dump(self.entries, file, indent=2, sort_keys=True)
+            os.replace(f"{self.path}.tmp", self.path)
+
+    def is_fresh(self, plant_name: str, now: float = None) -> bool:
+        """Checks a plant has a cached answer that has not expired"""
+        entry = self.entries.get(plant_name)
+        if entry is None:
+            return False
+        ttl = IMAGE_TTL if entry["url"] is not None else MISSING_IMAGE_TTL
+        return (now or time.time()) - entry["fetched_at"] < ttl
+
+    def get(self, plant_name: str) -> str:
+        """Returns the cached image url without waiting on the API, scheduling
+        a lookup when the plant is missing or stale"""
+        if not self.is_fresh(plant_name):
+            self.prefetch([plant_name])
+        entry = self.entries.get(plant_name)
+        return entry["url"] if entry is not None else None
+
+    def lookup(self, plant_name: str):
+        """Fetches and stores one plant's image url. Failed requests are not
+        cached, so the plant is tried again on the next prefetch."""
+        try:
+            url = fetch_image_url(self.session, self.api_url, self.api_token, plant_name)
+        except (requests.RequestException, ValueError) as err:
+            print(f"could not look up image for {plant_name}: {err}")
+            with self.lock:
+                self.pending.discard(plant_name)
+            return
+
+        with self.lock:
+            self.entries[plant_name] = {"url": url, "fetched_at": time.time()}
+            self.pending.discard(plant_name)
+        self.save()
+
+    def prefetch(self, plant_names) -> list:
+        """Looks up every missing or stale plant concurrently in the background"""
+        now = time.time()
+        with self.lock:
+            names = [name for name in set(plant_names)
+                     if isinstance(name, str) and name not in self.pending
+                     and not self.is_fresh(name, now)]
+            self.pending.update(names)
+        return [self.executor.submit(self.lookup, name) for name in names]
@@ -0,0 +1,169 @@
+"""Builds the bounded time series drawn by the dashboard charts. Readings are
+filtered to the selected plants and time range before they leave the database
+or archive, then reduced to at most a chart's width of points per plant.
+Ranges charted in buckets of an hour or more are read from the hourly summary
+table the pipeline keeps, instead of from every recording"""
+import math
+import numpy as np
+import pandas as pd
+from psycopg2.extensions import connection
+
+CHART_POINTS = 600
+MIN_BUCKET_SECONDS = 60
+HOUR_SECONDS = 60 * 60
+SERIES_COLUMNS = ['plant_id', 'recorded', 'readings', 'min', 'mean', 'max']
+VALUE_COLUMNS = ('temperature', 'soil_moisture')
+
+LIVE_SERIES_SQL = """SELECT
+    plant_id,
+    to_timestamp(floor(extract(epoch FROM recorded) / %(bucket)s) * %(bucket)s) AS recorded,
+    COUNT({value_column}) AS readings,
+    MIN({value_column}) AS min,
+    AVG({value_column}) AS mean,
+    MAX({value_column}) AS max
+    FROM recording
+    WHERE plant_id = ANY(%(plant_ids)s)
+    AND recorded >= %(start)s AND recorded < %(end)s
+    GROUP BY 1, 2
+    ORDER BY 1, 2;"""
+
+HOURLY_SERIES_SQL = """SELECT
+    plant_id,
+    to_timestamp(floor(extract(epoch FROM hour) / %(bucket)s) * %(bucket)s) AS recorded,
+    SUM(readings) AS readings,
+    MIN({value_column}_min) AS min,
+    SUM({value_column}_avg * readings) / SUM(readings) AS mean,
+    MAX({value_column}_max) AS max
+    FROM recording_hourly
+    WHERE plant_id = ANY(%(plant_ids)s)
+    AND hour >= %(start)s AND hour < %(end)s
+    GROUP BY 1, 2
+    ORDER BY 1, 2;"""
+
+
+def bucket_seconds(start: pd.Timestamp, end: pd.Timestamp, points: int = CHART_POINTS) -> int:
+    """Returns the bucket width that fits the range into the given number of points,
+    never finer than the one minute between readings"""
+    span = (pd.Timestamp(end) - pd.Timestamp(start)).total_seconds()
+    return max(MIN_BUCKET_SECONDS, math.ceil(span / points))
+
+
+def query_live_series(conn: connection, value_column: str, plant_ids: list,
+                      start: pd.Timestamp, end: pd.Timestamp,
+                      points: int = CHART_POINTS) -> pd.DataFrame:
+    """Returns min/mean/max of a reading per plant and time bucket, aggregated by
+    the database so only the bucketed rows are transferred"""
+    if value_column not in VALUE_COLUMNS:
+        raise ValueError(f"Cannot chart column {value_column}")
+
+    bucket = bucket_seconds(start, end, points)
+    if bucket >= HOUR_SECONDS:
+        return query_hourly_series(conn, value_column, plant_ids, start, end, bucket)
+
+    query = LIVE_SERIES_SQL.format(value_column=value_column)
+    params = {"bucket": bucket, "plant_ids": [int(plant_id) for plant_id in plant_ids],
+              "start": start, "end": end}
+    return fetch_series(conn, query, params)
+
+
+def query_hourly_series(conn: connection, value_column: str, plant_ids: list,
+                        start: pd.Timestamp, end: pd.Timestamp,
+                        bucket: int) -> pd.DataFrame:
+    """Returns the same series as query_live_series from the recording_hourly
+    summary, in buckets of whole hours. Hour means are weighted by their readings."""
+    if value_column not in VALUE_COLUMNS:
+        raise ValueError(f"Cannot chart column {value_column}")
+
+    query = HOURLY_SERIES_SQL.format(value_column=value_column)
+    params = {"bucket": math.ceil(bucket / HOUR_SECONDS) * HOUR_SECONDS,
+              "plant_ids": [int(plant_id) for plant_id in plant_ids],
+              "start": pd.Timestamp(start).floor("h"), "end": end}
+    return fetch_series(conn, query, params)
+
+
+def fetch_series(conn: connection, query: str, params: dict) -> pd.DataFrame:
+    """Runs a series query and returns its rows in the series columns"""
+    with conn.cursor() as cur:
+        cur.execute(query, params)
+        rows = cur.fetchall()
+
+    series = pd.DataFrame(rows, columns=SERIES_COLUMNS)
+    series[['min', 'mean', 'max']] = series[['min', 'mean', 'max']].astype("float64")
+    return series
+
+
+def bucket_series(df: pd.DataFrame, value_column: str,
+                  points: int = CHART_POINTS) -> pd.DataFrame:
+    """Returns min/mean/max of a reading per plant and time bucket from raw readings"""
+    df = df[['plant_id', 'recorded', value_column]].dropna()
+    if df.empty:
+        return pd.DataFrame(columns=SERIES_COLUMNS)
+
+    # Buckets are counted from the first reading so the range fits in `points`.
+    start = df['recorded'].min()
+    width = pd.Timedelta(seconds=bucket_seconds(start, df['recorded'].max(), points))
+    offsets = ((df['recorded'] - start) // width).clip(upper=max(points - 1, 0))
+    buckets = (start + offsets * width).rename('recorded')
+    series = df.groupby([df['plant_id'], buckets], observed=True)[value_column].agg(
+        ['count', 'min', 'mean', 'max'])
+    return series.rename(columns={'count': 'readings'}).reset_index()[SERIES_COLUMNS]
+
+
+def lttb(x: np.ndarray, y: np.ndarray, points: int) -> np.ndarray:
+    """Returns the indices kept by Largest-Triangle-Three-Buckets downsampling,
+    which keeps the points that most change the shape of the line"""
+    length = len(x)
+    if points >= length or points < 3:
+        return np.arange(length)
+
+    every = (length - 2) / (points - 2)
+    kept = np.empty(points, dtype=int)
+    kept[0], kept[-1] = 0, length - 1
+    previous = 0
+    for bucket in range(points - 2):
+        start = int(bucket * every) + 1
+        end = int((bucket + 1) * every) + 1
+        next_end = min(int((bucket + 2) * every) + 1, length)
+        average_x = x[end:next_end].mean()
+        average_y = y[end:next_end].mean()
+
+        areas = np.abs((x[previous] - average_x) * (y[start:end] - y[previous])
+                       - (x[previous] - x[start:end]) * (average_y - y[previous]))
+        previous = start + int(areas.argmax())
+        kept[bucket + 1] = previous
+    return kept
+
+
+def lttb_series(df: pd.DataFrame, value_column: str,
+                points: int = CHART_POINTS) -> pd.DataFrame:
+    """Returns the LTTB selected readings of each plant in the series columns.
+    Summary figures taken from this are of the kept points only."""
+    frames = []
+    df = df[['plant_id', 'recorded', value_column]].dropna()
+    for plant_id, plant_df in df.groupby('plant_id', observed=True):
+        plant_df = plant_df.sort_values('recorded')
+        x = plant_df['recorded'].to_numpy(dtype="datetime64[ns]").astype("int64") / 1e9
+        y = plant_df[value_column].to_numpy(dtype="float64")
+        kept = plant_df.iloc[lttb(x, y, points)]
+        frames.append(pd.DataFrame({'plant_id': plant_id, 'recorded': kept['recorded'],
+                                    'readings': 1, 'min': kept[value_column],
+                                    'mean': kept[value_column], 'max': kept[value_column]}))
+    if not frames:
+        return pd.DataFrame(columns=SERIES_COLUMNS)
+    return pd.concat(frames, ignore_index=True)[SERIES_COLUMNS]
+
+
+def downsample(df: pd.DataFrame, value_column: str, points: int = CHART_POINTS,
+               method: str = "bucket") -> pd.DataFrame:
+    """Reduces raw readings to a chart's worth of points per plant"""
+    if method == "lttb":
+        return lttb_series(df, value_column, points)
+    return bucket_series(df, value_column, points)
+
+
+def series_summary(series: pd.DataFrame) -> tuple:
+    """Returns the minimum, mean and maximum over a whole series"""
+    if series.empty:
+        return math.nan, math.nan, math.nan
+    mean = (series['mean'] * series['readings']).sum() / series['readings'].sum()
+    return series['min'].min(), mean, series['max'].max()
@@ -0,0 +1,69 @@
+# pylint: skip-file
+import io
+
+import boto3
+import pandas as pd
+import pytest
+from moto import mock_aws
+
+from archive_sync import (list_archive_objects, sync_archive, local_path,
+                          list_cached_archive_files)
+
+BUCKET = "archive-test"
+CSV = ("plant_id,general_name,recorded,temperature,soil_moisture,watered,sunlight\n"
+       "1,Rose,2023-08-29 13:00:00+00:00,12.5,30.0,2023-08-29 09:00:00+00:00,full_sun\n")
+
+
+@pytest.fixture
+def s3(monkeypatch, tmp_path):
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setenv("AWS_ACCESS_KEY_ID", "testing")
+    monkeypatch.setenv("AWS_SECRET_ACCESS_KEY", "testing")
+    with mock_aws():
+        s3 = boto3.client("s3", region_name="us-east-1")
+        s3.create_bucket(Bucket=BUCKET)
+        yield s3
+
+
+def test_list_archive_objects_follows_pagination(s3):
+    for number in range(1005):
+        s3.put_object(Bucket=BUCKET, Key=f"plant_{number:04d}_data.csv", Body=b"")
+    s3.put_object(Bucket=BUCKET, Key="notes.txt", Body=b"")
+
+    objects = list_archive_objects(s3, BUCKET)
+
+    assert len(objects) == 1005
+    assert "notes.txt" not in objects
+    assert objects["plant_1004_data.csv"]["size"] == 0
+
+
+def test_sync_archive_compacts_csv_and_skips_unchanged(s3):
+    parquet = io.BytesIO()
+    pd.DataFrame({"temperature": [12.5]}).to_parquet(parquet)
+    s3.put_object(Bucket=BUCKET, Key="plant_2023-08-29_data.csv", Body=CSV.encode())
+    s3.put_object(Bucket=BUCKET, Key="parquet/date=2023-08-29/plant_id=1/part-run.parquet",
+                  Body=parquet.getvalue())
+
+    first = sync_archive(s3, BUCKET)
+    second = sync_archive(s3, BUCKET)
+
+    compacted = pd.read_parquet(local_path("plant_2023-08-29_data.csv"))
+    assert len(first) == 2
+    assert second == []
+    assert list_cached_archive_files() == ["plant_2023-08-29_data.parquet"]
+    assert str(compacted["plant_id"].dtype) == "Int16"
+    assert str(compacted["recorded"].dtype) == "datetime64[ns, UTC]"
+
+
+def test_sync_archive_refetches_changed_and_removes_deleted(s3):
+    s3.put_object(Bucket=BUCKET, Key="plant_a_data.csv", Body=CSV.encode())
+    s3.put_object(Bucket=BUCKET, Key="plant_b_data.csv", Body=CSV.encode())
+    sync_archive(s3, BUCKET)
+
+    s3.put_object(Bucket=BUCKET, Key="plant_a_data.csv", Body=(CSV + CSV.splitlines()[1]).encode())
+    s3.delete_object(Bucket=BUCKET, Key="plant_b_data.csv")
+    synced = sync_archive(s3, BUCKET)
+
+    assert synced == ["plant_a_data.csv"]
+    assert list_cached_archive_files() == ["plant_a_data.parquet"]
+    assert len(pd.read_parquet(local_path("plant_a_data.csv"))) == 2
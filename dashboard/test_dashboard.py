@@ -0,0 +1,186 @@
+# pylint: skip-file
+"""Unit tests for the dashboard's live data loading. The fetch mode comparison
+also runs against a local Postgres given by TEST_DATABASE_URL, e.g.
+    TEST_DATABASE_URL=postgresql://postgres@localhost/postgres pytest test_dashboard.py"""
+import os
+from contextlib import nullcontext
+from datetime import datetime, timezone
+from unittest.mock import MagicMock, patch
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+import pytest
+import psycopg2
+
+import dashboard
+from dashboard import (join_all_sql_tables, fetch_dimensions, fetch_recordings,
+                       join_recordings, has_unknown_plants, read_parquet_archive,
+                       LIVE_COLUMNS)
+
+DATABASE_URL = os.environ.get("TEST_DATABASE_URL")
+SCHEMA = "dashboard_test"
+RECORDED = pd.Timestamp("2023-08-29 13:30", tz="UTC")
+
+
+def make_dimensions(plant_ids: list) -> pd.DataFrame:
+    return pd.DataFrame({"plant_id": pd.array(plant_ids, dtype="Int16"),
+                         "general_name": [f"Plant {plant_id}" for plant_id in plant_ids],
+                         "scientific_name": None, "cycle": None,
+                         "botanist_id": pd.array([1] * len(plant_ids), dtype="Int16"),
+                         "botanist_name": "Ada"})
+
+
+def make_recordings(plant_ids: list) -> pd.DataFrame:
+    return pd.DataFrame({"plant_id": pd.array(plant_ids, dtype="Int16"),
+                         "recorded": RECORDED, "temperature": 12.0, "soil_moisture": 30.0,
+                         "watered": RECORDED, "sunlight": "full_sun"})
+
+
+def plain(df: pd.DataFrame) -> pd.DataFrame:
+    """Returns a frame with categoricals as objects, sorted by plant and time,
+    so frames built from differently ordered rows compare equal"""
+    df = df.astype({column: object for column in df.select_dtypes("category")})
+    return df.sort_values(["plant_id", "recorded"], ignore_index=True)
+
+
+def load_live_data() -> pd.DataFrame:
+    """Calls load_live_data past its cache"""
+    dashboard.load_live_data.clear()
+    return dashboard.load_live_data()
+
+
+def test_join_recordings_keeps_plants_without_recordings():
+    live = join_recordings(make_recordings([1, 1]), make_dimensions([1, 2]))
+
+    assert list(live.columns) == LIVE_COLUMNS
+    assert live["plant_id"].tolist() == [1, 1, 2]
+    assert live["recorded"].isna().tolist() == [False, False, True]
+
+
+def test_has_unknown_plants():
+    assert not has_unknown_plants(make_recordings([1, 2]), make_dimensions([1, 2, 3]))
+    assert has_unknown_plants(make_recordings([1, 4]), make_dimensions([1, 2, 3]))
+
+
+@patch.dict(os.environ, {"FETCH_MODE": "normalized"})
+@patch("dashboard.pooled_connection", return_value=nullcontext())
+@patch("dashboard.fetch_recordings", return_value=make_recordings([1, 4]))
+@patch("dashboard.load_dimensions")
+def test_load_live_data_reloads_dimensions_for_a_new_plant(mock_dimensions, mock_recordings,
+                                                            mock_connection):
+    mock_dimensions.side_effect = [make_dimensions([1]), make_dimensions([1, 4])]
+
+    live = load_live_data()
+
+    mock_dimensions.clear.assert_called_once()
+    assert live["plant_id"].tolist() == [1, 4]
+    assert live["general_name"].tolist() == ["Plant 1", "Plant 4"]
+
+
+@patch.dict(os.environ, {"FETCH_MODE": "normalized"})
+@patch("dashboard.pooled_connection", return_value=nullcontext())
+@patch("dashboard.fetch_recordings", return_value=make_recordings([1]))
+@patch("dashboard.load_dimensions", return_value=make_dimensions([1, 2]))
+def test_load_live_data_keeps_cached_dimensions(mock_dimensions, mock_recordings,
+                                                mock_connection):
+    load_live_data()
+
+    mock_dimensions.clear.assert_not_called()
+    assert mock_dimensions.call_count == 1
+
+
+def test_load_hourly_readings_reads_selected_plants_summary():
+    conn = MagicMock()
+    cur = conn.cursor().__enter__()
+    cur.fetchall.return_value = [(1, RECORDED, 60, 10.0, 11.0, 12.0, 20.0, 25.0, 30.0)]
+    dashboard.load_hourly_readings.clear()
+
+    with patch("dashboard.pooled_connection", return_value=nullcontext(conn)):
+        hourly = dashboard.load_hourly_readings((np.int16(1),), hours=24)
+
+    sql, (plant_ids, start) = cur.execute.call_args[0]
+    assert "FROM recording_hourly" in sql
+    assert plant_ids == [1] and type(plant_ids[0]) is int
+    assert pd.Timestamp(start) == pytest.approx(pd.Timestamp.now(tz="UTC") - pd.Timedelta(hours=24),
+                                                abs=pd.Timedelta(minutes=1))
+    assert hourly.columns[1] == "hour"
+    assert hourly["temperature_avg"].tolist() == [11.0]
+
+
+def write_archive_part(path, day: str, plant_id: int):
+    """Writes one partition file laid out as the lambda's parquet export"""
+    folder = path / f"date={day}" / f"plant_id={plant_id}"
+    folder.mkdir(parents=True)
+    recorded = pd.Timestamp(day, tz="UTC")
+    pq.write_table(pa.table({"general_name": [f"Plant {plant_id}"], "recorded": [recorded],
+                             "temperature": [12.0], "soil_moisture": [30.0]}),
+                   folder / "part-run.parquet")
+
+
+def test_read_parquet_archive_reads_only_selected_plants(tmp_path):
+    for plant_id in (1, 2):
+        write_archive_part(tmp_path, "2023-08-01", plant_id)
+        write_archive_part(tmp_path, "2023-08-02", plant_id)
+
+    archive = read_parquet_archive(tmp_path, columns=["plant_id", "recorded", "temperature"],
+                                   plant_ids=[2])
+
+    assert list(archive.columns) == ["plant_id", "recorded", "temperature"]
+    assert archive["plant_id"].tolist() == [2, 2]
+
+
+@pytest.mark.parametrize("create", [True, False], ids=["empty", "missing"])
+def test_read_parquet_archive_without_files_is_empty(tmp_path, create):
+    path = tmp_path / "parquet"
+    if create:
+        path.mkdir()
+
+    archive = read_parquet_archive(path, columns=["plant_id", "temperature"])
+
+    assert archive.empty
+    assert list(archive.columns) == ["plant_id", "temperature"]
+
+
+@pytest.fixture
+def conn():
+    if DATABASE_URL is None:
+        pytest.skip("TEST_DATABASE_URL is not set")
+
+    conn = psycopg2.connect(DATABASE_URL, options=f"-c search_path={SCHEMA}")
+    schema_path = os.path.join(os.path.dirname(__file__), "..", "pipeline", "create_tables.sql")
+    with open(schema_path) as file:
+        schema_sql = file.read().split("\\c plant_monitor;", 1)[1]
+    now = datetime.now(timezone.utc)
+    with conn.cursor() as cur:
+        cur.execute(f"DROP SCHEMA IF EXISTS {SCHEMA} CASCADE;")
+        cur.execute(f"CREATE SCHEMA {SCHEMA};")
+        cur.execute(schema_sql)
+        cur.execute("""INSERT INTO botanist (botanist_name, email, phone)
+                    VALUES ('Ada', 'ada@lnhm.co.uk', '01'), ('Grace', 'grace@lnhm.co.uk', '02');""")
+        cur.execute("""INSERT INTO plant (plant_id, general_name, scientific_name, cycle, botanist_id)
+                    VALUES (1, 'Rose', 'Rosa', 'Perennial', 1), (2, 'Fern', NULL, NULL, 2),
+                        (3, 'Cactus', 'Cactaceae', 'Perennial', 1);""")
+        cur.execute("""INSERT INTO recording (recorded, plant_id, temperature, soil_moisture, watered, sunlight)
+                    SELECT %s - minutes * interval '1 minute', plant.id, 10 + minutes, 30,
+                        %s - interval '1 day', 'full_sun'
+                    FROM plant CROSS JOIN generate_series(0, 9) AS minutes
+                    WHERE plant.id < 3;""", (now, now))
+    conn.commit()
+
+    yield conn
+
+    conn.rollback()
+    with conn.cursor() as cur:
+        cur.execute(f"DROP SCHEMA IF EXISTS {SCHEMA} CASCADE;")
+    conn.commit()
+    conn.close()
+
+
+def test_fetch_modes_give_the_same_frame_from_postgres(conn):
+    joined = join_all_sql_tables(conn)
+    conn.commit()
+    normalized = join_recordings(fetch_recordings(conn), fetch_dimensions(conn))
+
+    assert len(joined) == 21
+    pd.testing.assert_frame_equal(plain(normalized), plain(joined))
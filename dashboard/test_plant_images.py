@@ -0,0 +1,104 @@
+# pylint: skip-file
+import json
+import threading
+from collections import Counter
+from concurrent.futures import wait
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse, parse_qs
+
+import pytest
+import requests
+
+from plant_images import (fetch_image_url, PlantImageCache, IMAGE_TTL, MISSING_IMAGE_TTL)
+
+
+class StubTrefleHandler(BaseHTTPRequestHandler):
+    """Serves /plants/search like trefle.io: Rose has an image, Bare has none,
+    Unknown is not found and Limited is rate limited"""
+    requests = Counter()
+
+    def do_GET(self):
+        query = parse_qs(urlparse(self.path).query)
+        name = query["q"][0]
+        StubTrefleHandler.requests[name] += 1
+        if name == "Limited":
+            self.send_response(429)
+            body = {"error": "too many requests"}
+        elif name == "Unknown":
+            self.send_response(404)
+            body = {"error": "not found"}
+        elif name == "Bare":
+            self.send_response(200)
+            body = {"data": [{"common_name": "Bare", "image_url": None}]}
+        else:
+            self.send_response(200)
+            body = {"data": [{"common_name": name,
+                              "image_url": f"https://images.test/{name}.jpg"}]}
+        self.send_header("Content-Type", "application/json")
+        self.end_headers()
+        self.wfile.write(json.dumps(body).encode())
+
+    def log_message(self, format, *args):
+        pass
+
+
+@pytest.fixture
+def stub_api():
+    StubTrefleHandler.requests = Counter()
+    server = ThreadingHTTPServer(("127.0.0.1", 0), StubTrefleHandler)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield f"http://127.0.0.1:{server.server_address[1]}"
+    server.shutdown()
+
+
+@pytest.fixture
+def cache(stub_api, tmp_path):
+    return PlantImageCache("token", api_url=stub_api, path=str(tmp_path / "images.json"))
+
+
+def test_fetch_image_url(stub_api):
+    session = requests.Session()
+
+    assert fetch_image_url(session, stub_api, "token", "Rose") == "https://images.test/Rose.jpg"
+    assert fetch_image_url(session, stub_api, "token", "Bare") is None
+    assert fetch_image_url(session, stub_api, "token", "Unknown") is None
+    with pytest.raises(requests.HTTPError):
+        fetch_image_url(session, stub_api, "token", "Limited")
+
+
+def test_prefetch_looks_up_each_plant_once_and_saves(cache, tmp_path):
+    futures = cache.prefetch(["Rose", "Rose", "Bare", "Tulip", None])
+    wait(futures)
+    cache.prefetch(["Rose", "Bare", "Tulip"])
+
+    saved = json.loads((tmp_path / "images.json").read_text())
+    assert len(futures) == 3
+    assert StubTrefleHandler.requests == {"Rose": 1, "Bare": 1, "Tulip": 1}
+    assert saved["Tulip"]["url"] == "https://images.test/Tulip.jpg"
+    assert saved["Bare"]["url"] is None
+
+
+def test_get_answers_from_cache_without_waiting(cache):
+    assert cache.get("Rose") is None
+    cache.executor.shutdown(wait=True)
+
+    assert cache.get("Rose") == "https://images.test/Rose.jpg"
+
+
+def test_failed_lookups_are_not_cached(cache):
+    wait(cache.prefetch(["Limited"]))
+    wait(cache.prefetch(["Limited"]))
+
+    assert "Limited" not in cache.entries
+    assert StubTrefleHandler.requests["Limited"] == 2
+
+
+def test_cache_file_is_reloaded_and_expires(stub_api, cache):
+    wait(cache.prefetch(["Rose", "Bare"]))
+    reloaded = PlantImageCache("token", api_url=stub_api, path=cache.path)
+    fetched_at = reloaded.entries["Rose"]["fetched_at"]
+
+    assert reloaded.is_fresh("Rose", fetched_at + MISSING_IMAGE_TTL + 1)
+    assert not reloaded.is_fresh("Rose", fetched_at + IMAGE_TTL + 1)
+    assert not reloaded.is_fresh("Bare", fetched_at + MISSING_IMAGE_TTL + 1)
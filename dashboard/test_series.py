@@ -0,0 +1,134 @@
+# pylint: skip-file
+from unittest.mock import MagicMock
+
+import numpy as np
+import pandas as pd
+import pytest
+from psycopg2.extensions import adapt
+
+from series import (query_live_series, bucket_seconds, series_summary, bucket_series,
+                    lttb, lttb_series, downsample, HOUR_SECONDS)
+
+END = pd.Timestamp("2023-08-29 13:30", tz="UTC")
+
+
+def make_conn(rows: list) -> tuple:
+    conn = MagicMock()
+    cur = conn.cursor().__enter__()
+    cur.fetchall.return_value = rows
+    return conn, cur
+
+
+def test_bucket_seconds_fits_range_into_points():
+    assert bucket_seconds(END - pd.Timedelta(hours=1), END, points=600) == 60
+    assert bucket_seconds(END - pd.Timedelta(days=1), END, points=600) == 144
+
+
+def test_query_live_series_reads_recordings_for_short_ranges():
+    conn, cur = make_conn([(1, END, 2, 10.0, 11.0, 12.0)])
+
+    series = query_live_series(conn, "temperature", [1], END - pd.Timedelta(days=1), END)
+
+    query, params = cur.execute.call_args[0]
+    assert "FROM recording\n" in query
+    assert params["bucket"] == 144
+    assert series["mean"].tolist() == [11.0]
+
+
+def test_query_live_series_reads_hourly_summary_for_long_ranges():
+    conn, cur = make_conn([(1, END, 120, 9.0, 11.5, 14.0)])
+
+    series = query_live_series(conn, "soil_moisture", [1],
+                               END - pd.Timedelta(days=30), END)
+
+    query, params = cur.execute.call_args[0]
+    assert "FROM recording_hourly" in query
+    assert "SUM(soil_moisture_avg * readings) / SUM(readings)" in query
+    assert params["bucket"] % HOUR_SECONDS == 0
+    assert params["start"] == pd.Timestamp("2023-07-30 13:00", tz="UTC")
+    assert series_summary(series) == (9.0, 11.5, 14.0)
+
+
+def test_query_live_series_rejects_unknown_column():
+    with pytest.raises(ValueError):
+        query_live_series(MagicMock(), "id; DROP TABLE recording", [1],
+                          END - pd.Timedelta(days=30), END)
+
+
+@pytest.mark.parametrize("days", [1, 30], ids=["recordings", "hourly"])
+def test_query_live_series_adapts_numpy_plant_ids(days):
+    conn, cur = make_conn([])
+
+    query_live_series(conn, "temperature", [np.int16(1), np.int16(2)],
+                      END - pd.Timedelta(days=days), END)
+
+    plant_ids = cur.execute.call_args[0][1]["plant_ids"]
+    assert plant_ids == [1, 2]
+    assert [adapt(plant_id).getquoted() for plant_id in plant_ids] == [b"1", b"2"]
+
+
+def make_readings(minutes: int, plant_ids: tuple = (1,)) -> pd.DataFrame:
+    recorded = pd.date_range(end=END, periods=minutes, freq="min")
+    return pd.concat([pd.DataFrame({"plant_id": plant_id, "recorded": recorded,
+                                    "temperature": np.sin(np.arange(minutes) / 50) + plant_id})
+                      for plant_id in plant_ids], ignore_index=True)
+
+
+@pytest.mark.parametrize("method", ["bucket", "lttb"])
+def test_downsample_keeps_each_plant_within_points(method):
+    readings = make_readings(2 * 24 * 60 + 1, plant_ids=(1, 2))
+
+    series = downsample(readings, "temperature", points=100, method=method)
+
+    assert series.groupby("plant_id").size().to_dict() == {1: 100, 2: 100}
+    assert list(series.columns) == ["plant_id", "recorded", "readings", "min", "mean", "max"]
+
+
+@pytest.mark.parametrize("method", ["bucket", "lttb"])
+def test_downsample_returns_short_series_unchanged(method):
+    readings = make_readings(10)
+
+    series = downsample(readings, "temperature", method=method)
+
+    assert series["recorded"].tolist() == readings["recorded"].tolist()
+    assert series["mean"].tolist() == readings["temperature"].tolist()
+    assert (series["readings"] == 1).all()
+
+
+def test_bucket_series_summarises_each_bucket():
+    readings = make_readings(2 * 24 * 60 + 1)
+
+    series = bucket_series(readings, "temperature", points=100)
+
+    width = pd.Timedelta(seconds=bucket_seconds(readings["recorded"].min(), END, 100))
+    first = readings[readings["recorded"] < readings["recorded"].min() + width]["temperature"]
+    assert series["readings"].sum() == len(readings)
+    assert series["recorded"].iloc[0] == readings["recorded"].min()
+    assert series.iloc[0][["readings", "min", "mean", "max"]].tolist() == pytest.approx(
+        [len(first), first.min(), first.mean(), first.max()])
+    assert series_summary(series) == pytest.approx(
+        (readings["temperature"].min(), readings["temperature"].mean(),
+         readings["temperature"].max()))
+
+
+def test_lttb_keeps_first_last_and_peaks():
+    x = np.arange(1000, dtype="float64")
+    y = np.zeros(1000)
+    y[500] = 10.0
+
+    kept = lttb(x, y, 50)
+
+    assert len(kept) == 50
+    assert kept[0] == 0 and kept[-1] == 999
+    assert 500 in kept
+    assert (np.diff(kept) > 0).all()
+
+
+def test_lttb_series_keeps_each_plants_first_and_last_reading():
+    readings = make_readings(1000, plant_ids=(1, 2))
+
+    series = lttb_series(readings, "temperature", points=50)
+
+    for _, plant in series.groupby("plant_id"):
+        assert plant["recorded"].iloc[0] == readings["recorded"].min()
+        assert plant["recorded"].iloc[-1] == END
@@ -1,28 +1,57 @@
 '''This module takes the plant data from the data base and 
 uploads it to a csv in the bucket for each day'''
 import os
+import io
+import csv
+import zlib
 import datetime
-import pandas as pd
+from datetime import timezone, timedelta
+import pyarrow as pa
+import pyarrow.parquet as pq
 import psycopg2
 from psycopg2.extras import RealDictCursor
+from psycopg2.extensions import cursor as TupleCursor
 from dotenv import load_dotenv
 from boto3 import client
 
+BUCKET = 'plants-vs-trainees-long-term-storage'
+WATERMARK_NAME = 'recording_archive'
+EXPORT_LAG = timedelta(minutes=5)
+COLUMNS = ['plant_id', 'general_name', 'scientific_name', 'cycle', 'botanist_id',
+           "recorded", 'temperature', "soil_moisture", "watered", "sunlight",
+           "botanist_name"]
+BATCH_SIZE = 10_000
+PART_SIZE = 8 * 1024 * 1024
+PARQUET_PREFIX = 'parquet'
+DICTIONARY_COLUMNS = ['general_name', 'scientific_name', 'cycle', 'sunlight', 'botanist_name']
+PARQUET_TYPES = {
+    'botanist_id': pa.int16(),
+    'recorded': pa.timestamp('us', tz='UTC'),
+    'temperature': pa.float64(),
+    'soil_moisture': pa.float64(),
+    'watered': pa.timestamp('us', tz='UTC'),
+}
 
-def get_connection(host_name, db_name, password, user):
-    '''this function is used for getting a connection to the database'''
-    conn = psycopg2.connect(host=host_name,
-                            dbname=db_name,
-                            password=password,
-                            user=user,
-                            cursor_factory=RealDictCursor)
-    return conn
-
+NEW_PLANT_DATA_SQL = """SELECT
+    plant.id AS plant_id,
+    plant.general_name,
+    plant.scientific_name,
+    plant.cycle,
+    plant.botanist_id,
+    recording.recorded,
+    recording.temperature,
+    recording.soil_moisture,
+    recording.watered,
+    recording.sunlight,
+    botanist.botanist_name
+    FROM recording
+    JOIN plant ON plant.id = recording.plant_id
+    LEFT JOIN botanist ON plant.botanist_id = botanist.id
+    WHERE recording.recorded > COALESCE(%s, '-infinity'::TIMESTAMPTZ)
+    AND recording.recorded <= %s
+    ORDER BY recording.recorded;"""
 
-def get_plant_data(conn):
-    '''this function extracts all the necessary plant data from the database'''
-    with conn.cursor() as cur:
-        sql = """SELECT
+ALL_PLANT_DATA_SQL = """SELECT
     plant.id AS plant_id,
     plant.general_name,
     plant.scientific_name,
@@ -33,45 +62,348 @@ def get_plant_data(conn):
     recording.soil_moisture,
     recording.watered,
     recording.sunlight,
-    botanist.botanist_name 
+    botanist.botanist_name
     FROM plant
     LEFT JOIN recording ON plant.id = recording.plant_id
     LEFT JOIN botanist ON plant.botanist_id = botanist.id;"""
 
+DIMENSIONS_SQL = """SELECT
+    plant.id AS plant_id,
+    plant.general_name,
+    plant.scientific_name,
+    plant.cycle,
+    plant.botanist_id,
+    botanist.botanist_name
+    FROM plant
+    LEFT JOIN botanist ON plant.botanist_id = botanist.id;"""
+
+NEW_RECORDINGS_SQL = """SELECT
+    plant_id,
+    recorded,
+    temperature,
+    soil_moisture,
+    watered,
+    sunlight
+    FROM recording
+    WHERE recorded > COALESCE(%s, '-infinity'::TIMESTAMPTZ)
+    AND recorded <= %s
+    ORDER BY recorded;"""
+
+ALL_RECORDINGS_SQL = """SELECT
+    plant_id,
+    recorded,
+    temperature,
+    soil_moisture,
+    watered,
+    sunlight
+    FROM recording;"""
+
+_connection = None
+
+
+def get_connection(host_name, db_name, password, user):
+    '''this function is used for getting a connection to the database'''
+    conn = psycopg2.connect(host=host_name,
+                            dbname=db_name,
+                            password=password,
+                            user=user,
+                            cursor_factory=RealDictCursor)
+    return conn
+
+
+def is_healthy(conn):
+    '''checks a connection is still open and able to run a query'''
+    if conn.closed:
+        return False
+    try:
+        with conn.cursor() as cur:
+            cur.execute("SELECT 1;")
+        conn.rollback()
+    except (psycopg2.OperationalError, psycopg2.InterfaceError):
+        return False
+    return True
+
+
+def get_shared_connection():
+    '''returns the connection kept between warm invocations, reconnecting if it dropped'''
+    global _connection
+    if _connection is None or not is_healthy(_connection):
+        _connection = get_connection(host_name=os.environ["DB_HOST"],
+                                     db_name=os.environ["DB_NAME"],
+                                     password=os.environ["DB_PASSWORD"],
+                                     user=os.environ["DB_USERNAME"])
+    return _connection
+
+
+def get_watermark(conn, name=WATERMARK_NAME):
+    '''returns the recorded time up to which recordings have been archived, or None'''
+    with conn.cursor() as cur:
+        cur.execute("SELECT recorded FROM archive_watermark WHERE name = %s;", (name,))
+        row = cur.fetchone()
+    return row["recorded"] if row else None
+
+
+def set_watermark(conn, recorded, name=WATERMARK_NAME):
+    '''stores the recorded time up to which recordings have been archived'''
     with conn.cursor() as cur:
-        cur.execute(sql)
-        result = cur.fetchall()
+        cur.execute("""INSERT INTO archive_watermark (name, recorded) VALUES (%s, %s)
+                    ON CONFLICT (name) DO UPDATE SET recorded = EXCLUDED.recorded;""",
+                    (name, recorded))
+    conn.commit()
+
+
+def get_dimensions(conn):
+    '''returns plant id -> (general_name, scientific_name, cycle, botanist_id,
+    botanist_name) for every plant, read once per export'''
+    with conn.cursor() as cur:
+        cur.execute(DIMENSIONS_SQL)
+        return {row["plant_id"]: (row["general_name"], row["scientific_name"], row["cycle"],
+                                  row["botanist_id"], row["botanist_name"])
+                for row in cur.fetchall()}
+
+
+def widen_rows(rows, dimensions, seen):
+    '''joins narrow recording rows to their plant and botanist, in export column
+    order, noting which plants were seen. Recordings of unknown plants are dropped'''
+    wide = []
+    for plant_id, recorded, temperature, soil_moisture, watered, sunlight in rows:
+        plant = dimensions.get(plant_id)
+        if plant is None:
+            continue
+        seen.add(plant_id)
+        general_name, scientific_name, cycle, botanist_id, botanist_name = plant
+        wide.append((plant_id, general_name, scientific_name, cycle, botanist_id, recorded,
+                     temperature, soil_moisture, watered, sunlight, botanist_name))
+    return wide
+
+
+def unrecorded_rows(dimensions, seen):
+    '''returns rows for the plants with no recordings, as a plant first LEFT JOIN does'''
+    return [(plant_id, general_name, scientific_name, cycle, botanist_id,
+             None, None, None, None, None, botanist_name)
+            for plant_id, (general_name, scientific_name, cycle, botanist_id, botanist_name)
+            in dimensions.items() if plant_id not in seen]
+
+
+def fetch_batches(conn, sql, params, batch_size=BATCH_SIZE, dimensions=None,
+                  keep_unrecorded=False):
+    '''yields batches of export rows from a named server-side cursor. Given
+    dimensions, the query returns narrow recordings that are joined here'''
+    seen = set()
+    with conn.cursor(name="archive_export", cursor_factory=TupleCursor) as cur:
+        cur.itersize = batch_size
+        cur.execute(sql, params)
+        while True:
+            rows = cur.fetchmany(batch_size)
+            if not rows:
+                break
+            yield rows if dimensions is None else widen_rows(rows, dimensions, seen)
+
+    if dimensions is not None and keep_unrecorded:
+        rows = unrecorded_rows(dimensions, seen)
+        if rows:
+            yield rows
+
+
+def encode_rows(rows, header=False):
+    '''encodes rows as utf-8 csv, optionally with the column header first'''
+    text = io.StringIO()
+    writer = csv.writer(text)
+    if header:
+        writer.writerow(COLUMNS)
+    writer.writerows(rows)
+    return text.getvalue().encode("utf-8")
+
+
+def stream_query_to_s3(conn, sql, params, amazon_s3, key, compress=False,
+                       batch_size=BATCH_SIZE, part_size=PART_SIZE, dimensions=None,
+                       keep_unrecorded=False):
+    '''streams a query's rows as csv into an S3 multipart upload through a named
+    server-side cursor, holding at most one part in memory and nothing on disk.
+    Returns the number of rows written; the upload is abandoned if there were none'''
+    upload_id = amazon_s3.create_multipart_upload(Bucket=BUCKET, Key=key)["UploadId"]
+    compressor = zlib.compressobj(wbits=31) if compress else None
+    buffer = io.BytesIO()
+    parts = []
+    rows_written = 0
+
+    def upload_part():
+        part_number = len(parts) + 1
+        response = amazon_s3.upload_part(Bucket=BUCKET, Key=key, UploadId=upload_id,
+                                         PartNumber=part_number, Body=buffer.getvalue())
+        parts.append({"ETag": response["ETag"], "PartNumber": part_number})
+        buffer.seek(0)
+        buffer.truncate()
+
+    def write(data):
+        buffer.write(compressor.compress(data) if compressor else data)
+        if buffer.tell() >= part_size:
+            upload_part()
+
+    try:
+        write(encode_rows([], header=True))
+        for rows in fetch_batches(conn, sql, params, batch_size, dimensions, keep_unrecorded):
+            write(encode_rows(rows))
+            rows_written += len(rows)
+        conn.commit()
 
-    dataframe = pd.DataFrame(result, columns=['plant_id', 'general_name',
-                                              'scientific_name', 'cycle', 'botanist_id', "recorded",
-                                              'temperature', "soil_moisture",
-                                              "watered", "sunlight", "botanist_name"])
+        if rows_written == 0:
+            amazon_s3.abort_multipart_upload(Bucket=BUCKET, Key=key, UploadId=upload_id)
+            return 0
 
+        if compressor:
+            buffer.write(compressor.flush())
+        upload_part()
+        amazon_s3.complete_multipart_upload(Bucket=BUCKET, Key=key, UploadId=upload_id,
+                                            MultipartUpload={"Parts": parts})
+    except Exception:
+        amazon_s3.abort_multipart_upload(Bucket=BUCKET, Key=key, UploadId=upload_id)
+        raise
+
+    return rows_written
+
+
+def parquet_table(rows):
+    '''builds a typed arrow table from export rows, leaving out plant_id, which
+    is stored in the partition path, and dictionary encoding the repeated names'''
+    columns = {}
+    for index, name in enumerate(COLUMNS):
+        if name == 'plant_id':
+            continue
+        values = [row[index] for row in rows]
+        if name in DICTIONARY_COLUMNS:
+            columns[name] = pa.array(values, pa.string()).dictionary_encode()
+        else:
+            columns[name] = pa.array(values, PARQUET_TYPES[name])
+    return pa.table(columns)
+
+
+def parquet_key(day, plant_id, run_name, part=0):
+    '''returns the bucket key of one parquet file, numbering any further part
+    of the same day and plant written in one run'''
+    suffix = f'-{part}' if part else ''
+    return f'{PARQUET_PREFIX}/date={day}/plant_id={plant_id}/part-{run_name}{suffix}.parquet'
+
+
+def upload_partitions(amazon_s3, partitions, parts, run_name, before=None):
+    '''uploads and forgets the buffered partitions of every day before the given
+    one, or all of them. Returns the keys written'''
+    keys = []
+    for day, plant_id in sorted(partitions):
+        if before is not None and day >= before:
+            continue
+        buffer = io.BytesIO()
+        pq.write_table(parquet_table(partitions.pop((day, plant_id))), buffer,
+                       compression='snappy')
+        part = parts.get((day, plant_id), 0)
+        parts[(day, plant_id)] = part + 1
+        key = parquet_key(day, plant_id, run_name, part)
+        amazon_s3.put_object(Bucket=BUCKET, Key=key, Body=buffer.getvalue())
+        keys.append(key)
+    return keys
+
+
+def stream_query_to_parquet(conn, sql, params, amazon_s3, run_name, batch_size=BATCH_SIZE,
+                            dimensions=None):
+    '''streams a query's rows through a named server-side cursor and uploads them as
+    parquet files laid out as parquet/date=YYYY-MM-DD/plant_id=N/part-<run_name>.parquet.
+    A day's files are uploaded as soon as a row from a later day arrives, so a
+    query ordered by recorded only holds one day in memory. Rows of a day that
+    was already uploaded go to a further numbered part. Returns the keys written'''
+    recorded_index = COLUMNS.index('recorded')
+    plant_index = COLUMNS.index('plant_id')
+    partitions = {}
+    parts = {}
+    keys = []
+    latest_day = None
+
+    for rows in fetch_batches(conn, sql, params, batch_size, dimensions):
+        for row in rows:
+            if row[recorded_index] is None:
+                continue
+            day = row[recorded_index].astimezone(timezone.utc).date()
+            if latest_day is None or day > latest_day:
+                if latest_day is not None:
+                    keys.extend(upload_partitions(amazon_s3, partitions, parts, run_name,
+                                                  before=day))
+                latest_day = day
+            partitions.setdefault((day, row[plant_index]), []).append(row)
     conn.commit()
 
-    return dataframe
+    keys.extend(upload_partitions(amazon_s3, partitions, parts, run_name))
+    return keys
+
+
+def archive_key(name, compress):
+    '''returns the bucket key for an archive file'''
+    return f'plant_{name}_data.csv.gz' if compress else f'plant_{name}_data.csv'
+
+
+def export_new_recordings(conn, amazon_s3, compress=False, archive_format='csv',
+                          fetch_mode='join'):
+    '''uploads the recordings taken since the last export and advances the watermark.
+    Recordings from the last few minutes are left for the next run, in case
+    rows for them are still being committed. With fetch_mode 'normalized' the
+    plants are read once and only the narrow recording columns are streamed'''
+    since = get_watermark(conn)
+    until = datetime.datetime.now(timezone.utc) - EXPORT_LAG
+    run_name = f'{until:%Y-%m-%d_%H%M%S}'
+    sql, dimensions = NEW_PLANT_DATA_SQL, None
+    if fetch_mode == 'normalized':
+        sql, dimensions = NEW_RECORDINGS_SQL, get_dimensions(conn)
+
+    if archive_format == 'parquet':
+        keys = stream_query_to_parquet(conn, sql, (since, until), amazon_s3, run_name,
+                                       dimensions=dimensions)
+    else:
+        key = archive_key(run_name, compress)
+        rows = stream_query_to_s3(conn, sql, (since, until), amazon_s3, key, compress,
+                                  dimensions=dimensions)
+        keys = [key] if rows else []
+
+    set_watermark(conn, until)
+    return keys
+
+
+def export_all_recordings(conn, amazon_s3, compress=False, archive_format='csv',
+                          fetch_mode='join'):
+    '''uploads every recording currently in the database and moves the watermark
+    up to the start of the export, so the pipeline may purge what was uploaded'''
+    started = datetime.datetime.now(timezone.utc)
+    sql, dimensions = ALL_PLANT_DATA_SQL, None
+    if fetch_mode == 'normalized':
+        sql, dimensions = ALL_RECORDINGS_SQL, get_dimensions(conn)
+
+    if archive_format == 'parquet':
+        keys = stream_query_to_parquet(conn, sql, None, amazon_s3,
+                                       str(datetime.date.today()), dimensions=dimensions)
+    else:
+        key = archive_key(datetime.date.today(), compress)
+        stream_query_to_s3(conn, sql, None, amazon_s3, key, compress,
+                           dimensions=dimensions, keep_unrecorded=True)
+        keys = [key]
+
+    set_watermark(conn, started)
+    return keys
 
 
 def lambda_handler(event, context):
     '''function to upload to aws lambda'''
     load_dotenv()
 
-    conn = get_connection(host_name=os.environ["DB_HOST"], db_name=os.environ["DB_NAME"],
-                          password=os.environ["DB_PASSWORD"], user=os.environ["DB_USERNAME"])
-
-    dataframe = get_plant_data(conn)
-
-    dataframe.to_csv(f'/tmp/plant_{datetime.date.today()}_data.csv')
+    conn = get_shared_connection()
 
     amazon_s3 = client("s3", region_name="eu-west-2",
                        aws_access_key_id=os.environ["ACCESS_KEY_ID"],
                        aws_secret_access_key=os.environ["SECRET_ACCESS_KEY_ID"])
 
-    amazon_s3.upload_file(
-        f'/tmp/plant_{datetime.date.today()}_data.csv',
-        'plants-vs-trainees-long-term-storage',
-        f'plant_{datetime.date.today()}_data.csv'
-    )
+    compress = bool(os.environ.get("COMPRESS_EXPORT"))
+    archive_format = os.environ.get("ARCHIVE_FORMAT", "csv")
+    fetch_mode = os.environ.get("FETCH_MODE", "join")
+    if os.environ.get("EXPORT_MODE", "incremental") == "full":
+        export_all_recordings(conn, amazon_s3, compress, archive_format, fetch_mode)
+    else:
+        export_new_recordings(conn, amazon_s3, compress, archive_format, fetch_mode)
 
     return {
         'statusCode': 200,
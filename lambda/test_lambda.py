@@ -0,0 +1,322 @@
+# pylint: skip-file
+"""Unit tests for the archive lambda. The fetch mode comparison also runs
+against a local Postgres given by TEST_DATABASE_URL, e.g.
+    TEST_DATABASE_URL=postgresql://postgres@localhost/postgres pytest test_lambda.py"""
+import os
+import gzip
+import importlib
+from datetime import datetime, timedelta, timezone
+from unittest.mock import MagicMock, patch
+
+import boto3
+import pytest
+import psycopg2
+from psycopg2.extras import RealDictCursor
+from moto import mock_aws
+
+export = importlib.import_module("lambda")
+
+DATABASE_URL = os.environ.get("TEST_DATABASE_URL")
+SCHEMA = "lambda_test"
+
+
+def make_row(plant_id: int, day: int, hour: int = 12) -> tuple:
+    values = {"plant_id": plant_id, "general_name": f"Plant {plant_id}",
+              "recorded": datetime(2023, 8, day, hour, tzinfo=timezone.utc),
+              "temperature": 12.0, "soil_moisture": 30.0,
+              "watered": datetime(2023, 8, 1, tzinfo=timezone.utc), "sunlight": "full_sun"}
+    return tuple(values.get(column) for column in export.COLUMNS)
+
+
+def test_stream_query_to_parquet_uploads_each_day_once_it_has_passed():
+    batches = [[make_row(1, 1), make_row(2, 1)], [make_row(1, 2)], [make_row(1, 3)]]
+    batches_read, uploaded = [], []
+    amazon_s3 = MagicMock()
+
+    def put_object(Bucket, Key, Body):
+        uploaded.append((Key, len(batches_read)))
+
+    def fetch_batches(*args):
+        for rows in batches:
+            batches_read.append(rows)
+            yield rows
+
+    amazon_s3.put_object.side_effect = put_object
+    with patch.object(export, "fetch_batches", fetch_batches):
+        keys = export.stream_query_to_parquet(MagicMock(), "", None, amazon_s3, "run")
+
+    assert keys == ["parquet/date=2023-08-01/plant_id=1/part-run.parquet",
+                    "parquet/date=2023-08-01/plant_id=2/part-run.parquet",
+                    "parquet/date=2023-08-02/plant_id=1/part-run.parquet",
+                    "parquet/date=2023-08-03/plant_id=1/part-run.parquet"]
+    assert [batches for _, batches in uploaded] == [2, 2, 3, 3]
+
+
+def test_stream_query_to_parquet_writes_late_rows_as_a_further_part():
+    batches = [[make_row(1, 1), make_row(1, 2)], [make_row(1, 1, hour=20)]]
+    amazon_s3 = MagicMock()
+
+    with patch.object(export, "fetch_batches", return_value=iter(batches)):
+        keys = export.stream_query_to_parquet(MagicMock(), "", None, amazon_s3, "run")
+
+    assert keys == ["parquet/date=2023-08-01/plant_id=1/part-run.parquet",
+                    "parquet/date=2023-08-01/plant_id=1/part-run-1.parquet",
+                    "parquet/date=2023-08-02/plant_id=1/part-run.parquet"]
+
+
+@pytest.fixture
+def amazon_s3(monkeypatch):
+    monkeypatch.setenv("AWS_ACCESS_KEY_ID", "testing")
+    monkeypatch.setenv("AWS_SECRET_ACCESS_KEY", "testing")
+    with mock_aws():
+        amazon_s3 = boto3.client("s3", region_name="us-east-1")
+        amazon_s3.create_bucket(Bucket=export.BUCKET)
+        yield amazon_s3
+
+
+def stream_rows(amazon_s3, batches, key, **kwargs):
+    with patch.object(export, "fetch_batches", return_value=iter(batches)):
+        return export.stream_query_to_s3(MagicMock(), "", None, amazon_s3, key, **kwargs)
+
+
+def read_object(amazon_s3, key) -> bytes:
+    return amazon_s3.get_object(Bucket=export.BUCKET, Key=key)["Body"].read()
+
+
+def test_stream_query_to_s3_uploads_csv_in_parts(amazon_s3):
+    batches = [[make_row(plant_id, day) for plant_id in range(50)] * 40
+               for day in range(1, 31)]
+
+    written = stream_rows(amazon_s3, batches, "plant_all_data.csv",
+                          part_size=5 * 1024 * 1024)
+
+    lines = read_object(amazon_s3, "plant_all_data.csv").decode("utf-8").splitlines()
+    parts = amazon_s3.head_object(Bucket=export.BUCKET, Key="plant_all_data.csv",
+                                  PartNumber=1)["PartsCount"]
+    assert written == 60_000
+    assert len(lines) == 60_001
+    assert lines[0] == ",".join(export.COLUMNS)
+    assert parts >= 2
+
+
+def test_stream_query_to_s3_compresses_with_gzip(amazon_s3):
+    written = stream_rows(amazon_s3, [[make_row(1, 1), make_row(2, 1)]],
+                          "plant_new_data.csv.gz", compress=True)
+
+    lines = gzip.decompress(read_object(amazon_s3, "plant_new_data.csv.gz")).splitlines()
+    assert written == 2
+    assert len(lines) == 3
+
+
+def test_stream_query_to_s3_abandons_empty_upload(amazon_s3):
+    written = stream_rows(amazon_s3, [], "plant_new_data.csv")
+
+    listing = amazon_s3.list_objects_v2(Bucket=export.BUCKET)
+    uploads = amazon_s3.list_multipart_uploads(Bucket=export.BUCKET)
+    assert written == 0
+    assert listing["KeyCount"] == 0
+    assert "Uploads" not in uploads
+
+
+def make_conn(watermark=None):
+    conn = MagicMock()
+    cur = conn.cursor.return_value.__enter__.return_value
+    cur.fetchone.return_value = {"recorded": watermark} if watermark else None
+    return conn, cur
+
+
+def test_get_watermark_reads_named_row():
+    recorded = datetime(2023, 8, 1, tzinfo=timezone.utc)
+    conn, cur = make_conn(recorded)
+
+    assert export.get_watermark(conn) == recorded
+    assert cur.execute.call_args.args[1] == (export.WATERMARK_NAME,)
+
+
+def test_get_watermark_before_first_export_is_none():
+    conn, _ = make_conn()
+
+    assert export.get_watermark(conn) is None
+
+
+def test_set_watermark_upserts_and_commits():
+    recorded = datetime(2023, 8, 1, tzinfo=timezone.utc)
+    conn, cur = make_conn()
+
+    export.set_watermark(conn, recorded)
+
+    sql, params = cur.execute.call_args.args
+    assert "ON CONFLICT (name) DO UPDATE" in sql
+    assert params == (export.WATERMARK_NAME, recorded)
+    conn.commit.assert_called_once()
+
+
+def test_export_new_recordings_uploads_rows_up_to_lagged_watermark(amazon_s3):
+    since = datetime(2023, 8, 1, tzinfo=timezone.utc)
+    conn, _ = make_conn(since)
+    before = datetime.now(timezone.utc)
+
+    with patch.object(export, "fetch_batches", return_value=iter([[make_row(1, 2)]])) as fetch, \
+            patch.object(export, "set_watermark") as set_watermark:
+        keys = export.export_new_recordings(conn, amazon_s3)
+
+    params = fetch.call_args.args[2]
+    until = set_watermark.call_args.args[1]
+    assert params == (since, until)
+    assert before - export.EXPORT_LAG <= until <= datetime.now(timezone.utc) - export.EXPORT_LAG
+    assert len(keys) == 1
+    assert len(read_object(amazon_s3, keys[0]).decode("utf-8").splitlines()) == 2
+
+
+def test_export_new_recordings_advances_watermark_when_nothing_is_new(amazon_s3):
+    conn, _ = make_conn(datetime(2023, 8, 1, tzinfo=timezone.utc))
+
+    with patch.object(export, "fetch_batches", return_value=iter([])), \
+            patch.object(export, "set_watermark") as set_watermark:
+        keys = export.export_new_recordings(conn, amazon_s3)
+
+    assert keys == []
+    assert amazon_s3.list_objects_v2(Bucket=export.BUCKET)["KeyCount"] == 0
+    set_watermark.assert_called_once()
+
+
+def test_export_all_recordings_moves_watermark_to_export_start(amazon_s3):
+    conn, _ = make_conn()
+    before = datetime.now(timezone.utc)
+
+    with patch.object(export, "fetch_batches", return_value=iter([[make_row(1, 2)]])), \
+            patch.object(export, "set_watermark") as set_watermark:
+        keys = export.export_all_recordings(conn, amazon_s3)
+
+    assert len(keys) == 1
+    assert before <= set_watermark.call_args.args[1] <= datetime.now(timezone.utc)
+
+
+PLANTS = {1: ("Rose", "Rosa", "Perennial", 1, "Ada"),
+          2: ("Fern", None, None, 2, "Grace"),
+          3: ("Cactus", "Cactaceae", "Perennial", 1, "Ada")}
+RECORDINGS = [(plant_id, datetime(2023, 8, 1, hour, tzinfo=timezone.utc), 12.0 + hour, 30.0,
+               datetime(2023, 8, 1, tzinfo=timezone.utc), "full_sun")
+              for plant_id in (1, 2) for hour in (10, 11)]
+
+
+def joined_rows() -> list:
+    """Returns the rows ALL_PLANT_DATA_SQL gives for PLANTS and RECORDINGS"""
+    rows = []
+    for plant_id, (general_name, scientific_name, cycle, botanist_id, botanist_name) \
+            in PLANTS.items():
+        recordings = [row[1:] for row in RECORDINGS if row[0] == plant_id] or [(None,) * 5]
+        rows += [(plant_id, general_name, scientific_name, cycle, botanist_id, *recording,
+                  botanist_name) for recording in recordings]
+    return rows
+
+
+def make_fake_db() -> MagicMock:
+    """Returns a connection answering the join, dimension and recording queries"""
+    results = {export.ALL_PLANT_DATA_SQL: joined_rows(),
+               export.ALL_RECORDINGS_SQL: RECORDINGS,
+               export.DIMENSIONS_SQL: [dict(zip(["plant_id", "general_name", "scientific_name",
+                                                 "cycle", "botanist_id", "botanist_name"],
+                                                (plant_id, *plant)))
+                                       for plant_id, plant in PLANTS.items()]}
+
+    def cursor(*args, **kwargs):
+        cur = MagicMock()
+        cur.__enter__.return_value = cur
+
+        def execute(sql, params=None):
+            cur.fetchall.return_value = results[sql]
+            cur.fetchmany.side_effect = [results[sql], []]
+
+        cur.execute.side_effect = execute
+        return cur
+
+    conn = MagicMock()
+    conn.cursor.side_effect = cursor
+    return conn
+
+
+def export_rows(conn, join_sql, recordings_sql, params, keep_unrecorded) -> tuple:
+    """Returns the rows fetched in the join and normalized fetch modes, sorted"""
+    def key(row):
+        return row[0], str(row[5])
+
+    joined = [row for rows in export.fetch_batches(conn, join_sql, params) for row in rows]
+    dimensions = export.get_dimensions(conn)
+    normalized = [row for rows in export.fetch_batches(conn, recordings_sql, params,
+                                                       dimensions=dimensions,
+                                                       keep_unrecorded=keep_unrecorded)
+                  for row in rows]
+    return sorted(map(tuple, joined), key=key), sorted(map(tuple, normalized), key=key)
+
+
+def test_fetch_modes_give_the_same_rows():
+    joined, normalized = export_rows(make_fake_db(), export.ALL_PLANT_DATA_SQL,
+                                     export.ALL_RECORDINGS_SQL, None, keep_unrecorded=True)
+
+    assert normalized == joined
+    assert (3, "Cactus", "Cactaceae", "Perennial", 1, None, None, None, None, None,
+            "Ada") in normalized
+
+
+def test_widen_rows_drops_recordings_of_unknown_plants():
+    seen = set()
+
+    rows = export.widen_rows(RECORDINGS + [(9, *RECORDINGS[0][1:])], PLANTS, seen)
+
+    assert len(rows) == len(RECORDINGS)
+    assert seen == {1, 2}
+    assert [row[0] for row in export.unrecorded_rows(PLANTS, seen)] == [3]
+
+
+@pytest.fixture
+def conn():
+    if DATABASE_URL is None:
+        pytest.skip("TEST_DATABASE_URL is not set")
+
+    conn = psycopg2.connect(DATABASE_URL, cursor_factory=RealDictCursor,
+                            options=f"-c search_path={SCHEMA}")
+    schema_path = os.path.join(os.path.dirname(__file__), "..", "pipeline", "create_tables.sql")
+    with open(schema_path) as file:
+        schema_sql = file.read().split("\\c plant_monitor;", 1)[1]
+    now = datetime.now(timezone.utc)
+    with conn.cursor() as cur:
+        cur.execute(f"DROP SCHEMA IF EXISTS {SCHEMA} CASCADE;")
+        cur.execute(f"CREATE SCHEMA {SCHEMA};")
+        cur.execute(schema_sql)
+        cur.execute("""INSERT INTO botanist (botanist_name, email, phone)
+                    VALUES ('Ada', 'ada@lnhm.co.uk', '01'), ('Grace', 'grace@lnhm.co.uk', '02');""")
+        cur.execute("""INSERT INTO plant (plant_id, general_name, scientific_name, cycle, botanist_id)
+                    VALUES (1, 'Rose', 'Rosa', 'Perennial', 1), (2, 'Fern', NULL, NULL, 2),
+                        (3, 'Cactus', 'Cactaceae', 'Perennial', 1);""")
+        cur.execute("""INSERT INTO recording (recorded, plant_id, temperature, soil_moisture, watered, sunlight)
+                    SELECT %s - minutes * interval '1 minute', plant.id, 10 + minutes, 30,
+                        %s - interval '1 day', 'full_sun'
+                    FROM plant CROSS JOIN generate_series(0, 9) AS minutes
+                    WHERE plant.id < 3;""", (now, now))
+    conn.commit()
+
+    yield conn
+
+    conn.rollback()
+    with conn.cursor() as cur:
+        cur.execute(f"DROP SCHEMA IF EXISTS {SCHEMA} CASCADE;")
+    conn.commit()
+    conn.close()
+
+
+def test_fetch_modes_give_the_same_rows_from_postgres(conn):
+    joined, normalized = export_rows(conn, export.ALL_PLANT_DATA_SQL,
+                                     export.ALL_RECORDINGS_SQL, None, keep_unrecorded=True)
+
+    assert len(joined) == 21
+    assert normalized == joined
+
+
+def test_fetch_modes_give_the_same_new_rows_from_postgres(conn):
+    until = datetime.now(timezone.utc)
+    joined, normalized = export_rows(conn, export.NEW_PLANT_DATA_SQL, export.NEW_RECORDINGS_SQL,
+                                     (until - timedelta(minutes=5), until), keep_unrecorded=False)
+
+    assert len(joined) == 10
+    assert normalized == joined
@@ -0,0 +1,187 @@
+"""Replays a directory of saved API payloads (.json, as written to data/payloads
+with DUMP_PLANT_JSON) or archive exports (.csv, .csv.gz, or .parquet from the
+date=/plant_id= partitioned export) through the transform and load stages, e.g.
+to reprocess history after a cleaning rule changes. Subfolders are searched too.
+Run with `python3 backfill.py DIRECTORY [--workers N]`
+
+Chunks are cleaned in a process pool and bulk loaded in order on one connection.
+Recordings already stored for the same plant and time are skipped, so a
+backfill can be rerun safely. Recordings older than the retention window are
+purged again by the next live tick, but the hourly summaries built from them
+stay: a later rerun re-inserts the recordings, and only replaces an hour's
+summary when it has at least as many readings as the one stored."""
+import os
+import json
+import re
+import argparse
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from typing import Iterable, Iterator
+import pandas as pd
+import pyarrow.parquet as pq
+from psycopg2.extensions import connection
+from database import pooled_connection
+from transform import clean_data, clean_moisture_column, clean_temperature_column
+from load import write_columns, write_to_recording_table_with_ids, DimensionCache
+from summary import update_summaries
+from retention import prepare_partitions
+
+CHUNK_FILES = 60
+CHUNK_ROWS = 50_000
+MAX_WORKERS = os.cpu_count() or 1
+PAYLOAD_SUFFIX = ".json"
+CSV_SUFFIXES = (".csv", ".csv.gz")
+PARQUET_SUFFIX = ".parquet"
+ARCHIVE_SUFFIXES = CSV_SUFFIXES + (PARQUET_SUFFIX,)
+PARTITION_PLANT = re.compile(r"plant_id=(\d+)")
+ARCHIVE_RENAMES = {"general_name": "plant_name", "recorded": "recording_taken",
+                   "watered": "last_watered"}
+
+
+def list_files(directory: str) -> tuple[list[str], list[str]]:
+    """Returns the payload files and archive files under a directory, in path order"""
+    paths = sorted(os.path.join(folder, name)
+                   for folder, _, names in os.walk(directory) for name in names)
+    payloads = [path for path in paths if path.endswith(PAYLOAD_SUFFIX)]
+    archives = [path for path in paths if path.endswith(ARCHIVE_SUFFIXES)]
+    return payloads, archives
+
+
+def chunked(items: list, size: int) -> Iterator[list]:
+    """Splits a list into consecutive chunks of at most size items"""
+    for start in range(0, len(items), size):
+        yield items[start:start + size]
+
+
+def reference_temperatures(dataframe: pd.DataFrame) -> pd.DataFrame:
+    """Returns each plant's median temperature within a chunk, in the shape of
+    get_averages_from_db. Replayed readings have no live 15 minute window, and
+    the median is not pulled about by the outliers being removed."""
+    return (dataframe.groupby("plant_id")["temperature"].median()
+            .rename("avg").reset_index())
+
+
+def transform_payloads(paths: list[str]) -> pd.DataFrame:
+    """Reads and cleans a chunk of saved API payloads, run in a worker process"""
+    records = []
+    for path in paths:
+        with open(path) as file:
+            records.extend(json.load(file))
+
+    dataframe = pd.DataFrame(records)
+    if dataframe.empty:
+        return dataframe
+    return clean_data(dataframe, reference_temperatures(dataframe))
+
+
+def transform_archive(dataframe: pd.DataFrame) -> pd.DataFrame:
+    """Cleans a chunk of archived recordings, run in a worker process. Archives
+    are already flattened, so only the moisture and temperature rules apply"""
+    dataframe = dataframe.rename(columns=ARCHIVE_RENAMES)
+    dataframe = dataframe.dropna(subset=["recording_taken", "temperature", "soil_moisture"])
+    dataframe["recording_taken"] = pd.to_datetime(dataframe["recording_taken"], utc=True,
+                                                  format="ISO8601")
+    dataframe["last_watered"] = pd.to_datetime(dataframe["last_watered"], utc=True,
+                                               format="ISO8601")
+    dataframe = clean_moisture_column(dataframe)
+    return clean_temperature_column(dataframe, reference_temperatures(dataframe))
+
+
+def read_parquet_chunks(path: str, chunk_rows: int = CHUNK_ROWS) -> Iterator[pd.DataFrame]:
+    """Streams a parquet export a chunk of rows at a time. The partitioned
+    export keeps plant_id in the path rather than the file, so it is taken from there"""
+    plant = PARTITION_PLANT.search(path)
+    for batch in pq.ParquetFile(path).iter_batches(batch_size=chunk_rows):
+        dataframe = batch.to_pandas()
+        categories = dataframe.select_dtypes("category").columns
+        dataframe = dataframe.astype({column: object for column in categories})
+        if "plant_id" not in dataframe.columns and plant is not None:
+            dataframe["plant_id"] = int(plant.group(1))
+        yield dataframe
+
+
+def read_archive_chunks(paths: list[str], chunk_rows: int = CHUNK_ROWS) -> Iterator[pd.DataFrame]:
+    """Streams archive files a chunk of rows at a time"""
+    for path in paths:
+        if path.endswith(PARQUET_SUFFIX):
+            yield from read_parquet_chunks(path, chunk_rows)
+        else:
+            yield from pd.read_csv(path, chunksize=chunk_rows)
+
+
+def load_payload_chunk(conn: connection, dataframe: pd.DataFrame,
+                       cache: DimensionCache) -> int:
+    """Loads cleaned payload rows, adding any new botanists and plants"""
+    return write_columns(conn, dataframe, cache=cache)
+
+
+def load_archive_chunk(conn: connection, dataframe: pd.DataFrame,
+                       cache: DimensionCache) -> int:
+    """Loads cleaned archive rows, whose plant ids are already database ids.
+    Recordings of plants no longer in the database are skipped"""
+    if not cache.warmed:
+        cache.warm(conn)
+    plant_ids = {plant_id: plant_id for plant_id in cache.plant_ids.values()}
+    inserted = write_to_recording_table_with_ids(conn, dataframe, plant_ids)
+    update_summaries(conn, dataframe, plant_ids)
+    return inserted
+
+
+def backfill_tasks(directory: str, chunk_files: int = CHUNK_FILES,
+                   chunk_rows: int = CHUNK_ROWS) -> Iterator[tuple]:
+    """Yields (transform, argument, load) for every chunk in a directory"""
+    payloads, archives = list_files(directory)
+    for paths in chunked(payloads, chunk_files):
+        yield transform_payloads, paths, load_payload_chunk
+    for dataframe in read_archive_chunks(archives, chunk_rows):
+        yield transform_archive, dataframe, load_archive_chunk
+
+
+def run_transforms(tasks: Iterable[tuple], workers: int) -> Iterator[tuple]:
+    """Runs each task's transform in a process pool, yielding (result, load) in
+    task order. At most two chunks per worker are in flight, so chunks are not
+    read much faster than they are loaded. One worker runs everything in-process."""
+    if workers <= 1:
+        for transform, argument, load in tasks:
+            yield transform(argument), load
+        return
+
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        pending = deque()
+        for transform, argument, load in tasks:
+            pending.append((executor.submit(transform, argument), load))
+            if len(pending) >= 2 * workers:
+                future, pending_load = pending.popleft()
+                yield future.result(), pending_load
+        while pending:
+            future, pending_load = pending.popleft()
+            yield future.result(), pending_load
+
+
+def backfill(conn: connection, directory: str, workers: int = MAX_WORKERS,
+             chunk_files: int = CHUNK_FILES, chunk_rows: int = CHUNK_ROWS) -> dict:
+    """Transforms and loads every file in a directory. Returns the number of
+    chunks, cleaned rows and recordings inserted"""
+    prepare_partitions(conn)
+    cache = DimensionCache()
+    totals = {"chunks": 0, "rows": 0, "inserted": 0}
+    tasks = backfill_tasks(directory, chunk_files, chunk_rows)
+    for dataframe, load in run_transforms(tasks, workers):
+        totals["chunks"] += 1
+        if dataframe.empty:
+            continue
+        totals["rows"] += len(dataframe)
+        totals["inserted"] += load(conn, dataframe, cache)
+        print(f"chunk {totals['chunks']}: {len(dataframe)} rows, "
+              f"{totals['inserted']} inserted so far")
+    return totals
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Replay saved payloads or archives")
+    parser.add_argument("directory")
+    parser.add_argument("--workers", type=int, default=MAX_WORKERS)
+    args = parser.parse_args()
+
+    with pooled_connection() as db_conn:
+        print(backfill(db_conn, args.directory, args.workers))
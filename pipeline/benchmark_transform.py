@@ -0,0 +1,55 @@
+"""Times the botanist and sunlight cleaning steps at increasing plant counts.
+Run with `python3 benchmark_transform.py [ROWS ...]`"""
+import sys
+import time
+import random
+import pandas as pd
+from transform import cleaning_botanist, clean_sunlight_column, convert_sunlight
+
+DEFAULT_SIZES = [50, 10_000, 1_000_000]
+SUNLIGHT_VALUES = [["full sun"], ["Part shade"], ["part sun", "full sun"],
+                   ["full shade"], ["part sun/part shade"], ["very sunny"]]
+
+
+def make_plants(rows: int) -> pd.DataFrame:
+    """Builds a frame shaped like the API payload"""
+    botanists = [{"name": f"Botanist {i}", "email": f"botanist{i}@lnhm.co.uk",
+                  "phone": f"0{i}"} for i in range(5)]
+    return pd.DataFrame({
+        "name": [f"Plant {i}" for i in range(rows)],
+        "botanist": [random.choice(botanists) for _ in range(rows)],
+        "sunlight": [list(random.choice(SUNLIGHT_VALUES)) for _ in range(rows)]
+    })
+
+
+def apply_cleaning(dataframe: pd.DataFrame) -> pd.DataFrame:
+    """The previous per-row apply implementation, kept for comparison"""
+    dataframe = dataframe.rename(columns={"name" : "plant_name"})
+    dataframe["botanist_name"] = dataframe["botanist"].apply(lambda x: x["name"])
+    dataframe["email"] = dataframe["botanist"].apply(lambda x: x["email"])
+    dataframe["phone"] = dataframe["botanist"].apply(lambda x: x["phone"])
+    dataframe = dataframe.drop("botanist", axis=1)
+    dataframe["sunlight"] = dataframe["sunlight"].apply(convert_sunlight)
+    return dataframe
+
+
+def vectorized_cleaning(dataframe: pd.DataFrame) -> pd.DataFrame:
+    """The current single-pass implementation"""
+    return clean_sunlight_column(cleaning_botanist(dataframe))
+
+
+def time_per_row(function, dataframe: pd.DataFrame) -> float:
+    """Returns the microseconds per row taken by function"""
+    start = time.perf_counter()
+    function(dataframe.copy())
+    return (time.perf_counter() - start) / len(dataframe) * 1_000_000
+
+
+if __name__ == "__main__":
+    sizes = [int(size) for size in sys.argv[1:]] or DEFAULT_SIZES
+
+    print(f"{'rows':>10} {'apply us/row':>14} {'vectorized us/row':>18}")
+    for size in sizes:
+        plants = make_plants(size)
+        print(f"{size:>10} {time_per_row(apply_cleaning, plants):>14.3f} "
+              f"{time_per_row(vectorized_cleaning, plants):>18.3f}")
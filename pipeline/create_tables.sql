@@ -26,13 +26,73 @@ CREATE TABLE plant (
 );
 
 CREATE TABLE recording (
-    id BIGINT GENERATED ALWAYS AS IDENTITY,
+    id BIGSERIAL,
     recorded TIMESTAMPTZ NOT NULL,
     plant_id SMALLINT NOT NULL,
     temperature FLOAT NOT NULL,
     soil_moisture FLOAT NOT NULL,
     watered TIMESTAMPTZ NOT NULL,
     sunlight SUNLIGHT_TYPES,
-    PRIMARY KEY (id),
+    PRIMARY KEY (id, recorded),
+    FOREIGN KEY (plant_id) REFERENCES plant (id)
+) PARTITION BY RANGE (recorded);
+
+-- Daily partitions (recording_YYYYMMDD) are created ahead of time and
+-- dropped once expired by retention.py; anything outside them lands here.
+CREATE TABLE recording_default PARTITION OF recording DEFAULT;
+
+-- Today's and the next two days' partitions exist from the start, otherwise
+-- the first ticks land in the default partition and block their creation.
+DO $$
+DECLARE
+    day DATE;
+BEGIN
+    FOR offset_days IN 0..2 LOOP
+        day := (NOW() AT TIME ZONE 'UTC')::DATE + offset_days;
+        EXECUTE format(
+            'CREATE TABLE recording_%s PARTITION OF recording FOR VALUES FROM (%L) TO (%L)',
+            to_char(day, 'YYYYMMDD'),
+            day::TIMESTAMP AT TIME ZONE 'UTC',
+            (day + 1)::TIMESTAMP AT TIME ZONE 'UTC');
+    END LOOP;
+END $$;
+
+CREATE INDEX recording_recorded_idx ON recording (recorded);
+
+-- Unique so replayed recordings are skipped with ON CONFLICT DO NOTHING.
+CREATE UNIQUE INDEX recording_plant_id_recorded_idx ON recording (plant_id, recorded);
+
+CREATE TABLE archive_watermark (
+    name VARCHAR NOT NULL,
+    recorded TIMESTAMPTZ NOT NULL,
+    PRIMARY KEY (name)
+);
+
+-- Summaries kept up to date by load.py as recordings are inserted, so the
+-- dashboard reads one row per plant instead of scanning every recording.
+CREATE TABLE plant_latest_reading (
+    plant_id SMALLINT NOT NULL,
+    recorded TIMESTAMPTZ NOT NULL,
+    temperature FLOAT NOT NULL,
+    soil_moisture FLOAT NOT NULL,
+    watered TIMESTAMPTZ NOT NULL,
+    sunlight SUNLIGHT_TYPES,
+    PRIMARY KEY (plant_id),
     FOREIGN KEY (plant_id) REFERENCES plant (id)
-);
\ No newline at end of file
+);
+
+CREATE TABLE recording_hourly (
+    plant_id SMALLINT NOT NULL,
+    hour TIMESTAMPTZ NOT NULL,
+    readings INT NOT NULL,
+    temperature_min FLOAT NOT NULL,
+    temperature_avg FLOAT NOT NULL,
+    temperature_max FLOAT NOT NULL,
+    soil_moisture_min FLOAT NOT NULL,
+    soil_moisture_avg FLOAT NOT NULL,
+    soil_moisture_max FLOAT NOT NULL,
+    PRIMARY KEY (plant_id, hour),
+    FOREIGN KEY (plant_id) REFERENCES plant (id)
+);
+
+CREATE INDEX recording_hourly_hour_idx ON recording_hourly (hour);
@@ -0,0 +1,85 @@
+"""Shared pool of long-lived database connections used by every pipeline stage"""
+import os
+from contextlib import contextmanager
+import psycopg2
+from psycopg2.pool import ThreadedConnectionPool
+from psycopg2.extensions import connection
+from dotenv import load_dotenv
+from metrics import CountingCursor
+
+MIN_CONNECTIONS = 1
+MAX_CONNECTIONS = 4
+
+_pool = None
+
+
+def create_pool(min_connections: int = MIN_CONNECTIONS,
+                max_connections: int = MAX_CONNECTIONS) -> ThreadedConnectionPool:
+    """Creates a connection pool from the DB_* environment variables"""
+    load_dotenv()
+    return ThreadedConnectionPool(min_connections, max_connections,
+                                  host=os.environ["DB_HOST"],
+                                  dbname=os.environ["DB_NAME"],
+                                  password=os.environ["DB_PASSWORD"],
+                                  user=os.environ["DB_USERNAME"],
+                                  cursor_factory=CountingCursor,
+                                  keepalives=1,
+                                  keepalives_idle=30)
+
+
+def get_pool() -> ThreadedConnectionPool:
+    """Returns the pool shared by this process, creating it on first use"""
+    global _pool
+    if _pool is None or _pool.closed:
+        _pool = create_pool()
+    return _pool
+
+
+def close_pool():
+    """Closes every connection held by the shared pool"""
+    global _pool
+    if _pool is not None:
+        _pool.closeall()
+        _pool = None
+
+
+def is_healthy(conn: connection) -> bool:
+    """Checks a connection is still open and able to run a query"""
+    if conn.closed:
+        return False
+    try:
+        with conn.cursor() as cur:
+            cur.execute("SELECT 1;")
+        conn.rollback()
+    except (psycopg2.OperationalError, psycopg2.InterfaceError):
+        return False
+    return True
+
+
+def checkout_connection(pool: ThreadedConnectionPool) -> connection:
+    """Takes a healthy connection from the pool, replacing a dropped one if needed"""
+    conn = pool.getconn()
+    if is_healthy(conn):
+        return conn
+
+    pool.putconn(conn, close=True)
+    return pool.getconn()
+
+
+@contextmanager
+def pooled_connection():
+    """Lends out a pooled connection, discarding it if it breaks while in use"""
+    pool = get_pool()
+    conn = checkout_connection(pool)
+    try:
+        yield conn
+    except (psycopg2.OperationalError, psycopg2.InterfaceError):
+        pool.putconn(conn, close=True)
+        raise
+    except Exception:
+        if not conn.closed:
+            conn.rollback()
+        pool.putconn(conn)
+        raise
+    else:
+        pool.putconn(conn)
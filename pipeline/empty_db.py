@@ -1,24 +1,16 @@
 """Removes rows older than a day old from the recording table"""
-import os
-import psycopg2
-from psycopg2.extras import RealDictCursor
+from datetime import datetime, timezone
 from psycopg2.extensions import connection
-from dotenv import load_dotenv
+from database import pooled_connection
+from retention import purge
+from summary import purge_hourly
 
 def remove_old_recordings(conn:connection):
-    """Removes entries from the recording table older than a day"""
-    with conn.cursor() as cur:
-        sql = """
-            DELETE FROM recording
-            WHERE recorded < NOW() - interval '1 day'
-            """
-        cur.execute(sql)
-    conn.commit()
+    """Removes entries from the recording table older than a day,
+    and hourly summaries past their own retention"""
+    purge(conn)
+    purge_hourly(conn, datetime.now(timezone.utc))
 
 if __name__ == "__main__":
-    load_dotenv()
-    db_conn = psycopg2.connect(host=os.environ["DB_HOST"], dbname= os.environ["DB_NAME"],
-                             password=os.environ["DB_PASSWORD"], user=os.environ["DB_USERNAME"],
-                             cursor_factory=RealDictCursor)
-    remove_old_recordings(db_conn)
-    db_conn.close()
+    with pooled_connection() as db_conn:
+        remove_old_recordings(db_conn)
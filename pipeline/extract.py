@@ -1,11 +1,30 @@
-"""This file extracts the plant data from the API
-    and saves it as a JSON file"""
+"""This file extracts the plant data from the API,
+    optionally saving it as a JSON file"""
 import json
 import os
+import time
+from contextvars import copy_context
+from concurrent.futures import ThreadPoolExecutor, wait
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 import datetime
+import metrics
 
 PLANT_JSON = "data/live_plants.json"
+PAYLOAD_FOLDER = "data/payloads"
+API_URL = "https://data-eng-plants-api.herokuapp.com/plants"
+PLANT_IDS = range(0, 51)
+MAX_WORKERS = 10
+REQUEST_TIMEOUT = 10
+TICK_BUDGET = 30
+POOL_SIZE = MAX_WORKERS
+RETRIES = 2
+BACKOFF_FACTOR = 0.2
+BACKOFF_JITTER = 0.3
+RETRY_STATUSES = (500, 502, 503, 504)
+
+_session = None
 
 
 class APIException(Exception):
@@ -15,20 +34,47 @@ class APIException(Exception):
         self.code = code
 
 
-def load_plant_by_id(plant_id: int) -> dict:
+def create_session(pool_size: int = POOL_SIZE, retries: int = RETRIES,
+                   backoff_factor: float = BACKOFF_FACTOR,
+                   backoff_jitter: float = BACKOFF_JITTER) -> requests.Session:
+    """Creates a session that keeps up to pool_size connections alive
+    and retries 5xx responses with jittered exponential backoff"""
+    retry = Retry(total=retries, connect=retries, read=0, status=retries,
+                  status_forcelist=RETRY_STATUSES, allowed_methods=["GET"],
+                  backoff_factor=backoff_factor, backoff_jitter=backoff_jitter,
+                  raise_on_status=False)
+    adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size, max_retries=retry)
+
+    session = requests.Session()
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    return session
+
+
+def get_session() -> requests.Session:
+    """Returns the session shared by every request in this process,
+    so connections are reused across ticks of the pipeline loop"""
+    global _session
+    if _session is None:
+        _session = create_session()
+    return _session
+
+
+def load_plant_by_id(plant_id: int, api_url: str = API_URL,
+                     timeout: float = REQUEST_TIMEOUT, session: requests.Session = None) -> dict:
     """Given a plant id, load the plant"""
+    if session is None:
+        session = get_session()
 
-    response = requests.get(
-        f'https://data-eng-plants-api.herokuapp.com/plants/{plant_id}',
-        timeout=10)
-    if check_api_status_code(response):
-        plant_data = response.json()
+    response = session.get(f'{api_url}/{plant_id}', timeout=timeout)
+    check_api_status_code(response)
 
-    return plant_data
+    return response.json()
 
 
 def check_api_status_code(response) -> bool:
-    """Raises an error if there is an issue with the API response"""
+    """Raises an error for any API response other than 200, including
+    5xx responses still failing once the session's retries are used up"""
     status_code = response.status_code
     if status_code == 200:
         return True
@@ -36,25 +82,74 @@ def check_api_status_code(response) -> bool:
         raise APIException("Error: Plant not found", 404)
     if status_code == 500:
         raise APIException("Error: Server not available", 500)
-    return False
+    raise APIException(f"Error: Unexpected status {status_code}", status_code)
+
+
+def fetch_valid_plant(plant_id: int, api_url: str = API_URL, timeout: float = REQUEST_TIMEOUT,
+                      session: requests.Session = None) -> dict | None:
+    """Loads a single plant, returning None if the API could not provide it"""
+    start = time.perf_counter()
+    try:
+        plant = load_plant_by_id(plant_id, api_url, timeout, session)
+    except APIException as err:
+        print(f"plant {plant_id}: {err.code}, {err.message}")
+        metrics.increment(f"plants_failed.{err.code}")
+        return None
+    except requests.exceptions.RequestException as err:
+        print(f"plant {plant_id}: request failed, {err}")
+        metrics.increment("plants_failed.request")
+        return None
+    finally:
+        metrics.observe_api_latency(time.perf_counter() - start)
+
+    if 'error' in plant.keys():
+        return None
+    return plant
+
+
+def load_all_plants(plant_ids=PLANT_IDS, max_workers: int = MAX_WORKERS,
+                    request_timeout: float = REQUEST_TIMEOUT, tick_budget: float = TICK_BUDGET,
+                    api_url: str = API_URL, session: requests.Session = None) -> list[dict]:
+    """Loads plants concurrently, at most max_workers at a time.
+    Each request is bounded by request_timeout and any plant still pending
+    once tick_budget seconds have passed is skipped for this tick.
+    Workers record into the caller's metrics registry."""
+    if session is None:
+        session = get_session()
+
+    executor = ThreadPoolExecutor(max_workers=max_workers)
+    futures = {executor.submit(copy_context().run, fetch_valid_plant, plant_id, api_url,
+                               request_timeout, session):
+               plant_id for plant_id in plant_ids}
+
+    done, not_done = wait(futures, timeout=tick_budget)
+    executor.shutdown(wait=False, cancel_futures=True)
+
+    for future in not_done:
+        print(f"plant {futures[future]}: no response within the {tick_budget}s tick budget")
+    metrics.increment("plants_failed.tick_budget", len(not_done))
+
+    plants = [future.result() for future in sorted(done, key=futures.get)]
+    plants = [plant for plant in plants if plant is not None]
+    metrics.increment("plants_extracted", len(plants))
+    return plants
+
 
+def payload_path(taken: datetime.datetime, folder: str = PAYLOAD_FOLDER) -> str:
+    """Returns the file a tick's payload is dumped to, named so that the
+    files sort in the order they were taken"""
+    return os.path.join(folder, f"plants_{taken:%Y%m%d_%H%M%S}.json")
 
-def write_valid_plant_data_to_json_file():
-    """Writes the plant data to a json file"""
-    plant_data = []
 
-    for plant in range(0, 51):
-        try:
-            plant = load_plant_by_id(plant)
-            if 'error' not in plant.keys():
-                plant_data.append(plant)
-        except APIException as err:
-            print(f"plant {plant}: {err.code}, {err.message}")
-            continue
+def write_valid_plant_data_to_json_file(plant_data: list[dict] = None, path: str = PLANT_JSON):
+    """Writes the plant data to a json file, loading it from the API if not given"""
+    if plant_data is None:
+        plant_data = load_all_plants()
 
-    if not os.path.exists("data"):
-        os.mkdir("data")
-    with open(PLANT_JSON, 'w') as file:
+    folder = os.path.dirname(path)
+    if folder:
+        os.makedirs(folder, exist_ok=True)
+    with open(path, 'w') as file:
         json.dump(plant_data, file, indent=4)
 
 
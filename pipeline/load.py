@@ -1,39 +1,116 @@
 """Uploads recordings, plants, and botanists to the database"""
-import os
-import psycopg2
+import csv
+from io import StringIO
+from typing import Callable, Iterable
 import pandas as pd
-from psycopg2.extras import RealDictCursor
+from psycopg2.errors import ForeignKeyViolation
 from psycopg2.extensions import connection
-from dotenv import load_dotenv
+from database import pooled_connection
+from summary import update_summaries, update_summaries_from_rows
+from stream_transform import CleanRecord
 
 PLANT_JSON = "data/live_plants.json"
 PLANTS_CSV = "data/plants.csv"
+RECORDING_COLUMNS = ["recording_taken", "temperature", "soil_moisture",
+                     "last_watered", "sunlight", "plant_id"]
+STAGING_TABLE_SQL = """
+    CREATE TEMP TABLE IF NOT EXISTS recording_staging (
+        recorded TIMESTAMPTZ,
+        temperature FLOAT,
+        soil_moisture FLOAT,
+        watered TIMESTAMPTZ,
+        sunlight SUNLIGHT_TYPES,
+        plant_id SMALLINT
+    ) ON COMMIT DELETE ROWS;
+    """
 
 
-def get_connection(host_name:str, db_name:str, password:str, user:str):
-    """Connects to the database"""
-    conn = psycopg2.connect(host=host_name,
-                            dbname=db_name,
-                            password=password,
-                            user=user,
-                            cursor_factory=RealDictCursor)
-    return conn
+class DimensionCache:
+    """Long-lived map of botanist_name -> botanist.id and API plant_id -> plant.id,
+    so botanists and plants already in the database are not re-inserted every tick"""
 
+    def __init__(self):
+        self.botanist_ids = {}
+        self.plant_ids = {}
+        self.warmed = False
 
-def write_columns(conn: connection, dataframe):
-    """Creates sub dataframes for each table, uploads rows to database"""
+    def warm(self, conn: connection):
+        """Reloads every botanist and plant id from the database"""
+        with conn.cursor() as cur:
+            cur.execute("SELECT id, botanist_name FROM botanist;")
+            self.botanist_ids = {row["botanist_name"]: row["id"] for row in cur.fetchall()}
+            cur.execute("SELECT id, plant_id FROM plant;")
+            self.plant_ids = {row["plant_id"]: row["id"] for row in cur.fetchall()}
+        self.warmed = True
+
+    def new_botanists(self, dataframe: pd.DataFrame) -> pd.DataFrame:
+        """Returns the botanists missing from the cache"""
+        missing = ~dataframe["botanist_name"].isin(self.botanist_ids.keys())
+        return dataframe[missing].drop_duplicates("botanist_name")
+
+    def new_plants(self, dataframe: pd.DataFrame) -> pd.DataFrame:
+        """Returns the plants missing from the cache"""
+        missing = ~dataframe["plant_id"].isin(self.plant_ids.keys())
+        return dataframe[missing].drop_duplicates("plant_id")
+
+
+def write_columns(conn: connection, dataframe, bulk: bool = False, cache: DimensionCache = None):
+    """Creates sub dataframes for each table, uploads rows to database.
+    With bulk set, recordings are loaded through COPY rather than executemany.
+    With a cache, only unseen botanists and plants are written and
+    recordings are copied in with their plant ids already resolved.
+    The summary tables are brought up to date after the recordings land.
+    With a cache, returns the number of recordings inserted"""
     botanist = dataframe[["botanist_name", "email", "phone"]]
     plant = dataframe[["plant_name",
       "scientific_name", "cycle", "plant_id", "botanist_name" ]]
-    recording = dataframe[["recording_taken", "temperature", "soil_moisture", "last_watered", "sunlight", "plant_id"]]
+    recording = dataframe[RECORDING_COLUMNS]
+
+    if cache is not None:
+        return retry_with_warm_cache(conn, cache, write_columns_with_cache,
+                                     botanist, plant, recording)
+
     write_to_botanist_table(conn, botanist)
     write_to_plant_table(conn, plant)
-    write_to_recording_table(conn, recording)
+    if bulk:
+        write_to_recording_table_bulk(conn, recording)
+    else:
+        write_to_recording_table(conn, recording)
+
+    plant_lookup = DimensionCache()
+    plant_lookup.warm(conn)
+    update_summaries(conn, recording, plant_lookup.plant_ids)
+
+
+def retry_with_warm_cache(conn: connection, cache: DimensionCache, load: Callable, *args) -> int:
+    """Runs load(conn, cache, *args). If it fails on a foreign key, the cache
+    held a botanist or plant id no longer in the database, so the transaction
+    is rolled back, the cache reloaded and the load run once more"""
+    try:
+        return load(conn, cache, *args)
+    except ForeignKeyViolation:
+        conn.rollback()
+        cache.warm(conn)
+        return load(conn, cache, *args)
+
+
+def write_columns_with_cache(conn: connection, cache: DimensionCache, botanist: pd.DataFrame,
+                             plant: pd.DataFrame, recording: pd.DataFrame) -> int:
+    """Writes unseen botanists and plants, then copies the recordings in with
+    their cached plant ids. Returns the number of recordings inserted"""
+    write_dimensions_with_cache(conn, cache, botanist, plant)
+    inserted = write_to_recording_table_with_ids(conn, recording, cache.plant_ids)
+    update_summaries(conn, recording, cache.plant_ids)
+    return inserted
 
 
 def write_to_botanist_table(conn: connection, dataframe: pd.DataFrame):
     """Uploads botanist name, phone, email to the botanist table"""
-    records = dataframe.to_records(index=False)
+    insert_botanists(conn, dataframe.to_records(index=False))
+
+
+def insert_botanists(conn: connection, records: Iterable[tuple]):
+    """Inserts (botanist_name, email, phone) rows, skipping known botanists"""
     with conn.cursor() as cur:
         sql = """
             INSERT INTO botanist (botanist_name, email, phone)
@@ -49,8 +126,12 @@ def write_to_botanist_table(conn: connection, dataframe: pd.DataFrame):
 def write_to_plant_table(conn: connection, dataframe: pd.DataFrame):
     """Uploads plant details to the plant table in db"""
     dataframe.loc[:, "plant_id"] = dataframe["plant_id"].astype("object")
-    records = dataframe.to_records(index=False)
+    insert_plants(conn, dataframe.to_records(index=False))
 
+
+def insert_plants(conn: connection, records: Iterable[tuple]):
+    """Inserts (general_name, scientific_name, cycle, plant_id, botanist_name)
+    rows, skipping known plants"""
     with conn.cursor() as cur:
         sql = """
             INSERT INTO plant (general_name, scientific_name, cycle, plant_id, botanist_id)
@@ -77,19 +158,144 @@ def write_to_recording_table(conn:connection, dataframe:pd.DataFrame):
     with conn.cursor() as cur:
         sql = """
             INSERT INTO recording (recorded, temperature, soil_moisture, watered, sunlight, plant_id)
-            VALUES (%s, ROUND(%s, 3), ROUND(%s, 3), %s, %s, (SELECT id FROM plant WHERE plant.plant_id = %s));
+            VALUES (%s, ROUND(%s, 3), ROUND(%s, 3), %s, %s, (SELECT id FROM plant WHERE plant.plant_id = %s))
+            ON CONFLICT (plant_id, recorded) DO NOTHING;
             """
         cur.executemany(sql, records)
 
     conn.commit()
 
 
-if __name__ == "__main__":
+def write_to_recording_table_bulk(conn: connection, dataframe: pd.DataFrame):
+    """Streams recordings into a staging table with COPY, then moves them
+    into the recording table with one INSERT that joins on plant"""
+    dataframe = dataframe[RECORDING_COLUMNS].copy()
+    dataframe["sunlight"] = dataframe["sunlight"].fillna("Null")
+    dataframe["last_watered"] = pd.to_datetime(dataframe["last_watered"])
+
+    buffer = StringIO()
+    dataframe.to_csv(buffer, index=False, header=False)
+    buffer.seek(0)
+
+    with conn.cursor() as cur:
+        cur.execute(STAGING_TABLE_SQL)
+        cur.copy_expert("COPY recording_staging FROM STDIN WITH (FORMAT csv)", buffer)
+        cur.execute("""
+            INSERT INTO recording (recorded, temperature, soil_moisture, watered, sunlight, plant_id)
+            SELECT staging.recorded, ROUND(staging.temperature::NUMERIC, 3),
+                ROUND(staging.soil_moisture::NUMERIC, 3), staging.watered,
+                staging.sunlight, plant.id
+            FROM recording_staging AS staging
+            JOIN plant ON plant.plant_id = staging.plant_id
+            ON CONFLICT (plant_id, recorded) DO NOTHING;
+            """)
+
+    conn.commit()
 
-    load_dotenv()
-    db_conn = get_connection(host_name=os.environ["DB_HOST"], db_name= os.environ["DB_NAME"],
-                             password=os.environ["DB_PASSWORD"], user=os.environ["DB_USERNAME"])
 
+def write_dimensions_with_cache(conn: connection, cache: DimensionCache,
+                                botanist: pd.DataFrame, plant: pd.DataFrame):
+    """Inserts only the botanists and plants the cache has not seen,
+    refreshing the cache from the database after a miss"""
+    if not cache.warmed:
+        cache.warm(conn)
+
+    new_botanists = cache.new_botanists(botanist)
+    new_plants = cache.new_plants(plant)
+    if new_botanists.empty and new_plants.empty:
+        return
+
+    if not new_botanists.empty:
+        write_to_botanist_table(conn, new_botanists)
+    if not new_plants.empty:
+        write_to_plant_table(conn, new_plants.copy())
+    cache.warm(conn)
+
+
+def write_to_recording_table_with_ids(conn: connection, dataframe: pd.DataFrame,
+                                      plant_ids: dict) -> int:
+    """Copies recordings into the recording table using plant ids already
+    resolved by the dimension cache, skipping any unknown plant and any
+    recording already stored for the same plant and time.
+    Returns the number of recordings inserted"""
+    dataframe = dataframe[RECORDING_COLUMNS].copy()
+    dataframe["plant_id"] = dataframe["plant_id"].map(plant_ids)
+    dataframe = dataframe.dropna(subset=["plant_id"])
+    dataframe["plant_id"] = dataframe["plant_id"].astype(int)
+    dataframe["temperature"] = dataframe["temperature"].round(3)
+    dataframe["soil_moisture"] = dataframe["soil_moisture"].round(3)
+    dataframe["sunlight"] = dataframe["sunlight"].fillna("Null")
+    dataframe["last_watered"] = pd.to_datetime(dataframe["last_watered"])
+
+    buffer = StringIO()
+    dataframe.to_csv(buffer, index=False, header=False)
+    return copy_recordings(conn, buffer)
+
+
+def copy_recordings(conn: connection, buffer: StringIO) -> int:
+    """Copies csv recordings, whose plant ids are database ids, through the
+    staging table, skipping any recording already stored for the same plant
+    and time. Returns the number of recordings inserted"""
+    buffer.seek(0)
+    with conn.cursor() as cur:
+        cur.execute(STAGING_TABLE_SQL)
+        cur.copy_expert("COPY recording_staging FROM STDIN WITH (FORMAT csv)", buffer)
+        cur.execute("""
+            INSERT INTO recording (recorded, temperature, soil_moisture, watered, sunlight, plant_id)
+            SELECT recorded, temperature, soil_moisture, watered, sunlight, plant_id
+            FROM recording_staging
+            ON CONFLICT (plant_id, recorded) DO NOTHING;
+            """)
+        inserted = cur.rowcount
+
+    conn.commit()
+    return inserted
+
+
+def recording_rows(records: Iterable[CleanRecord], plant_ids: dict) -> list[tuple]:
+    """Returns cleaned records as rows in the staging table's column order,
+    rounded as stored, skipping any unknown plant"""
+    return [(record.recording_taken, round(record.temperature, 3),
+             round(record.soil_moisture, 3), record.last_watered,
+             record.sunlight or "Null", plant_ids[record.plant_id])
+            for record in records if record.plant_id in plant_ids]
+
+
+def write_records(conn: connection, records: list[CleanRecord], cache: DimensionCache) -> int:
+    """Loads records from the stream engine as write_columns does with a cache,
+    copying them in from tuples without building a DataFrame.
+    Returns the number of recordings inserted"""
+    return retry_with_warm_cache(conn, cache, write_records_with_cache, records)
+
+
+def write_records_with_cache(conn: connection, cache: DimensionCache,
+                             records: list[CleanRecord]) -> int:
+    """Writes unseen botanists and plants from records, then copies the
+    recordings in. Returns the number of recordings inserted"""
+    if not cache.warmed:
+        cache.warm(conn)
+
+    new_botanists = {record.botanist_name: (record.botanist_name, record.email, record.phone)
+                     for record in records if record.botanist_name not in cache.botanist_ids}
+    new_plants = {record.plant_id: (record.plant_name, record.scientific_name, record.cycle,
+                                    record.plant_id, record.botanist_name)
+                  for record in records if record.plant_id not in cache.plant_ids}
+    if new_botanists:
+        insert_botanists(conn, list(new_botanists.values()))
+    if new_plants:
+        insert_plants(conn, list(new_plants.values()))
+    if new_botanists or new_plants:
+        cache.warm(conn)
+
+    rows = recording_rows(records, cache.plant_ids)
+    buffer = StringIO()
+    csv.writer(buffer).writerows(rows)
+    inserted = copy_recordings(conn, buffer)
+    update_summaries_from_rows(conn, rows)
+    return inserted
+
+
+if __name__ == "__main__":
     plant_df = pd.read_csv(PLANTS_CSV)
-    write_columns(db_conn, plant_df)
-    
+    with pooled_connection() as db_conn:
+        write_columns(db_conn, plant_df)
@@ -1,33 +1,94 @@
 """Main script that runs the full ETL loop, downloading json data and uploading to RDS"""
-import time
 import os
+from datetime import datetime, timezone
 import pandas as pd
+from psycopg2 import OperationalError, InterfaceError
 from dotenv import load_dotenv
-from extract import write_valid_plant_data_to_json_file
-from transform import clean_data, get_averages_from_db
-from load import get_connection, write_columns
+from extract import (load_all_plants, write_valid_plant_data_to_json_file, payload_path,
+                     TICK_BUDGET)
+from transform import clean_data
+from stream_transform import clean_records
+from load import write_columns, write_records, DimensionCache
 from empty_db import remove_old_recordings
+from retention import prepare_partitions
+from database import pooled_connection
+from rolling import RollingTemperatures
+from scheduler import TickScheduler, TICK_SECONDS
+import metrics
+
+
+def extract_tick(tick_seconds: float) -> tuple[list[dict], metrics.Registry]:
+    """Extract stage of a tick, run on the scheduler's main thread. Returns the
+    plants with the tick's own metrics registry, handed on to load_tick"""
+    print("tick")
+    taken = datetime.now(timezone.utc)
+    registry = metrics.Registry()
+    with metrics.use(registry), metrics.time_stage("extract"):
+        plant_data = load_all_plants(tick_budget=min(TICK_BUDGET, 0.75 * tick_seconds))
+    if os.environ.get("DUMP_PLANT_JSON"):
+        write_valid_plant_data_to_json_file(plant_data, payload_path(taken))
+    return plant_data, registry
+
+
+def load_tick(batch: tuple[list[dict], metrics.Registry], dimension_cache: DimensionCache,
+              rolling_temperatures: RollingTemperatures):
+    """Transform, load and purge stages of a tick, run on the loader thread.
+    The tick's metrics are written once, after its load"""
+    plant_data, registry = batch
+    with metrics.use(registry):
+        transform_and_load(plant_data, dimension_cache, rolling_temperatures)
+
+    registry.absorb(metrics.default_registry())
+    registry.write(os.environ.get("METRICS_LOG"))
+
+
+def transform_and_load(plant_data: list[dict], dimension_cache: DimensionCache,
+                       rolling_temperatures: RollingTemperatures):
+    """Cleans a tick's plants, loads them and purges old recordings. The stream
+    engine's records are loaded as tuples, never passing through pandas"""
+    try:
+        with pooled_connection() as db_conn:
+            if not rolling_temperatures.seeded:
+                rolling_temperatures.seed(db_conn)
+
+            stream = os.environ.get("TRANSFORM_ENGINE") == "stream"
+            with metrics.time_stage("transform"):
+                if stream:
+                    cleaned = list(clean_records(plant_data,
+                                                 rolling_temperatures.mean_by_plant()))
+                else:
+                    cleaned = clean_data(pd.DataFrame(plant_data),
+                                         rolling_temperatures.averages())
+            metrics.record_rows("transform", len(plant_data), len(cleaned))
+
+            with metrics.time_stage("load"):
+                prepare_partitions(db_conn)
+                if stream:
+                    write_records(db_conn, cleaned, dimension_cache)
+                else:
+                    write_columns(db_conn, cleaned, cache=dimension_cache)
+            metrics.increment("rows_loaded", len(cleaned))
+            if stream:
+                rolling_temperatures.update_records(cleaned)
+            else:
+                rolling_temperatures.update(cleaned)
+
+            with metrics.time_stage("remove_old_recordings"):
+                remove_old_recordings(db_conn)
+    except (OperationalError, InterfaceError) as err:
+        print(f"database unavailable, skipping tick: {err}")
+        metrics.increment("db_errors")
 
-PLANT_JSON = "data/live_plants.json"
 
 if __name__ == "__main__":
     load_dotenv()
 
-    start = time.time()
-    while True:
-        print("tick")
-        write_valid_plant_data_to_json_file()
-        load_dotenv()
-        db_conn = get_connection(host_name=os.environ["DB_HOST"], db_name= os.environ["DB_NAME"],
-                                password=os.environ["DB_PASSWORD"], user=os.environ["DB_USERNAME"])
-        
-        plant_df = pd.read_json(PLANT_JSON)
-        average_temps = get_averages_from_db(db_conn)
-        plant_df = clean_data(plant_df, average_temps)
-        os.remove(PLANT_JSON)
-
-        
-        write_columns(db_conn, plant_df)
-        remove_old_recordings(db_conn)
-        db_conn.close()
-        time.sleep(60.0 - ((time.time() - start) % 60.0))
+    tick_seconds = float(os.environ.get("TICK_SECONDS", TICK_SECONDS))
+    dimension_cache = DimensionCache()
+    rolling_temperatures = RollingTemperatures()
+
+    scheduler = TickScheduler(
+        extract=lambda: extract_tick(tick_seconds),
+        load=lambda batch: load_tick(batch, dimension_cache, rolling_temperatures),
+        interval=tick_seconds)
+    scheduler.run()
@@ -0,0 +1,178 @@
+"""Collects timings and counts for each ETL tick and writes them as JSON lines.
+The module functions record into the registry of the tick running in the
+current context, set with use()"""
+import json
+import sys
+import time
+import threading
+from bisect import bisect_left
+from collections import defaultdict
+from contextlib import contextmanager
+from contextvars import ContextVar
+from psycopg2.extras import RealDictCursor
+
+LATENCY_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+class Registry:
+    """Timings and counts for one tick. Each tick gets its own registry, so
+    the extract of one tick and the load of the previous one, which run at
+    the same time, never record into each other"""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self._clear()
+
+    def _clear(self):
+        self.stage_seconds = {}
+        self.counts = defaultdict(int)
+        self.latency_counts = [0] * (len(LATENCY_BUCKETS) + 1)
+        self.latency_total = 0.0
+
+    def reset(self):
+        """Clears everything recorded so far"""
+        with self.lock:
+            self._clear()
+
+    @contextmanager
+    def time_stage(self, stage: str):
+        """Records the wall time spent inside the block against a stage name"""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed = time.perf_counter() - start
+            with self.lock:
+                self.stage_seconds[stage] = self.stage_seconds.get(stage, 0.0) + elapsed
+
+    def increment(self, name: str, amount: int = 1):
+        """Adds to a named counter"""
+        with self.lock:
+            self.counts[name] += amount
+
+    def record_rows(self, step: str, rows_in: int, rows_out: int):
+        """Records how many rows went into and came out of a cleaning step"""
+        with self.lock:
+            self.counts[f"{step}.rows_in"] += rows_in
+            self.counts[f"{step}.rows_out"] += rows_out
+
+    def observe_api_latency(self, seconds: float):
+        """Adds one plant API request to the latency histogram"""
+        with self.lock:
+            self.latency_counts[bisect_left(LATENCY_BUCKETS, seconds)] += 1
+            self.latency_total += seconds
+
+    def absorb(self, other: "Registry"):
+        """Moves everything recorded in another registry into this one"""
+        with other.lock:
+            stage_seconds, counts = other.stage_seconds, other.counts
+            latency_counts, latency_total = other.latency_counts, other.latency_total
+            other._clear()
+        with self.lock:
+            for stage, seconds in stage_seconds.items():
+                self.stage_seconds[stage] = self.stage_seconds.get(stage, 0.0) + seconds
+            for name, count in counts.items():
+                self.counts[name] += count
+            self.latency_counts = [mine + theirs for mine, theirs
+                                   in zip(self.latency_counts, latency_counts)]
+            self.latency_total += latency_total
+
+    def snapshot(self) -> dict:
+        """Returns everything recorded since the last reset"""
+        with self.lock:
+            buckets = {f"le_{bound}": count for bound, count
+                       in zip(LATENCY_BUCKETS, self.latency_counts)}
+            buckets["le_inf"] = self.latency_counts[-1]
+            return {
+                "stage_seconds": {stage: round(seconds, 4) for stage, seconds
+                                  in self.stage_seconds.items()},
+                "counts": dict(self.counts),
+                "api_latency": {"count": sum(self.latency_counts),
+                                "sum": round(self.latency_total, 4),
+                                "buckets": buckets}
+            }
+
+    def write(self, path: str = None):
+        """Appends the snapshot as one JSON line to path, or stdout if no path is given"""
+        line = json.dumps({"time": time.time(), **self.snapshot()})
+        if path is None:
+            print(line, file=sys.stdout, flush=True)
+            return
+        with open(path, "a") as file:
+            file.write(line + "\n")
+
+
+_default = Registry()
+_current = ContextVar("metrics_registry", default=None)
+
+
+def default_registry() -> Registry:
+    """Returns the registry used outside any tick, e.g. by the scheduler"""
+    return _default
+
+
+def current() -> Registry:
+    """Returns the registry of the tick running in this context"""
+    registry = _current.get()
+    return _default if registry is None else registry
+
+
+@contextmanager
+def use(registry: Registry):
+    """Records everything in the block, and in contexts copied from it, into registry"""
+    token = _current.set(registry)
+    try:
+        yield registry
+    finally:
+        _current.reset(token)
+
+
+def reset():
+    """Clears everything recorded so far, ready for the next tick"""
+    current().reset()
+
+
+def time_stage(stage: str):
+    """Records the wall time spent inside the block against a stage name"""
+    return current().time_stage(stage)
+
+
+def increment(name: str, amount: int = 1):
+    """Adds to a named counter"""
+    current().increment(name, amount)
+
+
+def record_rows(step: str, rows_in: int, rows_out: int):
+    """Records how many rows went into and came out of a cleaning step"""
+    current().record_rows(step, rows_in, rows_out)
+
+
+def observe_api_latency(seconds: float):
+    """Adds one plant API request to the latency histogram"""
+    current().observe_api_latency(seconds)
+
+
+def snapshot() -> dict:
+    """Returns everything recorded since the last reset"""
+    return current().snapshot()
+
+
+def write(path: str = None):
+    """Appends the snapshot as one JSON line to path, or stdout if no path is given"""
+    current().write(path)
+
+
+class CountingCursor(RealDictCursor):
+    """RealDictCursor that counts the statements it sends to the database"""
+
+    def execute(self, query, vars=None):
+        increment("db_statements")
+        return super().execute(query, vars)
+
+    def executemany(self, query, vars_list):
+        vars_list = list(vars_list)
+        increment("db_statements", len(vars_list))
+        return super().executemany(query, vars_list)
+
+    def copy_expert(self, sql, file, size=8192):
+        increment("db_statements")
+        return super().copy_expert(sql, file, size)
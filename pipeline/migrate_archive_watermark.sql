@@ -0,0 +1,8 @@
+-- Adds the table the lambda uses to track how far recordings have been archived.
+-- Run with: psql -d plant_monitor -f migrate_archive_watermark.sql
+
+CREATE TABLE IF NOT EXISTS archive_watermark (
+    name VARCHAR NOT NULL,
+    recorded TIMESTAMPTZ NOT NULL,
+    PRIMARY KEY (name)
+);
@@ -0,0 +1,54 @@
+-- Converts an existing unpartitioned recording table to the daily
+-- partitioned layout in create_tables.sql, keeping its rows.
+-- Run with: psql -d plant_monitor -f migrate_partition_recording.sql
+
+BEGIN;
+
+ALTER TABLE recording RENAME TO recording_unpartitioned;
+ALTER INDEX recording_pkey RENAME TO recording_unpartitioned_pkey;
+ALTER TABLE recording_unpartitioned ALTER COLUMN id DROP IDENTITY;
+
+CREATE SEQUENCE recording_id_seq AS BIGINT;
+SELECT setval('recording_id_seq', COALESCE((SELECT MAX(id) FROM recording_unpartitioned), 0) + 1, false);
+
+CREATE TABLE recording (
+    id BIGINT NOT NULL DEFAULT nextval('recording_id_seq'),
+    recorded TIMESTAMPTZ NOT NULL,
+    plant_id SMALLINT NOT NULL,
+    temperature FLOAT NOT NULL,
+    soil_moisture FLOAT NOT NULL,
+    watered TIMESTAMPTZ NOT NULL,
+    sunlight SUNLIGHT_TYPES,
+    PRIMARY KEY (id, recorded),
+    FOREIGN KEY (plant_id) REFERENCES plant (id)
+) PARTITION BY RANGE (recorded);
+
+ALTER SEQUENCE recording_id_seq OWNED BY recording.id;
+
+CREATE TABLE recording_default PARTITION OF recording DEFAULT;
+
+-- Today's and the next two days' partitions must exist before the copy,
+-- otherwise recent rows land in the default partition and block them.
+DO $$
+DECLARE
+    day DATE;
+BEGIN
+    FOR offset_days IN 0..2 LOOP
+        day := (NOW() AT TIME ZONE 'UTC')::DATE + offset_days;
+        EXECUTE format(
+            'CREATE TABLE recording_%s PARTITION OF recording FOR VALUES FROM (%L) TO (%L)',
+            to_char(day, 'YYYYMMDD'),
+            day::TIMESTAMP AT TIME ZONE 'UTC',
+            (day + 1)::TIMESTAMP AT TIME ZONE 'UTC');
+    END LOOP;
+END $$;
+
+CREATE INDEX recording_recorded_idx ON recording (recorded);
+
+INSERT INTO recording (id, recorded, plant_id, temperature, soil_moisture, watered, sunlight)
+SELECT id, recorded, plant_id, temperature, soil_moisture, watered, sunlight
+FROM recording_unpartitioned;
+
+DROP TABLE recording_unpartitioned;
+
+COMMIT;
@@ -0,0 +1,18 @@
+-- Makes (plant_id, recorded) unique on the recording table, so reruns of the
+-- pipeline or backfill.py skip recordings that are already stored.
+-- Duplicates already in the table are removed first, keeping the oldest row.
+-- Run with: psql -d plant_monitor -f migrate_recording_dedup.sql
+
+BEGIN;
+
+DELETE FROM recording AS duplicate
+USING recording AS original
+WHERE duplicate.plant_id = original.plant_id
+AND duplicate.recorded = original.recorded
+AND duplicate.id > original.id;
+
+DROP INDEX IF EXISTS recording_plant_id_recorded_idx;
+
+CREATE UNIQUE INDEX recording_plant_id_recorded_idx ON recording (plant_id, recorded);
+
+COMMIT;
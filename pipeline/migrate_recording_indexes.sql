@@ -0,0 +1,6 @@
+-- Adds the recording indexes from create_tables.sql to an existing database.
+-- Run with: psql -d plant_monitor -f migrate_recording_indexes.sql
+
+CREATE INDEX IF NOT EXISTS recording_recorded_idx ON recording (recorded);
+
+CREATE INDEX IF NOT EXISTS recording_plant_id_recorded_idx ON recording (plant_id, recorded);
@@ -0,0 +1,46 @@
+-- Adds the summary tables maintained by load.py and fills them from the
+-- recordings already in the database.
+-- Run with: psql -d plant_monitor -f migrate_summary_tables.sql
+
+CREATE TABLE IF NOT EXISTS plant_latest_reading (
+    plant_id SMALLINT NOT NULL,
+    recorded TIMESTAMPTZ NOT NULL,
+    temperature FLOAT NOT NULL,
+    soil_moisture FLOAT NOT NULL,
+    watered TIMESTAMPTZ NOT NULL,
+    sunlight SUNLIGHT_TYPES,
+    PRIMARY KEY (plant_id),
+    FOREIGN KEY (plant_id) REFERENCES plant (id)
+);
+
+CREATE TABLE IF NOT EXISTS recording_hourly (
+    plant_id SMALLINT NOT NULL,
+    hour TIMESTAMPTZ NOT NULL,
+    readings INT NOT NULL,
+    temperature_min FLOAT NOT NULL,
+    temperature_avg FLOAT NOT NULL,
+    temperature_max FLOAT NOT NULL,
+    soil_moisture_min FLOAT NOT NULL,
+    soil_moisture_avg FLOAT NOT NULL,
+    soil_moisture_max FLOAT NOT NULL,
+    PRIMARY KEY (plant_id, hour),
+    FOREIGN KEY (plant_id) REFERENCES plant (id)
+);
+
+CREATE INDEX IF NOT EXISTS recording_hourly_hour_idx ON recording_hourly (hour);
+
+INSERT INTO plant_latest_reading (plant_id, recorded, temperature, soil_moisture, watered, sunlight)
+SELECT DISTINCT ON (plant_id) plant_id, recorded, temperature, soil_moisture, watered, sunlight
+FROM recording
+ORDER BY plant_id, recorded DESC
+ON CONFLICT (plant_id) DO NOTHING;
+
+INSERT INTO recording_hourly
+    (plant_id, hour, readings, temperature_min, temperature_avg, temperature_max,
+     soil_moisture_min, soil_moisture_avg, soil_moisture_max)
+SELECT plant_id, date_trunc('hour', recorded), COUNT(*),
+    MIN(temperature), AVG(temperature), MAX(temperature),
+    MIN(soil_moisture), AVG(soil_moisture), MAX(soil_moisture)
+FROM recording
+GROUP BY 1, 2
+ON CONFLICT (plant_id, hour) DO NOTHING;
@@ -0,0 +1,157 @@
+"""Keeps the recording table to its retention window at a flat cost per tick,
+either by dropping whole daily partitions or by deleting in small indexed batches"""
+from datetime import date, datetime, time, timedelta, timezone
+from psycopg2.errors import CheckViolation
+from psycopg2.extensions import connection
+
+RETENTION = timedelta(days=1)
+PARTITION_DAYS_AHEAD = 2
+DELETE_BATCH_SIZE = 5000
+PARTITION_PREFIX = "recording_"
+ARCHIVE_WATERMARK = "recording_archive"
+
+_known_partitions = set()
+
+
+def is_partitioned(conn: connection) -> bool:
+    """Checks whether the recording table is partitioned by time"""
+    with conn.cursor() as cur:
+        cur.execute("""SELECT EXISTS (
+                        SELECT 1 FROM pg_partitioned_table
+                        JOIN pg_class ON pg_class.oid = pg_partitioned_table.partrelid
+                        WHERE pg_class.relname = 'recording') AS partitioned;""")
+        return cur.fetchone()["partitioned"]
+
+
+def partition_name(day: date) -> str:
+    """Returns the name of the partition holding a UTC day's recordings"""
+    return f"{PARTITION_PREFIX}{day:%Y%m%d}"
+
+
+def partition_day(name: str) -> date | None:
+    """Returns the UTC day a partition covers, or None for the default partition"""
+    try:
+        return datetime.strptime(name[len(PARTITION_PREFIX):], "%Y%m%d").date()
+    except ValueError:
+        return None
+
+
+def day_start(day: date) -> datetime:
+    """Returns midnight UTC at the start of a day"""
+    return datetime.combine(day, time.min, tzinfo=timezone.utc)
+
+
+def ensure_partitions(conn: connection, now: datetime,
+                      days_ahead: int = PARTITION_DAYS_AHEAD):
+    """Creates the daily partitions from today up to days_ahead days from now.
+    A day whose recordings already sit in the default partition cannot get its
+    own partition; it is reported and left in the default partition."""
+    today = now.astimezone(timezone.utc).date()
+    with conn.cursor() as cur:
+        for offset in range(days_ahead + 1):
+            day = today + timedelta(days=offset)
+            name = partition_name(day)
+            if name in _known_partitions:
+                continue
+            try:
+                cur.execute(f"""CREATE TABLE IF NOT EXISTS {name} PARTITION OF recording
+                            FOR VALUES FROM (%s) TO (%s);""",
+                            (day_start(day), day_start(day + timedelta(days=1))))
+                conn.commit()
+            except CheckViolation as err:
+                conn.rollback()
+                print(f"could not create partition {name}, its recordings stay in "
+                      f"the default partition: {err}")
+            _known_partitions.add(name)
+
+
+def prepare_partitions(conn: connection, now: datetime = None,
+                       days_ahead: int = PARTITION_DAYS_AHEAD):
+    """Makes sure the partitions for the coming recordings exist before they
+    are inserted. Costs nothing once this process has seen them all."""
+    if now is None:
+        now = datetime.now(timezone.utc)
+
+    today = now.astimezone(timezone.utc).date()
+    names = {partition_name(today + timedelta(days=offset)) for offset in range(days_ahead + 1)}
+    if names <= _known_partitions:
+        return
+    if is_partitioned(conn):
+        ensure_partitions(conn, now, days_ahead)
+
+
+def list_partitions(conn: connection) -> list[str]:
+    """Returns the names of every partition of the recording table"""
+    with conn.cursor() as cur:
+        cur.execute("""SELECT child.relname FROM pg_inherits
+                    JOIN pg_class AS child ON child.oid = pg_inherits.inhrelid
+                    JOIN pg_class AS parent ON parent.oid = pg_inherits.inhparent
+                    WHERE parent.relname = 'recording';""")
+        return [row["relname"] for row in cur.fetchall()]
+
+
+def drop_expired_partitions(conn: connection, now: datetime,
+                            retention: timedelta = RETENTION) -> list[str]:
+    """Drops every daily partition whose whole day is older than the retention window"""
+    cutoff = now - retention
+    expired = [name for name in list_partitions(conn)
+               if partition_day(name) is not None
+               and day_start(partition_day(name) + timedelta(days=1)) <= cutoff]
+
+    with conn.cursor() as cur:
+        for name in expired:
+            cur.execute(f"DROP TABLE IF EXISTS {name};")
+            _known_partitions.discard(name)
+    conn.commit()
+    return expired
+
+
+def delete_in_batches(conn: connection, now: datetime, retention: timedelta = RETENTION,
+                      batch_size: int = DELETE_BATCH_SIZE) -> int:
+    """Deletes expired recordings batch_size rows at a time using the index
+    on recorded, committing between batches to keep locks short"""
+    deleted = 0
+    with conn.cursor() as cur:
+        while True:
+            cur.execute("""DELETE FROM recording
+                        WHERE (id, recorded) IN (
+                            SELECT id, recorded FROM recording
+                            WHERE recorded < %s
+                            ORDER BY recorded
+                            LIMIT %s);""", (now - retention, batch_size))
+            conn.commit()
+            deleted += cur.rowcount
+            if cur.rowcount < batch_size:
+                return deleted
+
+
+def archive_watermark(conn: connection, name: str = ARCHIVE_WATERMARK) -> datetime | None:
+    """Returns the recorded time up to which the lambda has archived recordings,
+    or None if no export has run or the watermark table does not exist"""
+    with conn.cursor() as cur:
+        cur.execute("SELECT to_regclass('archive_watermark') IS NOT NULL AS present;")
+        if not cur.fetchone()["present"]:
+            return None
+        cur.execute("SELECT recorded FROM archive_watermark WHERE name = %s;", (name,))
+        row = cur.fetchone()
+    return row["recorded"] if row else None
+
+
+def purge(conn: connection, now: datetime = None, retention: timedelta = RETENTION,
+          batch_size: int = DELETE_BATCH_SIZE) -> int:
+    """Removes recordings older than the retention window. On a partitioned
+    table whole expired days are dropped first and only the rows left in the
+    boundary partition are deleted in batches. Recordings the archive export
+    has not reached yet are kept, however old, so none are lost between exports."""
+    if now is None:
+        now = datetime.now(timezone.utc)
+
+    watermark = archive_watermark(conn)
+    if watermark is not None and watermark < now - retention:
+        retention = now - watermark
+
+    if is_partitioned(conn):
+        ensure_partitions(conn, now)
+        drop_expired_partitions(conn, now, retention)
+
+    return delete_in_batches(conn, now, retention, batch_size)
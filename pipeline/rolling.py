@@ -0,0 +1,85 @@
+"""Keeps a rolling window of recent temperatures per plant in memory"""
+from collections import defaultdict, deque
+from datetime import datetime, timedelta, timezone
+from typing import Iterable
+import pandas as pd
+from psycopg2.extensions import connection
+
+WINDOW = timedelta(minutes=15)
+
+
+class RollingTemperatures:
+    """Ring buffer of recent temperatures for each plant with a running total,
+    so the window mean is kept up to date in O(1) per reading"""
+
+    def __init__(self, window: timedelta = WINDOW):
+        self.window = window
+        self.readings = defaultdict(deque)
+        self.totals = defaultdict(float)
+        self.seeded = False
+
+    def seed(self, conn: connection):
+        """Loads the readings already inside the window from the database"""
+        with conn.cursor() as cur:
+            cur.execute("""SELECT plant.plant_id, recording.recorded, recording.temperature
+                        FROM recording
+                        JOIN plant ON recording.plant_id = plant.id
+                        WHERE recorded > NOW() - interval '15 minutes'
+                        ORDER BY recording.recorded ASC""")
+            for row in cur.fetchall():
+                self.add(row["plant_id"], row["recorded"], row["temperature"])
+        self.seeded = True
+
+    def add(self, plant_id: int, recorded: datetime, temperature: float):
+        """Adds one reading to a plant's window. A reading no newer than the
+        plant's last is skipped: the API repeats a reading until the sensor
+        updates, and the recording table keeps only one of them"""
+        readings = self.readings[plant_id]
+        if readings and recorded <= readings[-1][0]:
+            return
+        temperature = round(float(temperature), 3)
+        readings.append((recorded, temperature))
+        self.totals[plant_id] += temperature
+
+    def update(self, dataframe: pd.DataFrame):
+        """Adds the readings accepted this tick"""
+        for plant_id, recorded, temperature in zip(dataframe["plant_id"],
+                                                   dataframe["recording_taken"],
+                                                   dataframe["temperature"]):
+            self.add(int(plant_id), recorded, temperature)
+
+    def update_records(self, records: Iterable):
+        """Adds the readings accepted this tick by the stream engine"""
+        for record in records:
+            self.add(record.plant_id, record.recording_taken, record.temperature)
+
+    def expire(self, now: datetime = None):
+        """Drops readings that have fallen out of the window"""
+        if now is None:
+            now = datetime.now(timezone.utc)
+        cutoff = now - self.window
+
+        for plant_id in list(self.readings):
+            readings = self.readings[plant_id]
+            while readings and readings[0][0] <= cutoff:
+                _, temperature = readings.popleft()
+                self.totals[plant_id] -= temperature
+            if not readings:
+                del self.readings[plant_id]
+                del self.totals[plant_id]
+
+    def mean_by_plant(self, now: datetime = None) -> dict:
+        """Returns the average temperature for each plant_id in the window"""
+        self.expire(now)
+        return {plant_id: self.totals[plant_id] / len(readings)
+                for plant_id, readings in self.readings.items()}
+
+    def averages(self, now: datetime = None) -> pd.DataFrame:
+        """Returns the average temperature by plant, in the same shape as
+        transform.get_averages_from_db"""
+        means = self.mean_by_plant(now)
+        plant_ids = sorted(means)
+        return pd.DataFrame({
+            "plant_id": pd.Series(plant_ids, dtype="int64"),
+            "avg": pd.Series([means[plant_id] for plant_id in plant_ids], dtype="float64")
+        })
@@ -0,0 +1,96 @@
+"""Runs the ETL on a fixed tick grid, extracting the next tick's data
+while the previous tick is still being loaded"""
+import time
+import threading
+from queue import Queue, Full
+import metrics
+
+TICK_SECONDS = 60
+QUEUE_SIZE = 2
+
+_STOP = object()
+
+
+class TickScheduler:
+    """Calls extract on every tick of a fixed grid and hands each batch to load
+    on a separate thread through a bounded queue. Ticks that overrun are
+    reported and their missed slots skipped, so the grid never drifts."""
+
+    def __init__(self, extract, load, interval: float = TICK_SECONDS,
+                 queue_size: int = QUEUE_SIZE):
+        self.extract = extract
+        self.load = load
+        self.interval = interval
+        self.queue = Queue(maxsize=queue_size)
+        self.stop_event = threading.Event()
+        self.overruns = 0
+        self.dropped = 0
+        self.error = None
+
+    def stop(self):
+        """Asks the scheduler to finish after the current tick"""
+        self.stop_event.set()
+
+    def run(self, max_ticks: int = None):
+        """Runs until stopped, or until max_ticks slots of the grid have passed"""
+        loader = threading.Thread(target=self.load_batches, daemon=True)
+        loader.start()
+        try:
+            self.extract_batches(max_ticks)
+        finally:
+            while loader.is_alive():
+                try:
+                    self.queue.put(_STOP, timeout=0.1)
+                    break
+                except Full:
+                    continue
+            loader.join()
+
+        if self.error is not None:
+            raise self.error
+
+    def extract_batches(self, max_ticks: int = None):
+        """Extracts a batch on each tick and queues it for loading"""
+        start = time.monotonic()
+        tick = 0
+        while not self.stop_event.is_set() and (max_ticks is None or tick < max_ticks):
+            batch = self.extract()
+            next_slot = start + (tick + 1) * self.interval
+
+            try:
+                self.queue.put(batch, timeout=max(0.0, next_slot - time.monotonic()))
+            except Full:
+                self.dropped += 1
+                metrics.increment("batches_dropped")
+                print(f"tick {tick}: load is behind, dropping this tick's batch")
+
+            now = time.monotonic()
+            missed = 0
+            if now > next_slot:
+                missed = int((now - next_slot) // self.interval) + 1
+                self.overruns += 1
+                metrics.increment("ticks_overrun")
+                print(f"tick {tick}: overran by {now - next_slot:.2f}s, "
+                      f"skipping {missed} tick(s)")
+
+            tick += 1 + missed
+            self.stop_event.wait(max(0.0, start + tick * self.interval - time.monotonic()))
+
+    def load_batches(self):
+        """Loads queued batches until told to stop"""
+        while True:
+            batch = self.queue.get()
+            if batch is _STOP:
+                return
+
+            started = time.monotonic()
+            try:
+                self.load(batch)
+            except Exception as err:
+                self.error = err
+                self.stop()
+                return
+
+            elapsed = time.monotonic() - started
+            if elapsed > self.interval:
+                print(f"load took {elapsed:.2f}s, longer than the {self.interval}s tick")
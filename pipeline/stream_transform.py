@@ -0,0 +1,87 @@
+"""Cleans plant records one at a time without pandas, applying the same
+rules as the DataFrame functions in transform.py"""
+from datetime import datetime
+from email.utils import parsedate_to_datetime
+from typing import Iterable, Iterator, Mapping, NamedTuple
+import pytz
+
+GMT = pytz.timezone("Europe/London")
+
+
+class CleanRecord(NamedTuple):
+    """A cleaned plant reading, with the columns write_columns expects"""
+    botanist_name: str
+    email: str
+    phone: str
+    plant_name: str
+    scientific_name: object
+    cycle: object
+    plant_id: int
+    recording_taken: datetime
+    temperature: float
+    soil_moisture: float
+    last_watered: datetime
+    sunlight: str
+
+
+def convert_sunlight(sunlight:list)->str:
+    """Function that converts the sunlight to an appropriate format"""
+
+    if isinstance(sunlight,list):
+        sunlight = [s.lower() for s in sunlight]
+
+        if any(sun in ['part shade', 'part sun', 'part sun/part shade'] for sun in sunlight):
+            return "partial_sun"
+
+        if "full sun" in sunlight:
+            return "full_sun"
+
+        if "full shade" in sunlight:
+            return "full_shade"
+
+    return None
+
+
+def convert_recording_taken(recording_taken: str) -> datetime:
+    """Reads the UTC recording time and converts it to London time"""
+    recorded = datetime.fromisoformat(recording_taken)
+    return pytz.utc.localize(recorded).astimezone(GMT)
+
+
+def convert_last_watered(last_watered: str) -> datetime:
+    """Reads the watering time as London wall-clock time, as the pandas path does"""
+    watered = parsedate_to_datetime(last_watered).replace(tzinfo=None)
+    return GMT.localize(watered)
+
+
+def is_valid_reading(soil_moisture, temperature, average) -> bool:
+    """Applies the moisture and outlier temperature rules"""
+    if soil_moisture is None or not soil_moisture >= 0:
+        return False
+    if average is None or temperature is None:
+        return False
+    return 0.75 * average <= temperature <= 1.25 * average
+
+
+def clean_records(records: Iterable[dict],
+                  average_temps: Mapping[int, float]) -> Iterator[CleanRecord]:
+    """Yields a CleanRecord for each raw API record that passes cleaning"""
+    for record in records:
+        plant_id = record["plant_id"]
+        if not is_valid_reading(record.get("soil_moisture"), record.get("temperature"),
+                                average_temps.get(plant_id)):
+            continue
+
+        botanist = record["botanist"]
+        yield CleanRecord(botanist_name=botanist["name"],
+                          email=botanist["email"],
+                          phone=botanist["phone"],
+                          plant_name=record["name"],
+                          scientific_name=record.get("scientific_name"),
+                          cycle=record.get("cycle"),
+                          plant_id=plant_id,
+                          recording_taken=convert_recording_taken(record["recording_taken"]),
+                          temperature=record["temperature"],
+                          soil_moisture=record["soil_moisture"],
+                          last_watered=convert_last_watered(record["last_watered"]),
+                          sunlight=convert_sunlight(record.get("sunlight")))
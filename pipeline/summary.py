@@ -0,0 +1,118 @@
+"""Keeps the summary tables read by the dashboard in step with the recording
+table: each plant's latest reading and hourly aggregates per plant"""
+from datetime import datetime, timedelta
+import pandas as pd
+from psycopg2.extensions import connection
+from psycopg2.extras import execute_values
+
+SUMMARY_RETENTION = timedelta(days=30)
+SUMMARY_COLUMNS = ["plant_id", "recording_taken", "temperature", "soil_moisture",
+                   "last_watered", "sunlight"]
+
+
+def prepare_recordings(dataframe: pd.DataFrame, plant_ids: dict) -> pd.DataFrame:
+    """Returns recordings with plant ids resolved and values as stored in
+    the recording table, dropping any unknown plant"""
+    recordings = dataframe[SUMMARY_COLUMNS].copy()
+    recordings["plant_id"] = recordings["plant_id"].map(plant_ids)
+    recordings = recordings.dropna(subset=["plant_id", "recording_taken"])
+    recordings["plant_id"] = recordings["plant_id"].astype(int)
+    recordings["recording_taken"] = pd.to_datetime(recordings["recording_taken"], utc=True)
+    recordings["last_watered"] = pd.to_datetime(recordings["last_watered"], utc=True)
+    recordings["temperature"] = recordings["temperature"].round(3)
+    recordings["soil_moisture"] = recordings["soil_moisture"].round(3)
+    recordings["sunlight"] = recordings["sunlight"].fillna("Null")
+    return recordings
+
+
+def latest_readings(recordings: pd.DataFrame) -> list[tuple]:
+    """Returns the newest recording of each plant as rows to upsert"""
+    latest = recordings.sort_values("recording_taken").drop_duplicates("plant_id", keep="last")
+    return list(latest.astype(object).itertuples(index=False, name=None))
+
+
+def hour_range(recordings: pd.DataFrame) -> tuple[datetime, datetime]:
+    """Returns the start of the first hour and the end of the last hour covered"""
+    start = recordings["recording_taken"].min().floor("h")
+    end = recordings["recording_taken"].max().floor("h") + pd.Timedelta(hours=1)
+    return start.to_pydatetime(), end.to_pydatetime()
+
+
+def update_summaries(conn: connection, dataframe: pd.DataFrame, plant_ids: dict):
+    """Upserts the latest reading of each plant in a batch and recomputes the
+    hourly aggregates of the hours it touched. The hours are rebuilt from the
+    recording table, so loading the same recordings again changes nothing."""
+    recordings = prepare_recordings(dataframe, plant_ids)
+    if recordings.empty:
+        return
+
+    start, end = hour_range(recordings)
+    write_summaries(conn, latest_readings(recordings),
+                    sorted(recordings["plant_id"].unique().tolist()), start, end)
+
+
+def update_summaries_from_rows(conn: connection, rows: list[tuple]):
+    """Does the same as update_summaries for recording rows, as copied into the
+    recording table, without building a DataFrame"""
+    if not rows:
+        return
+
+    latest = {}
+    for recorded, temperature, soil_moisture, watered, sunlight, plant_id in rows:
+        if plant_id not in latest or latest[plant_id][1] < recorded:
+            latest[plant_id] = (plant_id, recorded, temperature, soil_moisture,
+                                watered, sunlight)
+    recorded = [row[0] for row in rows]
+    start = min(recorded).replace(minute=0, second=0, microsecond=0)
+    end = max(recorded).replace(minute=0, second=0, microsecond=0) + timedelta(hours=1)
+    write_summaries(conn, list(latest.values()), sorted(latest), start, end)
+
+
+def write_summaries(conn: connection, latest: list[tuple], plant_ids: list,
+                    start: datetime, end: datetime):
+    """Upserts the latest readings and rebuilds the plants' hours from start to end.
+    A stored hour is only replaced by one built from at least as many readings:
+    once retention has purged an hour's recordings, replaying some of them (as a
+    backfill of old data does) would otherwise overwrite it from partial data."""
+    with conn.cursor() as cur:
+        execute_values(cur, """
+            INSERT INTO plant_latest_reading
+                (plant_id, recorded, temperature, soil_moisture, watered, sunlight)
+            VALUES %s
+            ON CONFLICT (plant_id) DO UPDATE SET
+                recorded = EXCLUDED.recorded,
+                temperature = EXCLUDED.temperature,
+                soil_moisture = EXCLUDED.soil_moisture,
+                watered = EXCLUDED.watered,
+                sunlight = EXCLUDED.sunlight
+            WHERE plant_latest_reading.recorded < EXCLUDED.recorded;
+            """, latest)
+        cur.execute("""
+            INSERT INTO recording_hourly
+                (plant_id, hour, readings, temperature_min, temperature_avg,
+                 temperature_max, soil_moisture_min, soil_moisture_avg, soil_moisture_max)
+            SELECT plant_id, date_trunc('hour', recorded), COUNT(*),
+                MIN(temperature), AVG(temperature), MAX(temperature),
+                MIN(soil_moisture), AVG(soil_moisture), MAX(soil_moisture)
+            FROM recording
+            WHERE plant_id = ANY(%s) AND recorded >= %s AND recorded < %s
+            GROUP BY 1, 2
+            ON CONFLICT (plant_id, hour) DO UPDATE SET
+                readings = EXCLUDED.readings,
+                temperature_min = EXCLUDED.temperature_min,
+                temperature_avg = EXCLUDED.temperature_avg,
+                temperature_max = EXCLUDED.temperature_max,
+                soil_moisture_min = EXCLUDED.soil_moisture_min,
+                soil_moisture_avg = EXCLUDED.soil_moisture_avg,
+                soil_moisture_max = EXCLUDED.soil_moisture_max
+            WHERE recording_hourly.readings <= EXCLUDED.readings;
+            """, (plant_ids, start, end))
+
+    conn.commit()
+
+
+def purge_hourly(conn: connection, now: datetime, retention: timedelta = SUMMARY_RETENTION):
+    """Deletes hourly aggregates older than the summary retention window"""
+    with conn.cursor() as cur:
+        cur.execute("DELETE FROM recording_hourly WHERE hour < %s;", (now - retention,))
+    conn.commit()
@@ -0,0 +1,208 @@
+# pylint: skip-file
+"""Unit tests for backfill.py, plus an end to end replay against a local
+Postgres given by TEST_DATABASE_URL, e.g.
+    TEST_DATABASE_URL=postgresql://postgres@localhost/postgres pytest test_backfill.py"""
+import os
+import json
+from datetime import datetime, timedelta
+from unittest.mock import MagicMock, patch
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+import pytest
+import psycopg2
+from psycopg2.extras import RealDictCursor
+
+from backfill import (list_files, chunked, reference_temperatures, transform_payloads,
+                      transform_archive, run_transforms, backfill, load_archive_chunk,
+                      read_archive_chunks)
+from load import DimensionCache
+
+DATABASE_URL = os.environ.get("TEST_DATABASE_URL")
+SCHEMA = "backfill_test"
+BOTANIST = {"name": "Botanist", "email": "botanist@gardens.com", "phone": "123456"}
+
+
+def make_payload(plant_id: int, minute: int, temperature: float = 12.0) -> dict:
+    recorded = datetime(2023, 8, 29, 13, 0) + timedelta(minutes=minute)
+    return {"botanist": BOTANIST, "name": f"Plant {plant_id}", "scientific_name": None,
+            "cycle": None, "plant_id": plant_id, "recording_taken": str(recorded),
+            "temperature": temperature, "soil_moisture": 30.0,
+            "last_watered": "Mon, 28 Aug 2023 14:56:18 GMT", "sunlight": ["full sun"]}
+
+
+def write_payloads(directory, ticks: int, plants: int = 3):
+    for minute in range(ticks):
+        with open(directory / f"plants_{minute:04d}.json", "w") as file:
+            json.dump([make_payload(plant_id, minute) for plant_id in range(plants)], file)
+
+
+def test_list_files_splits_payloads_and_archives(tmp_path):
+    for name in ["b.json", "a.json", "plant_x_data.csv", "plant_y_data.csv.gz", "notes.txt"]:
+        (tmp_path / name).write_text("")
+
+    payloads, archives = list_files(tmp_path)
+
+    assert [os.path.basename(path) for path in payloads] == ["a.json", "b.json"]
+    assert [os.path.basename(path) for path in archives] == ["plant_x_data.csv",
+                                                            "plant_y_data.csv.gz"]
+
+
+def test_list_files_searches_subfolders_for_parquet(tmp_path):
+    partition = tmp_path / "parquet" / "date=2023-08-29" / "plant_id=3"
+    partition.mkdir(parents=True)
+    (partition / "part-run.parquet").write_text("")
+    (tmp_path / "plants_20230829_130000.json").write_text("")
+
+    payloads, archives = list_files(tmp_path)
+
+    assert [os.path.basename(path) for path in payloads] == ["plants_20230829_130000.json"]
+    assert archives == [str(partition / "part-run.parquet")]
+
+
+def test_read_archive_chunks_takes_plant_id_from_partition_path(tmp_path):
+    partition = tmp_path / "parquet" / "date=2023-08-29" / "plant_id=3"
+    partition.mkdir(parents=True)
+    recorded = pd.date_range("2023-08-29 13:00", periods=3, freq="min", tz="UTC")
+    pq.write_table(pa.table({
+        "general_name": pa.array(["Rose"] * 3).dictionary_encode(),
+        "recorded": recorded,
+        "temperature": pa.array([12.0, 12.5, 12.0], pa.float32()),
+        "soil_moisture": pa.array([30.0, 31.0, 32.0], pa.float32()),
+        "watered": recorded,
+        "sunlight": pa.array(["full_sun", None, "full_sun"]).dictionary_encode(),
+    }), partition / "part-run.parquet")
+
+    chunks = list(read_archive_chunks([str(partition / "part-run.parquet")], chunk_rows=2))
+    result = transform_archive(pd.concat(chunks, ignore_index=True))
+
+    assert [len(chunk) for chunk in chunks] == [2, 1]
+    assert set(result["plant_id"]) == {3}
+    assert result["sunlight"].fillna("Null").tolist() == ["full_sun", "Null", "full_sun"]
+
+
+def test_chunked():
+    assert list(chunked([1, 2, 3, 4, 5], 2)) == [[1, 2], [3, 4], [5]]
+
+
+def test_reference_temperatures_is_median_per_plant():
+    dataframe = pd.DataFrame({"plant_id": [1, 1, 1, 2], "temperature": [10, 11, 90, 5]})
+
+    result = reference_temperatures(dataframe)
+
+    assert result.to_dict("records") == [{"plant_id": 1, "avg": 11}, {"plant_id": 2, "avg": 5}]
+
+
+def test_transform_payloads_cleans_and_drops_outliers(tmp_path):
+    write_payloads(tmp_path, ticks=4, plants=2)
+    with open(tmp_path / "spike.json", "w") as file:
+        json.dump([make_payload(0, 10, temperature=99.0)], file)
+    payloads, _ = list_files(tmp_path)
+
+    result = transform_payloads(payloads)
+
+    assert len(result) == 8
+    assert set(result["sunlight"]) == {"full_sun"}
+    assert str(result["recording_taken"].iloc[0]) == "2023-08-29 14:00:00+01:00"
+
+
+def test_transform_archive_renames_and_cleans():
+    dataframe = pd.DataFrame({
+        "plant_id": [3, 3, 3, 4],
+        "general_name": ["Rose"] * 4,
+        "recorded": ["2023-08-29 13:00:00+00:00", "2023-08-29 13:01:00+00:00",
+                     "2023-08-29 13:02:00+00:00", None],
+        "temperature": [12.0, 12.5, 12.0, None],
+        "soil_moisture": [30.0, -1.0, 31.0, None],
+        "watered": ["2023-08-29 09:00:00+00:00"] * 4,
+        "sunlight": ["full_sun"] * 4,
+    })
+
+    result = transform_archive(dataframe)
+
+    assert list(result["soil_moisture"]) == [30.0, 31.0]
+    assert {"plant_name", "recording_taken", "last_watered"} <= set(result.columns)
+
+
+def test_run_transforms_keeps_task_order_in_process_pool():
+    tasks = [(abs, -number, "load") for number in range(10)]
+
+    results = list(run_transforms(tasks, workers=2))
+
+    assert results == [(number, "load") for number in range(10)]
+
+
+def test_load_archive_chunk_maps_known_database_ids():
+    conn = MagicMock()
+    cache = DimensionCache()
+    cache.plant_ids = {10: 3}
+    cache.warmed = True
+
+    with patch("backfill.write_to_recording_table_with_ids", return_value=2) as mock_write, \
+            patch("backfill.update_summaries") as mock_summaries:
+        inserted = load_archive_chunk(conn, pd.DataFrame(), cache)
+
+    assert inserted == 2
+    assert mock_write.call_args[0][2] == {3: 3}
+    assert mock_summaries.call_count == 1
+
+
+@pytest.fixture
+def conn():
+    if DATABASE_URL is None:
+        pytest.skip("TEST_DATABASE_URL is not set")
+
+    conn = psycopg2.connect(DATABASE_URL, cursor_factory=RealDictCursor,
+                            options=f"-c search_path={SCHEMA}")
+    with open(os.path.join(os.path.dirname(__file__), "create_tables.sql")) as file:
+        schema_sql = file.read().split("\\c plant_monitor;", 1)[1]
+    with conn.cursor() as cur:
+        cur.execute(f"DROP SCHEMA IF EXISTS {SCHEMA} CASCADE;")
+        cur.execute(f"CREATE SCHEMA {SCHEMA};")
+        cur.execute(schema_sql)
+    conn.commit()
+
+    yield conn
+
+    conn.rollback()
+    with conn.cursor() as cur:
+        cur.execute(f"DROP SCHEMA IF EXISTS {SCHEMA} CASCADE;")
+    conn.commit()
+    conn.close()
+
+
+def test_backfill_is_idempotent(conn, tmp_path):
+    write_payloads(tmp_path, ticks=120, plants=5)
+
+    first = backfill(conn, tmp_path, workers=2, chunk_files=30)
+    second = backfill(conn, tmp_path, workers=2, chunk_files=30)
+
+    with conn.cursor() as cur:
+        cur.execute("SELECT COUNT(*) AS total FROM recording;")
+        total = cur.fetchone()["total"]
+        cur.execute("SELECT SUM(readings) AS readings FROM recording_hourly;")
+        readings = cur.fetchone()["readings"]
+    assert first["inserted"] == 600
+    assert second["inserted"] == 0
+    assert total == 600
+    assert readings == 600
+
+
+def test_backfill_rerun_after_purge_keeps_hourly_summaries(conn, tmp_path):
+    full, partial = tmp_path / "full", tmp_path / "partial"
+    full.mkdir()
+    partial.mkdir()
+    write_payloads(full, ticks=60, plants=5)
+    write_payloads(partial, ticks=20, plants=5)
+
+    backfill(conn, full, workers=1)
+    with conn.cursor() as cur:
+        cur.execute("DELETE FROM recording;")
+    conn.commit()
+    rerun = backfill(conn, partial, workers=1)
+
+    with conn.cursor() as cur:
+        cur.execute("SELECT SUM(readings) AS readings FROM recording_hourly;")
+        readings = cur.fetchone()["readings"]
+    assert rerun["inserted"] == 100
+    assert readings == 300
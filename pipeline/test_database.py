@@ -0,0 +1,68 @@
+# pylint: skip-file
+import psycopg2
+import pytest
+from unittest.mock import MagicMock, patch
+
+from database import is_healthy, checkout_connection, pooled_connection
+
+
+def test_is_healthy_open_connection():
+    conn = MagicMock()
+    conn.closed = 0
+
+    assert is_healthy(conn)
+    assert conn.cursor().__enter__().execute.call_count == 1
+
+
+def test_is_healthy_closed_connection():
+    conn = MagicMock()
+    conn.closed = 1
+
+    assert not is_healthy(conn)
+
+
+def test_is_healthy_dropped_connection():
+    conn = MagicMock()
+    conn.closed = 0
+    conn.cursor().__enter__().execute.side_effect = psycopg2.OperationalError
+
+    assert not is_healthy(conn)
+
+
+def test_checkout_connection_replaces_dropped_connection():
+    dropped = MagicMock()
+    dropped.closed = 1
+    fresh = MagicMock()
+    fresh.closed = 0
+    pool = MagicMock()
+    pool.getconn.side_effect = [dropped, fresh]
+
+    assert checkout_connection(pool) is fresh
+    pool.putconn.assert_called_once_with(dropped, close=True)
+
+
+@patch('database.get_pool')
+def test_pooled_connection_returns_connection(mock_get_pool):
+    conn = MagicMock()
+    conn.closed = 0
+    pool = mock_get_pool.return_value
+    pool.getconn.return_value = conn
+
+    with pooled_connection() as db_conn:
+        assert db_conn is conn
+
+    pool.putconn.assert_called_once_with(conn)
+
+
+@patch('database.get_pool')
+def test_pooled_connection_discards_broken_connection(mock_get_pool):
+    conn = MagicMock()
+    conn.closed = 0
+    pool = mock_get_pool.return_value
+    pool.getconn.return_value = conn
+
+    with pytest.raises(psycopg2.OperationalError):
+        with pooled_connection():
+            raise psycopg2.OperationalError("server closed the connection")
+
+    pool.putconn.assert_called_once_with(conn, close=True)
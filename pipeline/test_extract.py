@@ -1,36 +1,158 @@
 # pylint: skip-file
+import json
+import os
+import threading
+import time
 import unittest
 import requests
 import pytest
 from datetime import datetime
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
 from unittest.mock import MagicMock, patch
 from extract import load_plant_by_id, check_api_status_code, write_valid_plant_data_to_json_file
-from extract import APIException
+from extract import APIException, load_all_plants, create_session, payload_path
 
 
-@patch('extract.requests.get')
-def test_load_plant_by_id(mock_get):
+@patch('extract.get_session')
+def test_load_plant_by_id(mock_session):
     """Test that it loads the plant from the API correctly"""
     mock_response = MagicMock()
     mock_response.status_code = 200
     mock_response.json.return_value = {"id": 1, "name": "Test Plant"}
 
-    mock_get.return_value = mock_response
+    mock_session.return_value.get.return_value = mock_response
 
     plant_data = load_plant_by_id(1)
 
     assert plant_data == {"id": 1, "name": "Test Plant"}
 
 
-def test_404_api_status_code():
+def test_200_api_status_code():
     response = MagicMock()
-    response.status = 404
+    response.status_code = 200
 
-    assert check_api_status_code(response) == False
+    assert check_api_status_code(response) == True
 
 
-def test_500_api_status_code():
+@pytest.mark.parametrize("status_code", [404, 500, 503, 429])
+def test_error_api_status_code(status_code):
     response = MagicMock()
-    response.status = 500
+    response.status_code = status_code
 
-    assert check_api_status_code(response) == False
+    with pytest.raises(APIException) as err:
+        check_api_status_code(response)
+
+    assert err.value.code == status_code
+
+
+class StubPlantHandler(BaseHTTPRequestHandler):
+    """Serves /plants/<id> like the plant API: 3 is missing, 4 errors, 5 is slow,
+    6 fails with a 503 on its first request and 7 always returns a 503"""
+    flaky_requests = 0
+
+    def do_GET(self):
+        plant_id = int(self.path.rsplit("/", 1)[-1])
+        if plant_id == 6 and StubPlantHandler.flaky_requests == 0:
+            StubPlantHandler.flaky_requests += 1
+            self.send_response(503)
+            body = {"error": "unavailable"}
+        elif plant_id == 7:
+            self.send_response(503)
+            body = {"error": "unavailable"}
+        elif plant_id == 3:
+            self.send_response(404)
+            body = {"error": "plant not found"}
+        elif plant_id == 4:
+            self.send_response(500)
+            body = {"error": "server error"}
+        else:
+            if plant_id == 5:
+                time.sleep(2)
+            self.send_response(200)
+            body = {"plant_id": plant_id, "name": f"Plant {plant_id}"}
+        self.send_header("Content-Type", "application/json")
+        self.end_headers()
+        self.wfile.write(json.dumps(body).encode())
+
+    def log_message(self, format, *args):
+        pass
+
+
+@pytest.fixture
+def stub_api():
+    StubPlantHandler.flaky_requests = 0
+    server = ThreadingHTTPServer(("127.0.0.1", 0), StubPlantHandler)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield f"http://127.0.0.1:{server.server_address[1]}/plants"
+    server.shutdown()
+    server.server_close()
+
+
+def test_load_all_plants_skips_api_errors(stub_api):
+    plants = load_all_plants(plant_ids=[0, 1, 2, 3, 4], api_url=stub_api)
+
+    assert [plant["plant_id"] for plant in plants] == [0, 1, 2]
+
+
+def test_load_all_plants_drops_requests_past_deadline(stub_api):
+    plants = load_all_plants(plant_ids=[1, 5], request_timeout=0.5, api_url=stub_api)
+
+    assert [plant["plant_id"] for plant in plants] == [1]
+
+
+def test_load_all_plants_respects_tick_budget(stub_api):
+    start = time.time()
+    plants = load_all_plants(plant_ids=[1, 2, 5], tick_budget=0.5, api_url=stub_api)
+
+    assert time.time() - start < 1.5
+    assert [plant["plant_id"] for plant in plants] == [1, 2]
+
+
+def test_load_all_plants_runs_concurrently(stub_api):
+    start = time.time()
+    plants = load_all_plants(plant_ids=[5] * 4, max_workers=4, api_url=stub_api)
+
+    assert time.time() - start < 4
+    assert len(plants) == 4
+
+
+def test_session_retries_server_errors(stub_api):
+    session = create_session(retries=2, backoff_factor=0, backoff_jitter=0)
+
+    plant = load_plant_by_id(6, api_url=stub_api, session=session)
+
+    assert plant["plant_id"] == 6
+
+
+def test_session_gives_up_after_retries(stub_api):
+    session = create_session(retries=1, backoff_factor=0, backoff_jitter=0)
+
+    with pytest.raises(APIException) as err:
+        load_plant_by_id(4, api_url=stub_api, session=session)
+
+    assert err.value.code == 500
+
+
+def test_load_all_plants_skips_plant_still_unavailable_after_retries(stub_api):
+    session = create_session(retries=1, backoff_factor=0, backoff_jitter=0)
+
+    plants = load_all_plants(plant_ids=[1, 7], api_url=stub_api, session=session)
+
+    assert [plant["plant_id"] for plant in plants] == [1]
+
+
+def test_write_valid_plant_data_to_json_file_dumps_given_data(tmp_path):
+    path = tmp_path / "dump" / "live_plants.json"
+
+    write_valid_plant_data_to_json_file([{"plant_id": 1}], str(path))
+
+    assert json.loads(path.read_text()) == [{"plant_id": 1}]
+
+
+def test_payload_path_sorts_in_tick_order():
+    first = payload_path(datetime(2023, 8, 29, 9, 59, 59), "payloads")
+    second = payload_path(datetime(2023, 8, 29, 10, 0, 0), "payloads")
+
+    assert first == os.path.join("payloads", "plants_20230829_095959.json")
+    assert sorted([second, first]) == [first, second]
@@ -2,7 +2,12 @@ from load import write_to_botanist_table
 import unittest
 from unittest.mock import MagicMock, patch
 from load import write_to_botanist_table, write_to_plant_table, write_to_recording_table, write_columns
+from load import write_to_recording_table_bulk, write_to_recording_table_with_ids
+from load import DimensionCache, write_records, recording_rows
+from stream_transform import CleanRecord
+from datetime import datetime, timezone
 import psycopg2
+import pytest
 import pandas as pd
 
 
@@ -60,6 +65,32 @@ def test_write_to_recording_table():
     assert conn.commit.call_count == 1
 
 
+def test_write_to_recording_table_bulk():
+    fake_data = {
+        "recording_taken": ["2023-08-29 14:45:43+01:00", "2023-08-29 14:45:44+01:00"],
+        "temperature": [23.5, 19.5],
+        "soil_moisture": [1.3, 2.5],
+        "last_watered": ["2023-08-28 14:56:18+01:00", "2023-08-28 14:56:18+01:00"],
+        "sunlight": ["full_sun", None],
+        "plant_id": [1, 2]
+    }
+    fake_dataframe = pd.DataFrame(fake_data)
+
+    conn = MagicMock()
+    cur = conn.cursor().__enter__()
+
+    write_to_recording_table_bulk(conn, fake_dataframe)
+
+    buffer = cur.copy_expert.call_args[0][1]
+    rows = buffer.getvalue().splitlines()
+    assert cur.copy_expert.call_count == 1
+    assert cur.execute.call_count == 2
+    assert cur.executemany.call_count == 0
+    assert len(rows) == 2
+    assert rows[1].endswith(",Null,2")
+    assert conn.commit.call_count == 1
+
+
 @patch('load.write_to_botanist_table')
 @patch('load.write_to_plant_table')
 @patch('load.write_to_recording_table')
@@ -87,3 +118,226 @@ def test_write_columns_calls_write_to_functions(mock_write_to_recording, mock_wr
     assert mock_write_to_botanist.call_count == 1
     assert mock_write_to_plant.call_count == 1
     assert mock_write_to_recording.call_count == 1
+
+
+@patch('load.write_to_botanist_table')
+@patch('load.write_to_plant_table')
+@patch('load.write_to_recording_table_bulk')
+def test_write_columns_bulk_uses_copy_loader(mock_write_bulk, mock_write_to_plant, mock_write_to_botanist):
+    conn = MagicMock()
+    dataframe = pd.DataFrame({
+        "botanist_name": ["Botanist 1"],
+        "email": ["botanist1@example.com"],
+        "phone": ["1234567890"],
+        "plant_name": ["Plant 1"],
+        "scientific_name": ["Sci Name 1"],
+        "cycle": ["Annual"],
+        "plant_id": [1],
+        "recording_taken": ["2023-01-01"],
+        "temperature": [25.0],
+        "soil_moisture": [0.5],
+        "last_watered": ["2023-01-15"],
+        "sunlight": ["Partial"],
+    })
+
+    write_columns(conn, dataframe, bulk=True)
+
+    assert mock_write_bulk.call_count == 1
+
+
+def make_tick_dataframe():
+    return pd.DataFrame({
+        "botanist_name": ["Botanist 1", "Botanist 1"],
+        "email": ["botanist1@example.com", "botanist1@example.com"],
+        "phone": ["1234567890", "1234567890"],
+        "plant_name": ["Plant 1", "Plant 2"],
+        "scientific_name": ["Sci Name 1", "Sci Name 2"],
+        "cycle": ["Annual", "Perennial"],
+        "plant_id": [1, 2],
+        "recording_taken": ["2023-01-01", "2023-01-01"],
+        "temperature": [25.12345, 28.0],
+        "soil_moisture": [0.5, 0.8],
+        "last_watered": ["2023-01-15", "2023-01-15"],
+        "sunlight": ["full_sun", None],
+    })
+
+
+def test_dimension_cache_warm():
+    conn = MagicMock()
+    cur = conn.cursor().__enter__()
+    cur.fetchall.side_effect = [[{"id": 7, "botanist_name": "Botanist 1"}],
+                                [{"id": 3, "plant_id": 1}]]
+    cache = DimensionCache()
+
+    cache.warm(conn)
+
+    assert cache.botanist_ids == {"Botanist 1": 7}
+    assert cache.plant_ids == {1: 3}
+    assert cache.warmed
+
+
+@patch('load.update_summaries')
+@patch('load.write_to_botanist_table')
+@patch('load.write_to_plant_table')
+def test_write_columns_with_warm_cache_skips_dimensions(mock_write_to_plant, mock_write_to_botanist,
+                                                        mock_update_summaries):
+    conn = MagicMock()
+    cur = conn.cursor().__enter__()
+    cache = DimensionCache()
+    cache.botanist_ids = {"Botanist 1": 7}
+    cache.plant_ids = {1: 3, 2: 4}
+    cache.warmed = True
+
+    write_columns(conn, make_tick_dataframe(), cache=cache)
+
+    assert mock_write_to_botanist.call_count == 0
+    assert mock_write_to_plant.call_count == 0
+    statements = [call[0][0] for call in cur.execute.call_args_list]
+    assert not any("botanist" in sql or "FROM plant" in sql for sql in statements)
+    assert cur.copy_expert.call_count == 1
+    assert mock_update_summaries.call_args[0][2] == {1: 3, 2: 4}
+
+
+@patch('load.update_summaries')
+@patch('load.write_to_botanist_table')
+@patch('load.write_to_plant_table')
+def test_write_columns_with_cache_miss_inserts_and_refreshes(mock_write_to_plant, mock_write_to_botanist,
+                                                             mock_update_summaries):
+    conn = MagicMock()
+    cache = DimensionCache()
+    cache.botanist_ids = {"Botanist 1": 7}
+    cache.plant_ids = {1: 3}
+    cache.warmed = True
+
+    with patch.object(cache, "warm") as mock_warm:
+        write_columns(conn, make_tick_dataframe(), cache=cache)
+
+    assert mock_write_to_botanist.call_count == 0
+    assert mock_write_to_plant.call_count == 1
+    assert list(mock_write_to_plant.call_args[0][1]["plant_id"]) == [2]
+    assert mock_warm.call_count == 1
+
+
+def test_write_to_recording_table_with_ids():
+    conn = MagicMock()
+    cur = conn.cursor().__enter__()
+
+    write_to_recording_table_with_ids(conn, make_tick_dataframe(), {1: 3})
+
+    rows = cur.copy_expert.call_args[0][1].getvalue().splitlines()
+    assert rows == ["2023-01-01,25.123,0.5,2023-01-15,full_sun,3"]
+    assert conn.commit.call_count == 1
+
+
+def test_write_to_recording_table_with_ids_skips_stored_recordings():
+    conn = MagicMock()
+    cur = conn.cursor().__enter__()
+    cur.rowcount = 0
+
+    inserted = write_to_recording_table_with_ids(conn, make_tick_dataframe(), {1: 3})
+
+    assert "ON CONFLICT (plant_id, recorded) DO NOTHING" in cur.execute.call_args[0][0]
+    assert inserted == 0
+
+
+def make_tick_records():
+    recorded = datetime(2023, 1, 1, 12, tzinfo=timezone.utc)
+    watered = datetime(2023, 1, 1, 9, tzinfo=timezone.utc)
+    return [CleanRecord("Botanist 1", "botanist1@example.com", "1234567890", "Plant 1",
+                        "Sci Name 1", "Annual", 1, recorded, 25.12345, 0.5, watered, "full_sun"),
+            CleanRecord("Botanist 2", "botanist2@example.com", "0987654321", "Plant 2",
+                        None, None, 2, recorded, 28.0, 0.8, watered, None)]
+
+
+def test_recording_rows_resolves_ids_and_skips_unknown_plants():
+    rows = recording_rows(make_tick_records(), {1: 3})
+
+    assert rows == [(datetime(2023, 1, 1, 12, tzinfo=timezone.utc), 25.123, 0.5,
+                     datetime(2023, 1, 1, 9, tzinfo=timezone.utc), "full_sun", 3)]
+
+
+@patch('load.update_summaries_from_rows')
+def test_write_records_copies_tuples_without_dimensions_when_cached(mock_update_summaries):
+    conn = MagicMock()
+    cur = conn.cursor().__enter__()
+    cur.rowcount = 2
+    cache = DimensionCache()
+    cache.botanist_ids = {"Botanist 1": 7, "Botanist 2": 8}
+    cache.plant_ids = {1: 3, 2: 4}
+    cache.warmed = True
+
+    inserted = write_records(conn, make_tick_records(), cache)
+
+    rows = cur.copy_expert.call_args[0][1].getvalue().splitlines()
+    assert rows == ["2023-01-01 12:00:00+00:00,25.123,0.5,2023-01-01 09:00:00+00:00,full_sun,3",
+                    "2023-01-01 12:00:00+00:00,28.0,0.8,2023-01-01 09:00:00+00:00,Null,4"]
+    assert cur.executemany.call_count == 0
+    assert inserted == 2
+    assert len(mock_update_summaries.call_args[0][1]) == 2
+
+
+@patch('load.update_summaries_from_rows')
+@patch('load.insert_botanists')
+@patch('load.insert_plants')
+def test_write_records_inserts_unseen_dimensions_and_refreshes(mock_insert_plants,
+                                                               mock_insert_botanists,
+                                                               mock_update_summaries):
+    conn = MagicMock()
+    cache = DimensionCache()
+    cache.botanist_ids = {"Botanist 1": 7}
+    cache.plant_ids = {1: 3}
+    cache.warmed = True
+
+    with patch.object(cache, "warm") as mock_warm:
+        write_records(conn, make_tick_records(), cache)
+
+    assert mock_insert_botanists.call_args[0][1] == [("Botanist 2", "botanist2@example.com",
+                                                      "0987654321")]
+    assert mock_insert_plants.call_args[0][1] == [("Plant 2", None, None, 2, "Botanist 2")]
+    assert mock_warm.call_count == 1
+
+
+def make_warm_cache() -> DimensionCache:
+    cache = DimensionCache()
+    cache.botanist_ids = {"Botanist 1": 7, "Botanist 2": 8}
+    cache.plant_ids = {1: 3, 2: 4}
+    cache.warmed = True
+    return cache
+
+
+@patch('load.update_summaries_from_rows')
+def test_write_records_rewarms_cache_and_retries_on_stale_plant_id(mock_update_summaries):
+    conn = MagicMock()
+    cur = conn.cursor().__enter__()
+    cur.rowcount = 2
+    cur.copy_expert.side_effect = [psycopg2.errors.ForeignKeyViolation("plant 4 is gone"), None]
+    cache = make_warm_cache()
+
+    def warm(conn):
+        cache.plant_ids = {1: 3, 2: 9}
+
+    with patch.object(cache, "warm", side_effect=warm) as mock_warm:
+        inserted = write_records(conn, make_tick_records(), cache)
+
+    rows = cur.copy_expert.call_args[0][1].getvalue().splitlines()
+    assert conn.rollback.call_count == 1
+    assert mock_warm.call_count == 1
+    assert rows[1].endswith(",9")
+    assert inserted == 2
+
+
+@patch('load.update_summaries')
+def test_write_columns_with_cache_retries_once_on_foreign_key_violation(mock_update_summaries):
+    conn = MagicMock()
+    cur = conn.cursor().__enter__()
+    cur.copy_expert.side_effect = psycopg2.errors.ForeignKeyViolation("plant 4 is gone")
+    cache = make_warm_cache()
+
+    with patch.object(cache, "warm") as mock_warm, \
+            pytest.raises(psycopg2.errors.ForeignKeyViolation):
+        write_columns(conn, make_tick_dataframe(), cache=cache)
+
+    assert cur.copy_expert.call_count == 2
+    assert conn.rollback.call_count == 1
+    assert mock_warm.call_count == 1
+    assert mock_update_summaries.call_count == 0
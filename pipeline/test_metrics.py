@@ -0,0 +1,118 @@
+# pylint: skip-file
+import json
+import time
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from contextvars import copy_context
+
+import metrics
+
+
+def setup_function():
+    metrics.reset()
+
+
+def test_time_stage_records_wall_time():
+    with metrics.time_stage("extract"):
+        time.sleep(0.01)
+
+    assert metrics.snapshot()["stage_seconds"]["extract"] >= 0.01
+
+
+def test_counts_and_rows():
+    metrics.increment("plants_extracted", 3)
+    metrics.increment("plants_extracted")
+    metrics.record_rows("clean_moisture_column", 10, 8)
+
+    counts = metrics.snapshot()["counts"]
+
+    assert counts["plants_extracted"] == 4
+    assert counts["clean_moisture_column.rows_in"] == 10
+    assert counts["clean_moisture_column.rows_out"] == 8
+
+
+def test_api_latency_histogram():
+    metrics.observe_api_latency(0.03)
+    metrics.observe_api_latency(0.3)
+    metrics.observe_api_latency(30)
+
+    latency = metrics.snapshot()["api_latency"]
+
+    assert latency["count"] == 3
+    assert latency["buckets"]["le_0.05"] == 1
+    assert latency["buckets"]["le_0.5"] == 1
+    assert latency["buckets"]["le_inf"] == 1
+
+
+def test_reset_clears_metrics():
+    metrics.increment("db_statements")
+    metrics.reset()
+
+    assert metrics.snapshot()["counts"] == {}
+
+
+def test_write_appends_json_line(tmp_path):
+    path = tmp_path / "metrics.jsonl"
+    metrics.increment("rows_loaded", 2)
+
+    metrics.write(str(path))
+    metrics.write(str(path))
+
+    lines = path.read_text().splitlines()
+    assert len(lines) == 2
+    assert json.loads(lines[0])["counts"]["rows_loaded"] == 2
+
+
+def test_use_records_into_the_given_registry():
+    registry = metrics.Registry()
+
+    with metrics.use(registry):
+        metrics.increment("rows_loaded", 5)
+    metrics.increment("rows_loaded")
+
+    assert registry.snapshot()["counts"] == {"rows_loaded": 5}
+    assert metrics.snapshot()["counts"] == {"rows_loaded": 1}
+
+
+def test_concurrent_ticks_keep_their_own_metrics():
+    extracting, loading = metrics.Registry(), metrics.Registry()
+    barrier = threading.Barrier(2)
+
+    def tick(registry, name):
+        with metrics.use(registry):
+            for _ in range(100):
+                metrics.increment(name)
+            barrier.wait()
+
+    threads = [threading.Thread(target=tick, args=(extracting, "plants_extracted")),
+               threading.Thread(target=tick, args=(loading, "rows_loaded"))]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert extracting.snapshot()["counts"] == {"plants_extracted": 100}
+    assert loading.snapshot()["counts"] == {"rows_loaded": 100}
+
+
+def test_copied_context_records_into_the_same_registry():
+    registry = metrics.Registry()
+
+    with metrics.use(registry), ThreadPoolExecutor(max_workers=2) as executor:
+        for _ in range(4):
+            executor.submit(copy_context().run, metrics.increment, "plants_extracted").result()
+
+    assert registry.snapshot()["counts"] == {"plants_extracted": 4}
+
+
+def test_absorb_moves_metrics_between_registries():
+    registry = metrics.Registry()
+    registry.increment("rows_loaded", 2)
+    metrics.increment("batches_dropped")
+    metrics.observe_api_latency(0.3)
+
+    registry.absorb(metrics.default_registry())
+
+    assert registry.snapshot()["counts"] == {"rows_loaded": 2, "batches_dropped": 1}
+    assert registry.snapshot()["api_latency"]["count"] == 1
+    assert metrics.snapshot()["counts"] == {}
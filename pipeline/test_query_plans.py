@@ -0,0 +1,200 @@
+# pylint: skip-file
+"""Query plan regression suite for the hot recording queries.
+
+Runs against a local Postgres given by TEST_DATABASE_URL, e.g.
+    TEST_DATABASE_URL=postgresql://postgres@localhost/postgres pytest test_query_plans.py
+The schema from create_tables.sql is built in a throwaway schema, loaded with
+1M+ synthetic recordings, and every hot query is run under EXPLAIN ANALYZE.
+A query fails if it sequentially scans a large part of the recording table."""
+import os
+import ast
+import json
+from datetime import datetime, timedelta, timezone
+from unittest.mock import MagicMock
+import pytest
+import psycopg2
+from psycopg2.extras import RealDictCursor
+
+from transform import get_averages_from_db
+from rolling import RollingTemperatures
+from retention import delete_in_batches, partition_name, day_start
+
+DATABASE_URL = os.environ.get("TEST_DATABASE_URL")
+SCHEMA = "plan_regression"
+DAYS_OF_DATA = 14
+PLANTS = 50
+SEQ_SCAN_ROW_LIMIT = 10_000
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def sql_constant(path: str, name: str) -> str:
+    """Returns a module level SQL string from the dashboard or lambda source.
+    They run in their own images with their own dependencies, so the module is
+    parsed rather than imported and the test always sees the shipped query."""
+    with open(os.path.join(ROOT, path)) as file:
+        tree = ast.parse(file.read())
+    for node in tree.body:
+        if isinstance(node, ast.Assign) and any(getattr(target, "id", None) == name
+                                                for target in node.targets):
+            return ast.literal_eval(node.value)
+    raise KeyError(f"{name} not found in {path}")
+
+
+def capture_sql(function, *args) -> tuple:
+    """Runs a database function against a fake connection and returns
+    the first statement and parameters it executes"""
+    conn = MagicMock()
+    cur = conn.cursor().__enter__()
+    cur.fetchall.return_value = []
+    cur.rowcount = 0
+    function(conn, *args)
+    call = cur.execute.call_args_list[0][0]
+    return call[0], call[1] if len(call) > 1 else None
+
+
+def hot_queries() -> dict:
+    """Returns name -> (sql, params, must_avoid_seq_scan) for each hot query"""
+    now = datetime.now(timezone.utc)
+    export_range = (now - timedelta(hours=1), now)
+    live_series = {"bucket": 144, "plant_ids": [1, 2],
+                   "start": now - timedelta(days=1), "end": now}
+    hourly_series = {"bucket": 7200, "plant_ids": [1, 2],
+                     "start": now - timedelta(days=30), "end": now}
+    return {
+        "get_averages_from_db": (*capture_sql(get_averages_from_db), True),
+        "rolling_seed": (*capture_sql(lambda conn: RollingTemperatures().seed(conn)), True),
+        "retention_delete_batch": (*capture_sql(delete_in_batches, now), True),
+        "range_export": (sql_constant("lambda/lambda.py", "NEW_PLANT_DATA_SQL"),
+                         export_range, True),
+        "range_export_normalized": (sql_constant("lambda/lambda.py", "NEW_RECORDINGS_SQL"),
+                                    export_range, True),
+        "live_series": (sql_constant("dashboard/series.py", "LIVE_SERIES_SQL")
+                        .format(value_column="temperature"), live_series, True),
+        "hourly_series": (sql_constant("dashboard/series.py", "HOURLY_SERIES_SQL")
+                          .format(value_column="soil_moisture"), hourly_series, True),
+        # Both read every recording, so a full scan is expected.
+        "full_export": (sql_constant("lambda/lambda.py", "ALL_PLANT_DATA_SQL"), None, False),
+        "dashboard_live_data": (sql_constant("dashboard/dashboard.py", "LIVE_DATA_SQL"),
+                                None, False),
+    }
+
+
+@pytest.fixture(scope="module")
+def conn():
+    if DATABASE_URL is None:
+        pytest.skip("TEST_DATABASE_URL is not set")
+
+    conn = psycopg2.connect(DATABASE_URL, cursor_factory=RealDictCursor)
+    with open(os.path.join(os.path.dirname(__file__), "create_tables.sql")) as file:
+        schema_sql = file.read().split("\\c plant_monitor;", 1)[1]
+
+    today = datetime.now(timezone.utc).date()
+    with conn.cursor() as cur:
+        cur.execute(f"DROP SCHEMA IF EXISTS {SCHEMA} CASCADE;")
+        cur.execute(f"CREATE SCHEMA {SCHEMA};")
+        cur.execute(f"SET search_path TO {SCHEMA};")
+        cur.execute(schema_sql)
+
+        # The schema already creates today's and the next two days' partitions.
+        for offset in range(-DAYS_OF_DATA - 1, 3):
+            day = today + timedelta(days=offset)
+            cur.execute(f"""CREATE TABLE IF NOT EXISTS {partition_name(day)} PARTITION OF recording
+                        FOR VALUES FROM (%s) TO (%s);""",
+                        (day_start(day), day_start(day + timedelta(days=1))))
+
+        cur.execute("""INSERT INTO botanist (botanist_name, email, phone)
+                    SELECT 'Botanist ' || n, 'botanist' || n || '@lnhm.co.uk', '0' || n
+                    FROM generate_series(1, 5) AS n;""")
+        cur.execute("""INSERT INTO plant (plant_id, general_name, scientific_name, cycle, botanist_id)
+                    SELECT n, 'Plant ' || n, 'Plantus ' || n, 'Perennial', 1 + n % 5
+                    FROM generate_series(0, %s) AS n;""", (PLANTS - 1,))
+        cur.execute("""INSERT INTO recording (recorded, plant_id, temperature, soil_moisture, watered, sunlight)
+                    SELECT recorded, plant.id, 10 + random() * 5, random() * 50,
+                        recorded - interval '1 hour', 'full_sun'
+                    FROM plant
+                    CROSS JOIN generate_series(NOW() - %s * interval '1 day', NOW(),
+                                               interval '1 minute') AS recorded;""",
+                    (DAYS_OF_DATA,))
+        cur.execute("""INSERT INTO recording_hourly
+                        (plant_id, hour, readings, temperature_min, temperature_avg,
+                         temperature_max, soil_moisture_min, soil_moisture_avg,
+                         soil_moisture_max)
+                    SELECT plant_id, date_trunc('hour', recorded), COUNT(*),
+                        MIN(temperature), AVG(temperature), MAX(temperature),
+                        MIN(soil_moisture), AVG(soil_moisture), MAX(soil_moisture)
+                    FROM recording
+                    GROUP BY 1, 2;""")
+        cur.execute("ANALYZE;")
+    conn.commit()
+
+    yield conn
+
+    conn.rollback()
+    with conn.cursor() as cur:
+        cur.execute(f"DROP SCHEMA IF EXISTS {SCHEMA} CASCADE;")
+    conn.commit()
+    conn.close()
+
+
+def plan_nodes(plan: dict):
+    """Yields every node in an EXPLAIN (FORMAT JSON) plan tree"""
+    yield plan
+    for child in plan.get("Plans", []):
+        yield from plan_nodes(child)
+
+
+def large_recording_seq_scans(plan: dict) -> list[str]:
+    """Returns the recording relations sequentially scanned past the row limit"""
+    scans = []
+    for node in plan_nodes(plan):
+        if node["Node Type"] != "Seq Scan":
+            continue
+        if not node.get("Relation Name", "").startswith("recording"):
+            continue
+        rows = (node.get("Actual Rows", 0) + node.get("Rows Removed by Filter", 0)) \
+            * node.get("Actual Loops", 1)
+        if rows > SEQ_SCAN_ROW_LIMIT:
+            scans.append(f"{node['Relation Name']} ({rows} rows)")
+    return scans
+
+
+def explain_analyze(conn, sql: str, params) -> dict:
+    """Runs a query under EXPLAIN ANALYZE and rolls back any changes it made"""
+    with conn.cursor() as cur:
+        cur.execute(f"SET search_path TO {SCHEMA};")
+        cur.execute(f"EXPLAIN (ANALYZE, FORMAT JSON) {sql}", params)
+        result = cur.fetchone()["QUERY PLAN"]
+    conn.rollback()
+    if isinstance(result, str):
+        result = json.loads(result)
+    return result[0]["Plan"]
+
+
+def test_recording_table_is_large(conn):
+    with conn.cursor() as cur:
+        cur.execute(f"SELECT COUNT(*) AS total FROM {SCHEMA}.recording;")
+        assert cur.fetchone()["total"] >= 1_000_000
+
+
+@pytest.mark.parametrize("name", list(hot_queries()))
+def test_hot_query_plan(conn, name):
+    sql, params, must_avoid_seq_scan = hot_queries()[name]
+
+    plan = explain_analyze(conn, sql, params)
+
+    print(f"{name}: {json.dumps(plan, indent=2, default=str)}")
+    if must_avoid_seq_scan:
+        assert large_recording_seq_scans(plan) == [], f"{name} regressed to a seq scan"
+
+
+def test_large_recording_seq_scans_detects_regression():
+    plan = {"Node Type": "Hash Join", "Plans": [
+        {"Node Type": "Seq Scan", "Relation Name": "recording_20230829",
+         "Actual Rows": 20, "Rows Removed by Filter": 70_000, "Actual Loops": 1},
+        {"Node Type": "Seq Scan", "Relation Name": "recording_default",
+         "Actual Rows": 0, "Actual Loops": 1},
+        {"Node Type": "Seq Scan", "Relation Name": "plant",
+         "Actual Rows": 50_000, "Actual Loops": 1}]}
+
+    assert large_recording_seq_scans(plan) == ["recording_20230829 (70020 rows)"]
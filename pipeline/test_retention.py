@@ -0,0 +1,178 @@
+# pylint: skip-file
+from datetime import date, datetime, timedelta, timezone
+from unittest.mock import MagicMock, patch
+from psycopg2.errors import CheckViolation
+
+import retention
+from retention import (partition_name, partition_day, ensure_partitions, prepare_partitions,
+                       drop_expired_partitions, delete_in_batches, purge)
+
+NOW = datetime(2023, 8, 29, 13, 0, tzinfo=timezone.utc)
+
+
+def setup_function():
+    retention._known_partitions.clear()
+
+
+def test_partition_name_and_day():
+    assert partition_name(date(2023, 8, 29)) == "recording_20230829"
+    assert partition_day("recording_20230829") == date(2023, 8, 29)
+    assert partition_day("recording_default") is None
+
+
+def test_ensure_partitions_creates_each_day_once():
+    conn = MagicMock()
+    cur = conn.cursor().__enter__()
+
+    ensure_partitions(conn, NOW, days_ahead=2)
+    ensure_partitions(conn, NOW, days_ahead=2)
+
+    statements = [call[0][0] for call in cur.execute.call_args_list]
+    assert len(statements) == 3
+    assert "recording_20230829 PARTITION OF recording" in statements[0]
+    assert "recording_20230831 PARTITION OF recording" in statements[2]
+
+
+def test_ensure_partitions_leaves_day_already_in_default_partition():
+    conn = MagicMock()
+    cur = conn.cursor().__enter__()
+    cur.execute.side_effect = [CheckViolation(), None, None]
+
+    ensure_partitions(conn, NOW, days_ahead=2)
+
+    assert cur.execute.call_count == 3
+    assert conn.rollback.call_count == 1
+    assert conn.commit.call_count == 2
+
+
+@patch('retention.is_partitioned')
+def test_prepare_partitions_checks_catalog_until_partitions_known(mock_is_partitioned):
+    mock_is_partitioned.return_value = True
+    conn = MagicMock()
+    cur = conn.cursor().__enter__()
+
+    prepare_partitions(conn, NOW)
+    prepare_partitions(conn, NOW)
+
+    assert mock_is_partitioned.call_count == 1
+    assert cur.execute.call_count == 3
+
+
+@patch('retention.ensure_partitions')
+@patch('retention.is_partitioned')
+def test_prepare_partitions_skips_unpartitioned_table(mock_is_partitioned, mock_ensure):
+    mock_is_partitioned.return_value = False
+
+    prepare_partitions(MagicMock(), NOW)
+
+    assert mock_ensure.call_count == 0
+
+
+@patch('retention.list_partitions')
+def test_drop_expired_partitions_keeps_boundary_day(mock_list_partitions):
+    mock_list_partitions.return_value = ["recording_default", "recording_20230826",
+                                         "recording_20230827", "recording_20230828",
+                                         "recording_20230829"]
+    conn = MagicMock()
+    cur = conn.cursor().__enter__()
+
+    dropped = drop_expired_partitions(conn, NOW)
+
+    assert dropped == ["recording_20230826", "recording_20230827"]
+    assert cur.execute.call_count == 2
+
+
+def test_delete_in_batches_stops_on_short_batch():
+    conn = MagicMock()
+    cur = conn.cursor().__enter__()
+    rowcounts = iter([100, 100, 40])
+
+    def execute(sql, params):
+        cur.rowcount = next(rowcounts)
+
+    cur.execute.side_effect = execute
+
+    deleted = delete_in_batches(conn, NOW, batch_size=100)
+
+    assert deleted == 240
+    assert cur.execute.call_count == 3
+    assert conn.commit.call_count == 3
+    assert cur.execute.call_args[0][1] == (NOW - timedelta(days=1), 100)
+
+
+@patch('retention.archive_watermark', return_value=None)
+@patch('retention.delete_in_batches')
+@patch('retention.drop_expired_partitions')
+@patch('retention.ensure_partitions')
+@patch('retention.is_partitioned')
+def test_purge_unpartitioned_only_deletes(mock_is_partitioned, mock_ensure, mock_drop, mock_delete,
+                                          mock_watermark):
+    mock_is_partitioned.return_value = False
+
+    purge(MagicMock(), NOW)
+
+    assert mock_ensure.call_count == 0
+    assert mock_drop.call_count == 0
+    assert mock_delete.call_count == 1
+
+
+@patch('retention.archive_watermark', return_value=None)
+@patch('retention.delete_in_batches')
+@patch('retention.drop_expired_partitions')
+@patch('retention.ensure_partitions')
+@patch('retention.is_partitioned')
+def test_purge_partitioned_drops_then_deletes(mock_is_partitioned, mock_ensure, mock_drop, mock_delete,
+                                              mock_watermark):
+    mock_is_partitioned.return_value = True
+
+    purge(MagicMock(), NOW)
+
+    assert mock_ensure.call_count == 1
+    assert mock_drop.call_count == 1
+    assert mock_delete.call_count == 1
+
+
+@patch('retention.delete_in_batches')
+@patch('retention.drop_expired_partitions')
+@patch('retention.ensure_partitions')
+@patch('retention.is_partitioned')
+@patch('retention.archive_watermark')
+def test_purge_keeps_recordings_not_yet_archived(mock_watermark, mock_is_partitioned,
+                                                 mock_ensure, mock_drop, mock_delete):
+    mock_watermark.return_value = NOW - timedelta(days=1, minutes=5)
+    mock_is_partitioned.return_value = True
+
+    purge(MagicMock(), NOW)
+
+    assert mock_drop.call_args[0][2] == timedelta(days=1, minutes=5)
+    assert mock_delete.call_args[0][2] == timedelta(days=1, minutes=5)
+
+
+@patch('retention.delete_in_batches')
+@patch('retention.is_partitioned', return_value=False)
+@patch('retention.archive_watermark')
+def test_purge_uses_retention_once_archive_is_ahead(mock_watermark, mock_is_partitioned,
+                                                    mock_delete):
+    mock_watermark.return_value = NOW - timedelta(minutes=5)
+
+    purge(MagicMock(), NOW)
+
+    assert mock_delete.call_args[0][2] == timedelta(days=1)
+
+
+def test_archive_watermark_without_table_is_none():
+    conn = MagicMock()
+    cur = conn.cursor().__enter__()
+    cur.fetchone.return_value = {"present": False}
+
+    assert retention.archive_watermark(conn) is None
+    assert cur.execute.call_count == 1
+
+
+def test_archive_watermark_reads_named_row():
+    conn = MagicMock()
+    cur = conn.cursor().__enter__()
+    cur.fetchone.side_effect = [{"present": True}, {"recorded": NOW}]
+
+    assert retention.archive_watermark(conn) == NOW
+    assert cur.execute.call_args[0][1] == ("recording_archive",)
@@ -0,0 +1,111 @@
+# pylint: skip-file
+from datetime import datetime, timedelta, timezone
+from unittest.mock import MagicMock
+import pandas as pd
+
+from rolling import RollingTemperatures
+from stream_transform import CleanRecord
+
+NOW = datetime(2023, 8, 29, 13, 0, tzinfo=timezone.utc)
+
+
+def test_averages_by_plant():
+    rolling = RollingTemperatures()
+    rolling.add(1, NOW - timedelta(minutes=2), 10.0)
+    rolling.add(1, NOW - timedelta(minutes=1), 20.0)
+    rolling.add(2, NOW - timedelta(minutes=1), 15.0)
+
+    result = rolling.averages(NOW)
+
+    assert list(result["plant_id"]) == [1, 2]
+    assert list(result["avg"]) == [15.0, 15.0]
+
+
+def test_averages_expire_old_readings():
+    rolling = RollingTemperatures()
+    rolling.add(1, NOW - timedelta(minutes=20), 100.0)
+    rolling.add(1, NOW - timedelta(minutes=1), 20.0)
+    rolling.add(2, NOW - timedelta(minutes=16), 15.0)
+
+    result = rolling.averages(NOW)
+
+    assert list(result["plant_id"]) == [1]
+    assert list(result["avg"]) == [20.0]
+
+
+def test_averages_empty():
+    result = RollingTemperatures().averages(NOW)
+
+    assert list(result.columns) == ["plant_id", "avg"]
+    assert result.empty
+
+
+def test_update_from_cleaned_dataframe():
+    rolling = RollingTemperatures()
+    dataframe = pd.DataFrame({
+        "plant_id": [1, 2],
+        "recording_taken": pd.to_datetime([NOW, NOW]),
+        "temperature": [12.34567, 8.0]
+    })
+
+    rolling.update(dataframe)
+
+    assert list(rolling.averages(NOW)["avg"]) == [12.346, 8.0]
+
+
+def test_update_from_clean_records():
+    rolling = RollingTemperatures()
+    records = [CleanRecord("Botanist", "", "", "Plant 1", None, None, 1, NOW, 12.34567,
+                           30.0, NOW, None),
+               CleanRecord("Botanist", "", "", "Plant 2", None, None, 2, NOW, 8.0,
+                           30.0, NOW, None)]
+
+    rolling.update_records(records)
+
+    assert rolling.mean_by_plant(NOW) == {1: 12.346, 2: 8.0}
+
+
+def test_seed_from_database():
+    conn = MagicMock()
+    conn.cursor().__enter__().fetchall.return_value = [
+        {"plant_id": 1, "recorded": NOW - timedelta(minutes=5), "temperature": 11.0},
+        {"plant_id": 1, "recorded": NOW - timedelta(minutes=4), "temperature": 13.0},
+    ]
+    rolling = RollingTemperatures()
+
+    rolling.seed(conn)
+
+    assert rolling.seeded
+    assert list(rolling.averages(NOW)["avg"]) == [12.0]
+
+
+def test_repeated_readings_are_counted_once():
+    rolling = RollingTemperatures()
+    dataframe = pd.DataFrame({
+        "plant_id": [1, 1],
+        "recording_taken": pd.to_datetime([NOW - timedelta(minutes=2), NOW - timedelta(minutes=1)]),
+        "temperature": [10.0, 20.0]
+    })
+    repeated = CleanRecord("Botanist", "", "", "Plant 1", None, None, 1,
+                           NOW - timedelta(minutes=1), 20.0, 30.0, NOW, None)
+
+    rolling.update(dataframe)
+    rolling.update(dataframe)
+    rolling.update_records([repeated])
+
+    assert len(rolling.readings[1]) == 2
+    assert rolling.mean_by_plant(NOW) == {1: 15.0}
+
+
+def test_seeded_readings_are_not_added_again():
+    conn = MagicMock()
+    conn.cursor().__enter__().fetchall.return_value = [
+        {"plant_id": 1, "recorded": NOW - timedelta(minutes=5), "temperature": 11.0},
+    ]
+    rolling = RollingTemperatures()
+    rolling.seed(conn)
+
+    rolling.add(1, NOW - timedelta(minutes=5), 11.0)
+    rolling.add(1, NOW - timedelta(minutes=4), 13.0)
+
+    assert rolling.mean_by_plant(NOW) == {1: 12.0}
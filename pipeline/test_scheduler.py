@@ -0,0 +1,75 @@
+# pylint: skip-file
+import time
+import threading
+import pytest
+
+from scheduler import TickScheduler
+
+
+def test_runs_extract_and_load_for_each_tick():
+    loaded = []
+    scheduler = TickScheduler(extract=lambda: "batch", load=loaded.append, interval=0.02)
+
+    scheduler.run(max_ticks=3)
+
+    assert loaded == ["batch", "batch", "batch"]
+    assert scheduler.overruns == 0
+
+
+def test_extract_overlaps_slow_load():
+    extract_times = []
+    loading = threading.Event()
+
+    def extract():
+        extract_times.append((time.monotonic(), loading.is_set()))
+        return len(extract_times)
+
+    def load(batch):
+        loading.set()
+        time.sleep(0.08)
+        loading.clear()
+
+    scheduler = TickScheduler(extract=extract, load=load, interval=0.05, queue_size=2)
+
+    scheduler.run(max_ticks=3)
+
+    assert any(during_load for _, during_load in extract_times)
+    assert len(extract_times) == 3
+
+
+def test_reports_overrun_and_keeps_grid():
+    calls = []
+
+    def extract():
+        calls.append(time.monotonic())
+        if len(calls) == 1:
+            time.sleep(0.12)
+        return None
+
+    scheduler = TickScheduler(extract=extract, load=lambda batch: None, interval=0.05)
+
+    scheduler.run(max_ticks=6)
+
+    assert scheduler.overruns == 1
+    assert len(calls) < 6
+
+
+def test_drops_batch_when_queue_full():
+    release = threading.Event()
+    scheduler = TickScheduler(extract=lambda: "batch", load=lambda batch: release.wait(),
+                              interval=0.02, queue_size=1)
+
+    threading.Timer(0.2, release.set).start()
+    scheduler.run(max_ticks=5)
+
+    assert scheduler.dropped > 0
+
+
+def test_load_error_stops_scheduler():
+    def load(batch):
+        raise ValueError("bad batch")
+
+    scheduler = TickScheduler(extract=lambda: "batch", load=load, interval=0.02)
+
+    with pytest.raises(ValueError):
+        scheduler.run(max_ticks=50)
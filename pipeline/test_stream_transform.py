@@ -0,0 +1,91 @@
+# pylint: skip-file
+import copy
+import pandas as pd
+import pytest
+
+from stream_transform import clean_records, CleanRecord
+from transform import clean_data
+
+
+def make_record(plant_id, temperature, soil_moisture, sunlight):
+    return {
+        "botanist": {"email": "botanist@gardens.com", "name": f"Botanist {plant_id % 2}",
+                     "phone": "123456"},
+        "cycle": "Perennial",
+        "last_watered": "Mon, 28 Aug 2023 14:56:18 GMT",
+        "name": f"Plant {plant_id}",
+        "plant_id": plant_id,
+        "recording_taken": "2023-08-29 13:45:43",
+        "scientific_name": [f"Plantus {plant_id}"],
+        "soil_moisture": soil_moisture,
+        "sunlight": sunlight,
+        "temperature": temperature
+    }
+
+
+RECORDS = [
+    make_record(1, 10.0, 30.5, ["Full sun"]),
+    make_record(2, 10.0, -1.0, ["full sun"]),
+    make_record(3, 20.0, 12.0, ["part shade", "full sun"]),
+    make_record(4, 13.0, 12.0, ["full shade"]),
+    make_record(5, 7.0, 12.0, ["full shade"]),
+    make_record(6, 11.0, 12.0, None),
+    make_record(7, 11.0, 12.0, ["full sun"]),
+]
+AVERAGES = {1: 10.0, 2: 10.0, 3: 19.0, 4: 10.0, 5: 10.0, 6: 11.5}
+
+
+def pandas_engine(records, averages):
+    average_df = pd.DataFrame({"plant_id": list(averages), "avg": list(averages.values())})
+    result = clean_data(pd.DataFrame(copy.deepcopy(records)), average_df)
+    return result[list(CleanRecord._fields)].to_dict("records")
+
+
+def stream_engine(records, averages):
+    return [record._asdict() for record in clean_records(copy.deepcopy(records), averages)]
+
+
+@pytest.fixture(params=[pandas_engine, stream_engine], ids=["pandas", "stream"])
+def engine(request):
+    return request.param
+
+
+def test_engine_filters_invalid_readings(engine):
+    result = engine(RECORDS, AVERAGES)
+
+    assert [row["plant_id"] for row in result] == [1, 3, 6]
+
+
+def test_engine_flattens_botanist(engine):
+    row = engine(RECORDS, AVERAGES)[0]
+
+    assert row["botanist_name"] == "Botanist 1"
+    assert row["email"] == "botanist@gardens.com"
+    assert row["phone"] == "123456"
+    assert row["plant_name"] == "Plant 1"
+
+
+def test_engine_converts_times(engine):
+    row = engine(RECORDS, AVERAGES)[0]
+
+    assert str(pd.Timestamp(row["recording_taken"])) == "2023-08-29 14:45:43+01:00"
+    assert str(pd.Timestamp(row["last_watered"])) == "2023-08-28 14:56:18+01:00"
+
+
+def test_engine_maps_sunlight(engine):
+    result = engine(RECORDS, AVERAGES)
+
+    assert [row["sunlight"] for row in result] == ["full_sun", "partial_sun", None]
+
+
+def test_engines_match():
+    pandas_rows = pandas_engine(RECORDS, AVERAGES)
+    stream_rows = stream_engine(RECORDS, AVERAGES)
+
+    assert len(pandas_rows) == len(stream_rows)
+    for pandas_row, stream_row in zip(pandas_rows, stream_rows):
+        for field in CleanRecord._fields:
+            if field in ("recording_taken", "last_watered"):
+                assert pd.Timestamp(stream_row[field]) == pandas_row[field]
+            else:
+                assert stream_row[field] == pandas_row[field]
@@ -0,0 +1,105 @@
+# pylint: skip-file
+from datetime import datetime, timedelta, timezone
+from unittest.mock import MagicMock, patch
+import pandas as pd
+
+from summary import prepare_recordings, latest_readings, hour_range, update_summaries, purge_hourly
+from summary import update_summaries_from_rows
+
+
+def make_recordings():
+    return pd.DataFrame({
+        "plant_id": [1, 2, 1, 9],
+        "recording_taken": ["2023-08-29 13:59:00+01:00", "2023-08-29 14:00:00+01:00",
+                            "2023-08-29 14:01:00+01:00", "2023-08-29 14:01:00+01:00"],
+        "temperature": [12.12345, 13.0, 14.0, 15.0],
+        "soil_moisture": [30.0, 31.0, 32.0, 33.0],
+        "last_watered": ["2023-08-29 09:00:00+01:00"] * 4,
+        "sunlight": ["full_sun", None, "full_sun", "full_sun"],
+    })
+
+
+def test_prepare_recordings_resolves_ids_and_drops_unknown_plants():
+    recordings = prepare_recordings(make_recordings(), {1: 10, 2: 20})
+
+    assert list(recordings["plant_id"]) == [10, 20, 10]
+    assert recordings["temperature"].iloc[0] == 12.123
+    assert recordings["sunlight"].iloc[1] == "Null"
+
+
+def test_latest_readings_keeps_newest_per_plant():
+    rows = latest_readings(prepare_recordings(make_recordings(), {1: 10, 2: 20}))
+
+    assert [(row[0], row[2]) for row in rows] == [(20, 13.0), (10, 14.0)]
+    assert isinstance(rows[0][0], int)
+
+
+def test_hour_range_covers_every_hour_touched():
+    start, end = hour_range(prepare_recordings(make_recordings(), {1: 10, 2: 20}))
+
+    assert start == datetime(2023, 8, 29, 12, tzinfo=timezone.utc)
+    assert end == datetime(2023, 8, 29, 14, tzinfo=timezone.utc)
+
+
+@patch('summary.execute_values')
+def test_update_summaries_upserts_latest_and_rebuilds_hours(mock_execute_values):
+    conn = MagicMock()
+    cur = conn.cursor().__enter__()
+
+    update_summaries(conn, make_recordings(), {1: 10, 2: 20})
+
+    assert len(mock_execute_values.call_args[0][2]) == 2
+    sql, params = cur.execute.call_args[0]
+    assert "recording_hourly" in sql
+    assert "WHERE recording_hourly.readings <= EXCLUDED.readings" in sql
+    assert params[0] == [10, 20]
+    assert conn.commit.call_count == 1
+
+
+@patch('summary.execute_values')
+def test_update_summaries_skips_batches_of_unknown_plants(mock_execute_values):
+    conn = MagicMock()
+
+    update_summaries(conn, make_recordings(), {})
+
+    assert mock_execute_values.call_count == 0
+    assert conn.commit.call_count == 0
+
+
+@patch('summary.execute_values')
+def test_update_summaries_from_rows_matches_dataframe_path(mock_execute_values):
+    london = timezone(timedelta(hours=1))
+    watered = datetime(2023, 8, 29, 9, tzinfo=london)
+    rows = [(datetime(2023, 8, 29, 13, 59, tzinfo=london), 12.123, 30.0, watered, "full_sun", 10),
+            (datetime(2023, 8, 29, 14, 0, tzinfo=london), 13.0, 31.0, watered, "Null", 20),
+            (datetime(2023, 8, 29, 14, 1, tzinfo=london), 14.0, 32.0, watered, "full_sun", 10)]
+    conn = MagicMock()
+    cur = conn.cursor().__enter__()
+
+    update_summaries_from_rows(conn, rows)
+
+    latest = mock_execute_values.call_args[0][2]
+    assert sorted((row[0], row[2]) for row in latest) == [(10, 14.0), (20, 13.0)]
+    _, params = cur.execute.call_args[0]
+    assert params[0] == [10, 20]
+    assert params[1] == datetime(2023, 8, 29, 12, tzinfo=timezone.utc)
+    assert params[2] == datetime(2023, 8, 29, 14, tzinfo=timezone.utc)
+    assert conn.commit.call_count == 1
+
+
+def test_update_summaries_from_rows_skips_empty_batches():
+    conn = MagicMock()
+
+    update_summaries_from_rows(conn, [])
+
+    assert conn.commit.call_count == 0
+
+
+def test_purge_hourly_deletes_before_retention():
+    conn = MagicMock()
+    cur = conn.cursor().__enter__()
+    now = datetime(2023, 8, 29, 13, tzinfo=timezone.utc)
+
+    purge_hourly(conn, now, timedelta(days=30))
+
+    assert cur.execute.call_args[0][1] == (now - timedelta(days=30),)
@@ -1,10 +1,11 @@
 """Cleans json data from extract using pandas, outputs as a csv file"""
 import os
+from functools import lru_cache
 import pandas as pd
 import pytz
-from psycopg2.extras import RealDictCursor
-from dotenv import load_dotenv
-from load import get_connection
+import metrics
+from database import pooled_connection
+from stream_transform import convert_sunlight
 
 PLANT_JSON = "data/live_plants.json"
 PLANT_CSV = "data/plants.csv"
@@ -14,9 +15,11 @@ DATA_FOLDER = "data"
 def cleaning_botanist(dataframe: pd.DataFrame) -> pd.DataFrame:
     """Flattens botanist column into name, email, phone"""
     dataframe = dataframe.rename(columns={"name" : "plant_name"})
-    dataframe["botanist_name"] = dataframe["botanist"].apply(lambda x: x["name"])
-    dataframe["email"] = dataframe["botanist"].apply(lambda x: x["email"])
-    dataframe["phone"] = dataframe["botanist"].apply(lambda x: x["phone"])
+    botanists = pd.DataFrame(dataframe["botanist"].tolist(), index=dataframe.index,
+                             columns=["name", "email", "phone"])
+    dataframe["botanist_name"] = botanists["name"]
+    dataframe["email"] = botanists["email"]
+    dataframe["phone"] = botanists["phone"]
     dataframe = dataframe.drop("botanist", axis=1)
 
     return dataframe
@@ -34,22 +37,10 @@ def convert_times_with_timestamp(dataframe: pd.DataFrame) -> pd.DataFrame:
     return dataframe
 
 
-def convert_sunlight(sunlight:list)->str:
-    """Function that converts the sunlight to an appropriate format"""
-
-    if isinstance(sunlight,list):
-        sunlight = [s.lower() for s in sunlight]
-
-        if any(sun in ['part shade', 'part sun', 'part sun/part shade'] for sun in sunlight):
-            return "partial_sun"
-
-        if "full sun" in sunlight:
-            return "full_sun"
-
-        if "full shade" in sunlight:
-            return "full_shade"
-
-    return None
+@lru_cache(maxsize=None)
+def convert_sunlight_values(sunlight: tuple) -> str:
+    """Memoized convert_sunlight for a tuple of sunlight values"""
+    return convert_sunlight(list(sunlight))
 
 
 def get_averages_from_db(conn)-> pd.DataFrame:
@@ -68,7 +59,9 @@ def get_averages_from_db(conn)-> pd.DataFrame:
 
 def clean_sunlight_column(dataframe: pd.DataFrame) -> pd.DataFrame:
     """Converts sunlight column to consistent format ready for loading"""
-    dataframe["sunlight"] = dataframe["sunlight"].apply(convert_sunlight)
+    dataframe["sunlight"] = [convert_sunlight_values(tuple(sunlight))
+                             if isinstance(sunlight, list) else None
+                             for sunlight in dataframe["sunlight"]]
 
     return dataframe
 
@@ -91,19 +84,21 @@ def clean_data(dataframe: pd.DataFrame, average_temps_df:pd.DataFrame)->pd.DataF
 
     dataframe = convert_times_with_timestamp(dataframe)
     dataframe = clean_sunlight_column(dataframe)
+
+    rows_in = len(dataframe)
     dataframe = clean_moisture_column(dataframe)
+    metrics.record_rows("clean_moisture_column", rows_in, len(dataframe))
+
+    rows_in = len(dataframe)
     dataframe = clean_temperature_column(dataframe, average_temps_df)
+    metrics.record_rows("clean_temperature_column", rows_in, len(dataframe))
 
     return dataframe
 
 
 if __name__ == "__main__":
-    load_dotenv()
-
-    db_conn = get_connection(host_name=os.environ["DB_HOST"], db_name= os.environ["DB_NAME"],
-                             password=os.environ["DB_PASSWORD"], user=os.environ["DB_USERNAME"])
-
-    average_temps= get_averages_from_db(db_conn)
+    with pooled_connection() as db_conn:
+        average_temps = get_averages_from_db(db_conn)
 
     plant_df = pd.read_json(PLANT_JSON)
     plant_df = clean_data(plant_df, average_temps)